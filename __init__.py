@@ -15,8 +15,20 @@
 
 #import blender python libraries
 import bpy
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import json
 import math
+import numpy
 import os
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
 
 
 #addon info read by Blender
@@ -29,6 +41,164 @@ bl_info = {
     "category": "Animation"
     }
 
+#property group for a shape key driven by the uv offset of a spritesheet, named after the shape key
+class SHASPRI_PG_KeyTarget(bpy.types.PropertyGroup):
+    targetObject: bpy.props.PointerProperty(name="Target Empty", description="Empty marking the uv offset where the shape key is fully active", type=bpy.types.Object)
+    falloff: bpy.props.FloatProperty(name="Shape Key Falloff", description="How quickly the shape key value reaches 0 when the driver object is moved away from the target", default=20)
+    batched: bpy.props.BoolProperty(name="Batched Weight", description="Shape key is weighted by the batched solver instead of its own driver", default=False)
+
+#property group for a spritesheet layer of a painting object, named after the spritesheet
+class SHASPRI_PG_Sheet(bpy.types.PropertyGroup):
+    layerIndex: bpy.props.IntProperty(name="Layer Index", description="Number of the color mix and mask multiply nodes of this layer", default=0)
+    sheetImage: bpy.props.PointerProperty(name="Spritesheet Image", type=bpy.types.Image)
+    maskImage: bpy.props.PointerProperty(name="Mask Image", type=bpy.types.Image)
+    mappingNodeName: bpy.props.StringProperty(name="Mapping Node", description="Name of the uv offset mapping node in the spritesheet node group")
+    uvSourceNodeName: bpy.props.StringProperty(name="UV Source Node", description="Name of the uv map node in the spritesheet node group")
+    offsetObject: bpy.props.PointerProperty(name="Offset Empty", description="Driver empty for the spritesheet uv offset", type=bpy.types.Object)
+    imageBaseObject: bpy.props.PointerProperty(name="Image Base Empty", description="Parent image empty of the offset empty", type=bpy.types.Object)
+    keyTargets: bpy.props.CollectionProperty(type=SHASPRI_PG_KeyTarget)
+    flattened: bpy.props.BoolProperty(name="Flattened", description="Layer has been baked into the flattened image of the painting object", default=False)
+
+#property group referencing a painting object from the scene
+class SHASPRI_PG_PaintingObject(bpy.types.PropertyGroup):
+    paintingObject: bpy.props.PointerProperty(name="Painting Object", type=bpy.types.Object)
+
+#get the painting object for a selected painting object or one of its spritesheet empties
+def shaspriPaintingObject(candidateObject):
+    if(candidateObject != None and candidateObject.SHASPRIPaintingObject != None):
+        return candidateObject.SHASPRIPaintingObject
+    return candidateObject
+
+#get the material node using the spritesheet node group of a painting object
+def shaspriMaterialNodeGroup(paintingObject):
+    if(paintingObject.SHASPRIMaterial == None or paintingObject.SHASPRIMaterial.node_tree == None):
+        return None
+    return paintingObject.SHASPRIMaterial.node_tree.nodes.get('shaspri_NodeGroup')
+
+#add a painting object to the painting objects of the scenes it is used in
+def shaspriRegisterPaintingObject(paintingObject):
+    for paintingScene in paintingObject.users_scene:
+        if(any(paintingReference.paintingObject == paintingObject for paintingReference in paintingScene.SHASPRIPaintingObjects) == False):
+            paintingScene.SHASPRIPaintingObjects.add().paintingObject = paintingObject
+
+#mark a spritesheet empty as belonging to a painting object
+def shaspriRegisterSheetEmpty(sheetEmpty, paintingObject, spriteSheetName):
+    sheetEmpty.SHASPRIPaintingObject = paintingObject
+    sheetEmpty.SHASPRISheetName = spriteSheetName
+
+#clear the registry of a painting object that shares its spritesheet node group with another painting object, like a duplicate made with shift d
+#the object the node group was made for keeps it, found by the node group name or else as the object with the shortest name
+#returns True when the registry was cleared
+def shaspriUnshareRegistry(paintingObject):
+    dataNodeGroup = paintingObject.SHASPRINodeGroup
+    if(dataNodeGroup == None or dataNodeGroup.name == "shaspri_" + paintingObject.name + "_nodegroup"):
+        return False
+    groupUsers = [candidateObject for candidateObject in bpy.data.objects if candidateObject.SHASPRINodeGroup == dataNodeGroup]
+    if(len(groupUsers) < 2):
+        return False
+    namedOwners = [candidateObject for candidateObject in groupUsers if dataNodeGroup.name == "shaspri_" + candidateObject.name + "_nodegroup"]
+    groupOwner = namedOwners[0] if len(namedOwners) > 0 else min(groupUsers, key=lambda candidateObject: (len(candidateObject.name), candidateObject.name))
+    if(groupOwner == paintingObject):
+        return False
+    paintingObject.SHASPRISheets.clear()
+    paintingObject.SHASPRINodeGroup = None
+    paintingObject.SHASPRIMaterial = None
+    paintingObject.SHASPRILayerNodeGroup = None
+    paintingObject.SHASPRIHasBatchedKeys = False
+    paintingObject.SHASPRIBaked = False
+    for paintingScene in bpy.data.scenes:
+        for referenceIndex in reversed(range(len(paintingScene.SHASPRIPaintingObjects))):
+            if(paintingScene.SHASPRIPaintingObjects[referenceIndex].paintingObject == paintingObject):
+                paintingScene.SHASPRIPaintingObjects.remove(referenceIndex)
+    shaspriBatchedSolvers.pop(paintingObject.name, None)
+    return True
+
+#handler to clear the registry of new objects copied from a painting object, before an edit on one changes the other
+@bpy.app.handlers.persistent
+def shaspriUnshareDuplicates(scene, depsgraph=None):
+    if(depsgraph == None):
+        return
+    registeredObjects = set(paintingReference.paintingObject for paintingReference in scene.SHASPRIPaintingObjects)
+    for depsgraphUpdate in depsgraph.updates:
+        if(isinstance(depsgraphUpdate.id, bpy.types.Object)):
+            candidateObject = depsgraphUpdate.id.original
+            if(candidateObject.SHASPRINodeGroup != None and candidateObject not in registeredObjects):
+                shaspriUnshareRegistry(candidateObject)
+
+#rebuild the registry of a painting object set up before sheets were registered, using the node group, drivers and images
+def shaspriRebuildRegistry(paintingObject):
+    dataNodeGroup = bpy.data.node_groups.get("shaspri_" + paintingObject.name + "_nodegroup")
+    if(paintingObject.type != 'MESH' or dataNodeGroup == None or len(paintingObject.SHASPRISheets) > 0):
+        return False
+    paintingObject.SHASPRINodeGroup = dataNodeGroup
+    for candidateMaterial in paintingObject.material_slots:
+        if(candidateMaterial.material != None and candidateMaterial.material.node_tree != None and 'shaspri_NodeGroup' in candidateMaterial.material.node_tree.nodes):
+            paintingObject.SHASPRIMaterial = candidateMaterial.material
+            break
+    #find offset empties from the mapping node drivers
+    mappingDrivers = {}
+    if(dataNodeGroup.animation_data != None):
+        for mappingDriver in dataNodeGroup.animation_data.drivers:
+            if(len(mappingDriver.driver.variables) > 0):
+                mappingDrivers[mappingDriver.data_path] = mappingDriver.driver.variables[0].targets[0].id
+    #register a sheet for every mapping node
+    for mappingNode in dataNodeGroup.nodes:
+        if(mappingNode.name.startswith('shaspri_') and mappingNode.name.endswith('_uvoffset')):
+            spriteSheetName = mappingNode.name[len('shaspri_'):-len('_uvoffset')]
+            registeredSheet = paintingObject.SHASPRISheets.add()
+            registeredSheet.name = spriteSheetName
+            registeredSheet.layerIndex = len(paintingObject.SHASPRISheets) - 1
+            registeredSheet.mappingNodeName = mappingNode.name
+            registeredSheet.uvSourceNodeName = "shaspri_" + spriteSheetName + "_uvsource"
+            spritesheetNode = dataNodeGroup.nodes.get("shaspri_" + spriteSheetName + "_sheet")
+            sheetMaskNode = dataNodeGroup.nodes.get("shaspri_" + spriteSheetName + "_mask")
+            if(spritesheetNode != None):
+                registeredSheet.sheetImage = spritesheetNode.image
+                for spritesheetLink in spritesheetNode.outputs[0].links:
+                    if(spritesheetLink.to_node.name.startswith('shaspri_colormix_')):
+                        registeredSheet.layerIndex = int(spritesheetLink.to_node.name[len('shaspri_colormix_'):])
+            if(sheetMaskNode != None):
+                registeredSheet.maskImage = sheetMaskNode.image
+            uvDriverObject = mappingDrivers.get('nodes["' + mappingNode.name + '"].inputs[1].default_value')
+            if(uvDriverObject != None):
+                registeredSheet.offsetObject = uvDriverObject
+                registeredSheet.imageBaseObject = uvDriverObject.parent
+                shaspriRegisterSheetEmpty(uvDriverObject, paintingObject, spriteSheetName)
+                if(uvDriverObject.parent != None):
+                    shaspriRegisterSheetEmpty(uvDriverObject.parent, paintingObject, spriteSheetName)
+    #find shape key targets from the shape key distance drivers
+    shapeKeys = paintingObject.data.shape_keys
+    if(shapeKeys != None and shapeKeys.animation_data != None):
+        for keyValueDriver in shapeKeys.animation_data.drivers:
+            if('EMPTYDRIVER_DISTANCE' in keyValueDriver.driver.variables):
+                emptyLocationVar = keyValueDriver.driver.variables['EMPTYDRIVER_DISTANCE']
+                for registeredSheet in paintingObject.SHASPRISheets:
+                    if(registeredSheet.offsetObject != None and registeredSheet.offsetObject == emptyLocationVar.targets[0].id):
+                        keyTarget = registeredSheet.keyTargets.add()
+                        keyTarget.name = keyValueDriver.data_path[len('key_blocks["'):-len('"].value')]
+                        keyTarget.targetObject = emptyLocationVar.targets[1].id
+                        falloffMatch = re.search(r'EMPTYDRIVER_DISTANCE\*([0-9.]+)', keyValueDriver.driver.expression)
+                        if(falloffMatch != None):
+                            keyTarget.falloff = float(falloffMatch.group(1))
+                        if(keyTarget.targetObject != None):
+                            shaspriRegisterSheetEmpty(keyTarget.targetObject, paintingObject, registeredSheet.name)
+    shaspriRegisterPaintingObject(paintingObject)
+    return True
+
+#handler to rebuild the registry of legacy painting objects and find batched shape keys in a newly loaded file
+@bpy.app.handlers.persistent
+def shaspriLoadRegistry(dummy=None):
+    shaspriBatchedSolvers.clear()
+    shaspriPreviewCache.clear()
+    shaspriProfileObjectStats.clear()
+    shaspriPreviewCacheStatus['bytes'] = 0
+    for candidatePaintingObject in bpy.data.objects:
+        if(candidatePaintingObject.type == 'MESH'):
+            shaspriUnshareRegistry(candidatePaintingObject)
+            shaspriRebuildRegistry(candidatePaintingObject)
+            #a file saved during a cell preview still holds the preview shape key
+            shaspriEndCellPreview(candidatePaintingObject)
+
 #panel class for setting up sprite sheets
 class SHASPRI_PT_LayerSetup(bpy.types.Panel):
     bl_space_type = 'VIEW_3D'
@@ -40,8 +210,19 @@ class SHASPRI_PT_LayerSetup(bpy.types.Panel):
     bpy.types.Scene.SHASPRISpritesheetName = bpy.props.StringProperty(name="Spritesheet Name", description="The name to use for a newly created spritesheet and mask", maxlen=20, default="ShaspriSheet")
     bpy.types.Scene.SHASPRIXResolution = bpy.props.IntProperty(name="Spritesheet Horizontal Resolution", description="Horizontal resolution for new spritesheet", default=2048, subtype='PIXEL')
     bpy.types.Scene.SHASPRIYResolution = bpy.props.IntProperty(name="Spritesheet Vertical Resolution", description="Vertical resolution for new spritesheet", default=2048, subtype='PIXEL')
+    bpy.types.Scene.SHASPRIMaskResolutionDivisor = bpy.props.EnumProperty(name="Mask Resolution", description="Resolution of new masks relative to the spritesheet resolution. The mask only needs the detail of the mask edges", items=[('1','Full','Same resolution as the spritesheet'),('2','Half','Half the spritesheet resolution, a quarter of the memory'),('4','Quarter','A quarter of the spritesheet resolution, a sixteenth of the memory'),('8','Eighth','An eighth of the spritesheet resolution')], default='1')
+    bpy.types.Scene.SHASPRIMaskSingleChannel = bpy.props.BoolProperty(name="Single Channel Mask Files", description="Save new masks as grayscale files with one channel, as only the mask value is used", default=False)
+    bpy.types.Scene.SHASPRIBaseColorResolutionDivisor = bpy.props.EnumProperty(name="Base Color Resolution", description="Resolution of a new base color image relative to the spritesheet resolution", items=[('1','Full','Same resolution as the spritesheet'),('2','Half','Half the spritesheet resolution, a quarter of the memory'),('4','Quarter','A quarter of the spritesheet resolution, a sixteenth of the memory')], default='1')
+    bpy.types.Scene.SHASPRIImageBitDepth = bpy.props.EnumProperty(name="Image Bit Depth", description="Bits per channel of new spritesheet, mask and base color images", items=[('8','8 Bit','Byte images, 4 bytes per pixel in memory'),('16','16 Bit','Float images saved as 16 bit png files for smooth gradients, 16 bytes per pixel in memory. Targa files are saved with 8 bits')], default='8')
     bpy.types.Scene.SHASPRISnapSpritesheet = bpy.props.BoolProperty(name="Snap Spritesheet Position", description="Round down the spritesheet position for activating mapped shapekeys without moving the spritesheet image", default=False)
     bpy.types.Scene.SHASPRILinkOutput = bpy.props.BoolProperty(name="Link Spritesheet Nodegroup to Existing Nodes", description="Attempt to link the spritesheet to the existing node setup", default=True)
+    bpy.types.Scene.SHASPRIBackgroundSave = bpy.props.BoolProperty(name="Save Images In Background", description="Encode and write saved and repacked spritesheet, mask and base color images on worker threads instead of blocking Blender. Blank files of new images are always written straight away", default=False)
+    bpy.types.Scene.SHASPRISaveFormat = bpy.props.EnumProperty(name="Image Save Format", description="File format for saved spritesheet, mask and base color images", items=[('PNG','PNG','Compressed PNG images'),('TARGA_RAW','Targa Raw','Uncompressed Targa images, fastest to write for work in progress files')], default='PNG')
+    bpy.types.Scene.SHASPRISaveCompression = bpy.props.IntProperty(name="PNG Compression", description="Compression used for PNG images saved in the background. Lower values save faster but make larger files", default=15, min=0, max=100, subtype='PERCENTAGE')
+    bpy.types.Scene.SHASPRITiledStorage = bpy.props.BoolProperty(name="Tiled Storage For Modified Images", description="Save modified spritesheet, mask and base color images as tiles next to the image file, writing only the tiles painted since the last save. The full image is rebuilt from the tiles when the file is loaded", default=False)
+    bpy.types.Scene.SHASPRITileSize = bpy.props.IntProperty(name="Tile Size", description="Width and height of the tiles of newly tiled images", default=256, min=16, max=4096, subtype='PIXEL')
+    bpy.types.Scene.SHASPRIDeduplicateOnLoad = bpy.props.BoolProperty(name="Deduplicate Images On Load", description="When a file with this scene is loaded, collapse spritesheet, mask and base color images with identical pixels into one image. Single color images are left alone", default=False)
+    bpy.types.Scene.SHASPRILazyImages = bpy.props.BoolProperty(name="Create Images When First Edited", description="Set up new spritesheet, mask and base color images as small placeholders and only create the full images and their files when they are first painted or edited", default=True)
     bpy.types.Scene.SHASPRIMakeBaseColor = bpy.props.BoolProperty(name="Create Base Color Image", description="Create a base color image texture in the spritesheets folder and include it in the node setup", default=False)
     bpy.types.Scene.SHASPRIBaseColorName = bpy.props.StringProperty(name="Base Color Image Name", description="Name for the base color image texture", maxlen=20, default="ShaspriBase")
     bpy.types.Scene.SHASPRISheetMappingScale = bpy.props.IntProperty(name="Shape Key Driver Mapping Scale", description="How the driver object position maps to the uv offset position. Higher values means more sensitivity", default=20)
@@ -51,12 +232,31 @@ class SHASPRI_PT_LayerSetup(bpy.types.Panel):
         self.layout.prop(context.scene,"SHASPRISpritesheetName")
         self.layout.prop(context.scene,"SHASPRIXResolution")
         self.layout.prop(context.scene,"SHASPRIYResolution")
+        self.layout.prop(context.scene,"SHASPRIMaskResolutionDivisor")
+        self.layout.prop(context.scene,"SHASPRIMaskSingleChannel")
+        self.layout.prop(context.scene,"SHASPRIImageBitDepth")
+        self.layout.prop(context.scene,"SHASPRILazyImages")
         self.layout.prop(context.scene,"SHASPRISheetMappingScale")
         self.layout.prop(context.scene,"SHASPRISnapSpritesheet")
         self.layout.prop(context.scene,"SHASPRIMakeBaseColor")
         self.layout.prop(context.scene,"SHASPRIBaseColorName")
+        if(context.scene.SHASPRIMakeBaseColor == True):
+            self.layout.prop(context.scene,"SHASPRIBaseColorResolutionDivisor")
         self.layout.prop(context.scene,"SHASPRILinkOutput")
+        self.layout.prop(context.scene,"SHASPRIBackgroundSave")
+        self.layout.prop(context.scene,"SHASPRISaveFormat")
+        if(context.scene.SHASPRISaveFormat == 'PNG'):
+            self.layout.prop(context.scene,"SHASPRISaveCompression")
+        self.layout.prop(context.scene,"SHASPRITiledStorage")
+        if(context.scene.SHASPRITiledStorage == True):
+            self.layout.prop(context.scene,"SHASPRITileSize")
+        footprintBox = self.layout.box()
+        for imageName, imageWidth, imageHeight, imageBytes, fileChannels in shaspriLayerImageFootprint(context.scene):
+            footprintBox.label(text=imageName + ': ' + str(imageWidth) + 'x' + str(imageHeight) + ', ' + format(imageBytes/1048576, '.1f') + ' MB in memory, ' + str(fileChannels) + ' channel files')
         self.layout.operator('shaspri.addmaskedspritelayer', text ='Add New Masked Spritesheet Layer')
+        self.layout.operator('shaspri.sharesheetwithselected', text ='Share Spritesheet Of Active With Selected')
+        self.layout.prop(context.scene,"SHASPRIDeduplicateOnLoad")
+        self.layout.operator('shaspri.deduplicateimages', text ='Deduplicate Identical Spritesheet Images')
 
 #panel class for shape key creation and image paint setup
 class SHASPRI_PT_SheetPainting(bpy.types.Panel):
@@ -66,252 +266,1353 @@ class SHASPRI_PT_SheetPainting(bpy.types.Panel):
     bl_context = 'objectmode'
     bl_category = 'Shape Spritesheet Painter'
     bpy.types.Scene.SHASPRIShapeKeyFalloff = bpy.props.IntProperty(name="Shape Key Falloff", description="How quickly a shape key value reaches 0 when the driver object is moved away from the shape key target. Higher values mean faster falloff", default=20)
+    bpy.types.Scene.SHASPRIBatchedKeyWeights = bpy.props.BoolProperty(name="Batched Shape Key Weights", description="Weight new shape keys with one solver per object instead of a driver per shape key, for faster playback with many keys", default=False)
+    bpy.types.Scene.SHASPRIKeySnapThreshold = bpy.props.FloatProperty(name="Shape Key Snap Distance", description="Vertices a spritesheet shape key moves less than this distance on every axis are snapped back to the basis when compacting keys", default=0.00001, min=0.0, precision=6, subtype='DISTANCE')
+    bpy.types.Scene.SHASPRIPreviewCacheSize = bpy.props.IntProperty(name="Cell Preview Cache (MB)", description="Megabytes of memory for the shape key mixes of previewed spritesheet cells. The least recently shown cells are dropped beyond this size", default=256, min=1, subtype='UNSIGNED')
+    bpy.types.Scene.SHASPRIFlattenKeepOriginal = bpy.props.BoolProperty(name="Keep Original Layers", description="Keep a copy of the layer node setup when flattening so the layers can be restored for later edits", default=True)
+    bpy.types.Scene.SHASPRIExportFolder = bpy.props.StringProperty(name="Export Folder", description="Directory to write exported spritesheets and shape key frames to", subtype='DIR_PATH', default='//shaspri_export')
+    bpy.types.Scene.SHASPRIProfiling = bpy.props.BoolProperty(name="Profile Spritesheet Operators", description="Record the time spent in each phase of the spritesheet operators and show driver, layer and image memory counts", default=False)
 
     def draw(self, context):
         self.layout.prop(context.scene,"SHASPRIShapeKeyFalloff")
+        self.layout.prop(context.scene,"SHASPRIBatchedKeyWeights")
         self.layout.operator('shaspri.createshapekeyforoffset', text ='Create Shape Key At UV Offset For Selected')
+        self.layout.prop(context.scene,"SHASPRIKeySnapThreshold")
+        self.layout.operator('shaspri.compactshapekeys', text ='Compact Spritesheet Shape Keys For Selected')
         self.layout.operator('shaspri.editsheetmask', text ='Edit Spritesheet Mask For Active')
         self.layout.operator('shaspri.offseteditsheet', text ='Edit Spritesheet At Current UV Offset For Active')
+        previewRow = self.layout.row()
+        previewRow.operator('shaspri.previewcell', text ='Previous Cell').step = -1
+        previewRow.operator('shaspri.previewcell', text ='Next Cell').step = 1
+        self.layout.prop(context.scene,"SHASPRIPreviewCacheSize")
         self.layout.operator('shaspri.reactivatesheet', text ='Reactivate Spritesheet Drivers For Active')
+        self.layout.operator('shaspri.bakedrivers', text ='Bake Spritesheet Drivers To Keyframes For Selected')
+        self.layout.operator('shaspri.unbakedrivers', text ='Unbake Spritesheet Drivers For Selected')
+        self.layout.operator('shaspri.savedirtyimages', text ='Save All Modified Spritesheet Images')
+        self.layout.prop(context.scene,"SHASPRIFlattenKeepOriginal")
+        self.layout.operator('shaspri.flattenlayers', text ='Flatten Spritesheet Layers For Selected')
+        self.layout.operator('shaspri.restorelayers', text ='Restore Flattened Layers For Selected')
+        self.layout.operator('shaspri.repacksheet', text ='Repack Spritesheet Cells For Selected')
+        self.layout.prop(context.scene,"SHASPRIExportFolder")
+        self.layout.operator('shaspri.exportspritesheets', text ='Export Spritesheets And Shape Key Frames For Selected')
+        if(shaspriImageSaveStatus['message'] != ''):
+            self.layout.label(text=shaspriImageSaveStatus['message'])
+        self.layout.prop(context.scene,"SHASPRIProfiling")
+        if(context.scene.SHASPRIProfiling == True):
+            profileBox = self.layout.box()
+            for phaseName, phaseTiming in shaspriProfileTimings.items():
+                profileBox.label(text=phaseName + ': ' + str(phaseTiming['calls']) + ' calls, ' + format(phaseTiming['seconds']*1000, '.1f') + ' ms, last ' + format(phaseTiming['last']*1000, '.1f') + ' ms')
+            paintingObject = shaspriPaintingObject(context.active_object)
+            objectStats = None
+            if(paintingObject != None and paintingObject.type == 'MESH' and len(paintingObject.SHASPRISheets) > 0):
+                objectStats = shaspriProfileObjectStats.get(paintingObject.name)
+            if(objectStats != None):
+                profileBox.label(text=paintingObject.name + ': ' + str(objectStats['layers']) + ' layers (' + str(objectStats['flattenedLayers']) + ' flattened), ' + str(objectStats['targets']) + ' targets (' + str(objectStats['batchedTargets']) + ' batched)')
+                profileBox.label(text=str(objectStats['drivers']) + ' live drivers, ' + format(objectStats['imageBytes']/1048576, '.1f') + ' MB of loaded images (' + str(objectStats['unloadedImages']) + ' not loaded)')
+            profileBox.operator('shaspri.dumpprofile', text ='Dump Profiling Report')
         
+#wall time of profiled operator phases by phase name, as calls, total, longest and last seconds
+shaspriProfileTimings = collections.OrderedDict()
+
+#painting object stats by object name from the last profiling report, shown by the panel without reading any images
+shaspriProfileObjectStats = {}
+
+#context manager timing a phase while profiling is enabled, doing nothing otherwise
+def shaspriProfilePhase(scene, phaseName):
+    if(scene.SHASPRIProfiling == False):
+        return contextlib.nullcontext()
+    return shaspriTimePhase(phaseName)
+
+@contextlib.contextmanager
+def shaspriTimePhase(phaseName):
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        phaseSeconds = time.perf_counter() - startTime
+        phaseTiming = shaspriProfileTimings.setdefault(phaseName, {'calls':0, 'seconds':0.0, 'longest':0.0, 'last':0.0})
+        phaseTiming['calls'] += 1
+        phaseTiming['seconds'] += phaseSeconds
+        phaseTiming['longest'] = max(phaseTiming['longest'], phaseSeconds)
+        phaseTiming['last'] = phaseSeconds
+
+#memory used by the pixels of an image, 0 for images not loaded yet since reading their size would load them
+def shaspriImageBytesInMemory(image):
+    if(image == None or image.has_data == False):
+        return 0
+    return image.size[0]*image.size[1]*image.channels*(4 if image.is_float else 1)
+
+#count the live drivers, shape key targets, layers and image memory of a painting object
+def shaspriPaintingObjectStats(paintingObject):
+    objectStats = {'layers':len(paintingObject.SHASPRISheets), 'flattenedLayers':0, 'targets':0, 'batchedTargets':0, 'drivers':0, 'imageBytes':0, 'unloadedImages':0}
+    countedImages = set()
+    for registeredSheet in paintingObject.SHASPRISheets:
+        objectStats['flattenedLayers'] += 1 if registeredSheet.flattened else 0
+        objectStats['targets'] += len(registeredSheet.keyTargets)
+        objectStats['batchedTargets'] += sum(1 for keyTarget in registeredSheet.keyTargets if keyTarget.batched)
+        countedImages.update(image for image in (registeredSheet.sheetImage, registeredSheet.maskImage) if image != None)
+    dataNodeGroup = paintingObject.SHASPRINodeGroup
+    if(dataNodeGroup != None):
+        if(dataNodeGroup.animation_data != None):
+            objectStats['drivers'] += sum(1 for nodeDriver in dataNodeGroup.animation_data.drivers if nodeDriver.mute == False)
+        countedImages.update(imageNode.image for imageNode in dataNodeGroup.nodes if imageNode.type == 'TEX_IMAGE' and imageNode.image != None)
+    if(paintingObject.type == 'MESH' and paintingObject.data.shape_keys != None and paintingObject.data.shape_keys.animation_data != None):
+        objectStats['drivers'] += sum(1 for keyDriver in paintingObject.data.shape_keys.animation_data.drivers if keyDriver.mute == False)
+    objectStats['imageBytes'] = sum(shaspriImageBytesInMemory(image) for image in countedImages)
+    objectStats['unloadedImages'] = sum(1 for image in countedImages if image.has_data == False)
+    return objectStats
+
+#phase timings and painting object stats of a scene
+def shaspriProfileReport(scene):
+    profileReport = {'phases':dict(shaspriProfileTimings), 'objects':{}}
+    for paintingReference in scene.SHASPRIPaintingObjects:
+        if(paintingReference.paintingObject != None):
+            profileReport['objects'][paintingReference.paintingObject.name] = shaspriPaintingObjectStats(paintingReference.paintingObject)
+    shaspriProfileObjectStats.clear()
+    shaspriProfileObjectStats.update(profileReport['objects'])
+    return profileReport
+
+#function to write the profiling report to a file
+class SHASPRI_OT_DumpProfile(bpy.types.Operator):
+    bl_idname = "shaspri.dumpprofile"
+    bl_label = "Dump spritesheet profiling report"
+    bl_description = "Write the recorded operator phase timings and the driver, target, layer and loaded image memory counts of every painting object to a JSON file, and show the counts in the panel"
+    
+    filepath: bpy.props.StringProperty(name="File Path", subtype='FILE_PATH', default='//shaspri_profile.json')
+    resetTimings: bpy.props.BoolProperty(name="Reset Timings", description="Clear the recorded phase timings after writing them", default=False)
+    
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def execute(self, context):
+        profileFilepath = bpy.path.abspath(self.filepath)
+        with open(profileFilepath, 'w') as profileFile:
+            json.dump(shaspriProfileReport(context.scene), profileFile, indent=2)
+        if(self.resetTimings == True):
+            shaspriProfileTimings.clear()
+        self.report({'INFO'}, 'Wrote spritesheet profiling report to ' + profileFilepath)
+        return {'FINISHED'}
+
+#encode an 8 or 16 bit image array with rows ordered bottom to top as png file bytes
+def shaspriEncodePNG(imageBytes, compressionLevel):
+    imageHeight, imageWidth, imageChannels = imageBytes.shape
+    pngColorTypes = {1:0, 3:2, 4:6}
+    #png rows are stored top to bottom, each starting with a filter type byte, with 16 bit values big endian
+    pngRows = numpy.zeros((imageHeight, imageWidth*imageChannels*imageBytes.itemsize + 1), dtype=numpy.uint8)
+    pngRows[:,1:] = numpy.ascontiguousarray(imageBytes[::-1].astype(imageBytes.dtype.newbyteorder('>'))).view(numpy.uint8).reshape(imageHeight, -1)
+    def pngChunk(chunkType, chunkData):
+        return struct.pack('>I', len(chunkData)) + chunkType + chunkData + struct.pack('>I', zlib.crc32(chunkType + chunkData) & 0xffffffff)
+    pngHeader = struct.pack('>IIBBBBB', imageWidth, imageHeight, 8*imageBytes.itemsize, pngColorTypes[imageChannels], 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + pngChunk(b'IHDR', pngHeader) + pngChunk(b'IDAT', zlib.compress(pngRows.tobytes(), compressionLevel)) + pngChunk(b'IEND', b'')
+
+#encode an 8 bit image array with rows ordered bottom to top as uncompressed targa file bytes
+def shaspriEncodeTGA(imageBytes):
+    imageHeight, imageWidth, imageChannels = imageBytes.shape
+    if(imageChannels == 1):
+        tgaHeader = struct.pack('<BBBHHBHHHHBB', 0, 0, 3, 0, 0, 0, 0, 0, imageWidth, imageHeight, 8, 0)
+        return tgaHeader + imageBytes.tobytes()
+    #targa stores colors as bgr(a) with rows bottom to top like blender
+    tgaPixels = imageBytes[:,:,[2,1,0,3][:imageChannels]]
+    tgaHeader = struct.pack('<BBBHHBHHHHBB', 0, 0, 2, 0, 0, 0, 0, 0, imageWidth, imageHeight, 8*imageChannels, 8 if imageChannels == 4 else 0)
+    return tgaHeader + numpy.ascontiguousarray(tgaPixels).tobytes()
+
+#encode image bytes as the file bytes of a file format
+def shaspriEncodeImageFile(imageBytes, fileFormat, compression):
+    if(fileFormat == 'TARGA_RAW'):
+        return shaspriEncodeTGA(imageBytes)
+    return shaspriEncodePNG(imageBytes, round(compression*9/100))
+
+#encode and write image bytes to disk, run on worker threads so must not touch blender data
+#with tiled storage only the changed tiles are written and the compression is the tile size
+def shaspriWriteImageFile(imageFilepath, imageBytes, fileFormat, compression):
+    if(fileFormat == 'TILES'):
+        return shaspriWriteImageTiles(shaspriTileFolder(imageFilepath), imageBytes, compression)
+    return shaspriWriteFileBytes(imageFilepath, shaspriEncodeImageFile(imageBytes, fileFormat, compression))
+
+#write file bytes through a temporary file so a failed write never leaves a broken image
+#every write has its own temporary file, so writes of the same file never mix their bytes
+def shaspriWriteFileBytes(imageFilepath, fileBytes):
+    temporaryFilepath = imageFilepath + '.' + uuid.uuid4().hex[:12] + '.shaspritmp'
+    try:
+        with open(temporaryFilepath, 'xb') as imageFile:
+            imageFile.write(fileBytes)
+        os.replace(temporaryFilepath, imageFilepath)
+    finally:
+        if(os.path.isfile(temporaryFilepath)):
+            os.remove(temporaryFilepath)
+    return len(fileBytes)
+
+#folder holding the tiles of an image saved with tiled storage, next to the image file
+def shaspriTileFolder(imageFilepath):
+    return os.path.splitext(imageFilepath)[0] + '_tiles'
+
+#tile indices by tile folder, holding the hash of every tile as last written
+shaspriTileIndexCache = {}
+
+#read the tile index of a tile folder, using the cached index when available
+def shaspriReadTileIndex(tileFolder):
+    tileIndex = shaspriTileIndexCache.get(tileFolder)
+    indexFilepath = os.path.join(tileFolder, 'index.json')
+    if(tileIndex == None and os.path.isfile(indexFilepath)):
+        with open(indexFilepath) as indexFile:
+            tileIndex = json.load(indexFile)
+        shaspriTileIndexCache[tileFolder] = tileIndex
+    return tileIndex
+
+#locks by tile folder, so saves of images sharing a tile folder write their tiles and index one after another
+shaspriTileFolderLocks = collections.defaultdict(threading.Lock)
+shaspriTileFolderLocksLock = threading.Lock()
+
+#write the tiles of image bytes that changed since the last tiled save, run on worker threads so must not touch blender data
+#tiles are stored once per content hash, so repeated tiles like empty sheet areas share one file
+#the cached index is only replaced once every tile and the index file are written, and unused tiles are removed after that
+def shaspriWriteImageTiles(tileFolder, imageBytes, tileSize):
+    with shaspriTileFolderLocksLock:
+        tileFolderLock = shaspriTileFolderLocks[tileFolder]
+    with tileFolderLock:
+        imageHeight, imageWidth, imageChannels = imageBytes.shape
+        previousIndex = shaspriReadTileIndex(tileFolder)
+        if(previousIndex == None or previousIndex['width'] != imageWidth or previousIndex['height'] != imageHeight or previousIndex['channels'] != imageChannels or previousIndex.get('dtype', '|u1') != imageBytes.dtype.str):
+            previousIndex = {'width':imageWidth, 'height':imageHeight, 'channels':imageChannels, 'dtype':imageBytes.dtype.str, 'tileSize':tileSize, 'tiles':{}}
+        tileIndex = dict(previousIndex, tiles=dict(previousIndex['tiles']))
+        tileSize = tileIndex['tileSize']
+        os.makedirs(tileFolder, exist_ok=True)
+        writtenBytes = 0
+        changedTiles = 0
+        for tileY in range(0, imageHeight, tileSize):
+            for tileX in range(0, imageWidth, tileSize):
+                tileBytes = numpy.ascontiguousarray(imageBytes[tileY:tileY + tileSize, tileX:tileX + tileSize]).tobytes()
+                tileName = str(tileX//tileSize) + '_' + str(tileY//tileSize)
+                tileHash = hashlib.blake2b(tileBytes, digest_size=16).hexdigest()
+                if(tileIndex['tiles'].get(tileName) == tileHash):
+                    continue
+                changedTiles += 1
+                tileFilepath = os.path.join(tileFolder, tileHash + '.tile')
+                if(os.path.isfile(tileFilepath) == False):
+                    writtenBytes += shaspriWriteFileBytes(tileFilepath, zlib.compress(tileBytes, 1))
+                tileIndex['tiles'][tileName] = tileHash
+        indexFilepath = os.path.join(tileFolder, 'index.json')
+        if(changedTiles > 0 or os.path.isfile(indexFilepath) == False):
+            shaspriWriteFileBytes(indexFilepath, json.dumps(tileIndex).encode())
+            shaspriTileIndexCache[tileFolder] = tileIndex
+            #remove tiles no longer used anywhere in the image, once the index without them is on disk
+            usedTileFiles = set(tileHash + '.tile' for tileHash in tileIndex['tiles'].values())
+            for tileFilename in os.listdir(tileFolder):
+                if(tileFilename.endswith('.tile') and tileFilename not in usedTileFiles):
+                    os.remove(os.path.join(tileFolder, tileFilename))
+        else:
+            shaspriTileIndexCache[tileFolder] = tileIndex
+    return writtenBytes
+
+#assemble the image bytes stored in a tile folder, or None when the folder has no tiles
+def shaspriReadImageTiles(tileFolder):
+    tileIndex = shaspriReadTileIndex(tileFolder)
+    if(tileIndex == None):
+        return None
+    tileSize = tileIndex['tileSize']
+    tileType = numpy.dtype(tileIndex.get('dtype', '|u1'))
+    imageBytes = numpy.zeros((tileIndex['height'], tileIndex['width'], tileIndex['channels']), dtype=tileType)
+    decodedTiles = {}
+    for tileName, tileHash in tileIndex['tiles'].items():
+        tileX, tileY = (int(tileNumber)*tileSize for tileNumber in tileName.split('_'))
+        if(tileHash not in decodedTiles):
+            with open(os.path.join(tileFolder, tileHash + '.tile'), 'rb') as tileFile:
+                decodedTiles[tileHash] = numpy.frombuffer(zlib.decompress(tileFile.read()), dtype=tileType)
+        tileArea = imageBytes[tileY:tileY + tileSize, tileX:tileX + tileSize]
+        tileArea[:] = decodedTiles[tileHash].reshape(tileArea.shape)
+    return imageBytes
+
+#images with tiles newer than their image file, rebuilt a few at a time after loading
+shaspriPendingTileRebuilds = collections.deque()
+
+#edit counts of tiled images when their tiles were last saved or read, tiled images stay modified so this marks them as saved
+shaspriTiledImageMarkers = {}
+
+#set the pixels of an image from its tiles
+def shaspriRebuildTiledImage(image):
+    imageBytes = shaspriReadImageTiles(shaspriTileFolder(bpy.path.abspath(image.filepath_raw)))
+    if(imageBytes == None or imageBytes.shape[0] != image.size[1] or imageBytes.shape[1] != image.size[0]):
+        return False
+    imagePixels = numpy.ones((imageBytes.shape[0], imageBytes.shape[1], 4), dtype=numpy.float32)
+    #single channel masks are gray in every color channel
+    imageChannels = 3 if imageBytes.shape[2] == 1 else imageBytes.shape[2]
+    imagePixels[:,:,:imageChannels] = imageBytes*numpy.float32(1.0/numpy.iinfo(imageBytes.dtype).max)
+    #float images hold linear values, their tiles hold srgb values like their image files
+    if(image.is_float == True and image.colorspace_settings.name == 'sRGB'):
+        imagePixels[:,:,:3] = shaspriSRGBToLinear(imagePixels[:,:,:3])
+    image.pixels.foreach_set(imagePixels.ravel())
+    image.update()
+    shaspriTiledImageMarkers[image.name] = shaspriImageEditCounts[image.name]
+    return True
+
+#rebuild an image from its tiles now if it is still waiting for a lazy rebuild, before its pixels are read
+def shaspriEnsureTiledImage(image):
+    if(image.name in shaspriPendingTileRebuilds):
+        shaspriPendingTileRebuilds.remove(image.name)
+        shaspriRebuildTiledImage(image)
+
+#timer rebuilding one waiting image per call
+def shaspriPollTileRebuilds():
+    if(len(shaspriPendingTileRebuilds) > 0):
+        image = bpy.data.images.get(shaspriPendingTileRebuilds.popleft())
+        if(image != None):
+            shaspriRebuildTiledImage(image)
+    if(len(shaspriPendingTileRebuilds) > 0):
+        return 0.01
+    return None
+
+#handler to find spritesheet images whose tiles were saved after their image file in a newly loaded file
+@bpy.app.handlers.persistent
+def shaspriLoadTiledImages(dummy=None):
+    shaspriPendingTileRebuilds.clear()
+    shaspriTiledImageMarkers.clear()
+    shaspriTileIndexCache.clear()
+    for candidateImage in shaspriSpritesheetImages():
+        imageFilepath = bpy.path.abspath(candidateImage.filepath_raw)
+        indexFilepath = os.path.join(shaspriTileFolder(imageFilepath), 'index.json')
+        if(os.path.isfile(indexFilepath) and (os.path.isfile(imageFilepath) == False or os.path.getmtime(indexFilepath) > os.path.getmtime(imageFilepath))):
+            shaspriPendingTileRebuilds.append(candidateImage.name)
+    if(len(shaspriPendingTileRebuilds) > 0 and bpy.app.timers.is_registered(shaspriPollTileRebuilds) == False):
+        bpy.app.timers.register(shaspriPollTileRebuilds, first_interval=0)
+
+#copy the pixels of an image into an 8 or 16 bit array with rows ordered bottom to top
+#float images hold linear values, their color channels are encoded to srgb like blender does when saving them, alpha and non-color images are kept as they are
+def shaspriImageBytes(image, bitDepth=8):
+    imageWidth, imageHeight = image.size
+    imagePixels = numpy.empty(imageWidth*imageHeight*4, dtype=numpy.float32)
+    image.pixels.foreach_get(imagePixels)
+    imageChannels = 4 if image.depth in (32,128) else 3
+    imagePixels = imagePixels.reshape(imageHeight, imageWidth, 4)[:,:,:imageChannels]
+    if(image.is_float == True and image.colorspace_settings.name == 'sRGB'):
+        imagePixels[:,:,:3] = shaspriLinearToSRGB(imagePixels[:,:,:3])
+    return (numpy.clip(imagePixels, 0.0, 1.0)*float(2**bitDepth - 1) + 0.5).astype(numpy.uint16 if bitDepth == 16 else numpy.uint8)
+
+#image bytes as written to the files of an image, single channel masks keep only their first channel
+#16 bit images are written with 16 bit values, except to targa files which only hold 8 bit values
+def shaspriImageFileBytes(image, fileFormat):
+    imageBytes = shaspriImageBytes(image, 16 if image.get('shaspri_bitdepth') == 16 and fileFormat != 'TARGA_RAW' else 8)
+    if(image.get('shaspri_channels') == 1):
+        imageBytes = imageBytes[:,:,:1]
+    return imageBytes
+
+#check if an image is saved in a compact format blender does not write itself
+def shaspriCompactImage(image):
+    return image.get('shaspri_channels') == 1 or image.get('shaspri_bitdepth') == 16
+
+#set the compact format of a new spritesheet image from the scene image options
+def shaspriSetCompactFormat(scene, image, singleChannel=False):
+    if(scene.SHASPRIImageBitDepth == '16'):
+        image['shaspri_bitdepth'] = 16
+    if(singleChannel == True):
+        image['shaspri_channels'] = 1
+
+#memory of the images of a new spritesheet layer with the scene image options, as name, width, height, bytes in memory and file channels
+#blender holds 8 bit images as 4 bytes and 16 bit images as 4 floats per pixel, whatever the number of channels in the file
+def shaspriLayerImageFootprint(scene):
+    pixelBytes = 16 if scene.SHASPRIImageBitDepth == '16' else 4
+    maskDivisor = int(scene.SHASPRIMaskResolutionDivisor)
+    layerImages = [('Sheet', scene.SHASPRIXResolution, scene.SHASPRIYResolution, 4),
+                   ('Mask', max(1, scene.SHASPRIXResolution//maskDivisor), max(1, scene.SHASPRIYResolution//maskDivisor), 1 if scene.SHASPRIMaskSingleChannel else 3)]
+    if(scene.SHASPRIMakeBaseColor == True):
+        baseColorDivisor = int(scene.SHASPRIBaseColorResolutionDivisor)
+        layerImages.append(('Base color', max(1, scene.SHASPRIXResolution//baseColorDivisor), max(1, scene.SHASPRIYResolution//baseColorDivisor), 4))
+    return [(imageName, imageWidth, imageHeight, imageWidth*imageHeight*pixelBytes, fileChannels) for imageName, imageWidth, imageHeight, fileChannels in layerImages]
+
+#encoded png bytes of blank images by size, color, channels, bit depth and compression, so each blank file is only encoded once
+#blank pngs compress to a few kilobytes, uncompressed targa files are encoded every time instead of being kept
+shaspriBlankImageFiles = {}
+
+#file bytes of an image of one color, with the color given in linear values like the generated color of blender images
+def shaspriBlankImageFile(imageWidth, imageHeight, fillColor, fileChannels, bitDepth, fileFormat, compression):
+    blankKey = (imageWidth, imageHeight, tuple(round(colorValue, 6) for colorValue in fillColor), fileChannels, bitDepth, compression)
+    if(fileFormat != 'TARGA_RAW' and blankKey in shaspriBlankImageFiles):
+        return shaspriBlankImageFiles[blankKey]
+    fillValues = numpy.append(shaspriLinearToSRGB(numpy.array(fillColor[:3])), fillColor[3])[:fileChannels]
+    imageBytes = numpy.empty((imageHeight, imageWidth, fileChannels), dtype=numpy.uint16 if bitDepth == 16 else numpy.uint8)
+    imageBytes[:] = numpy.round(numpy.clip(fillValues, 0.0, 1.0)*(2**bitDepth - 1))
+    fileBytes = shaspriEncodeImageFile(imageBytes, fileFormat, compression)
+    if(fileFormat != 'TARGA_RAW'):
+        shaspriBlankImageFiles[blankKey] = fileBytes
+    return fileBytes
+
+#write the blank file of a spritesheet image and read the image back from it, instead of generating and encoding its pixels
+def shaspriLoadBlankImage(scene, image, imageWidth, imageHeight, fillColor):
+    with shaspriProfilePhase(scene, 'Image save'):
+        shaspriSetImageFormat(image, scene.SHASPRISaveFormat)
+        fileChannels = 1 if image.get('shaspri_channels') == 1 else (4 if image.depth in (32,128) else 3)
+        bitDepth = 16 if image.get('shaspri_bitdepth') == 16 and scene.SHASPRISaveFormat != 'TARGA_RAW' else 8
+        shaspriWriteFileBytes(bpy.path.abspath(image.filepath_raw), shaspriBlankImageFile(imageWidth, imageHeight, fillColor, fileChannels, bitDepth, scene.SHASPRISaveFormat, scene.SHASPRISaveCompression))
+        image.source = 'FILE'
+        image.reload()
+
+#create a blank spritesheet, mask or base color image with a file in the spritesheets folder
+#with lazy images only a 1x1 placeholder is made, holding the size and color of the full image until it is first edited
+def shaspriNewBlankImage(scene, imageName, imageWidth, imageHeight, fillColor, folderPath, alpha=True, singleChannel=False):
+    with shaspriProfilePhase(scene, 'Image generation'):
+        image = bpy.data.images.new(imageName, 1, 1, alpha=alpha, float_buffer=(scene.SHASPRIImageBitDepth == '16'))
+        image.generated_color = fillColor
+        #16 bit files hold srgb values like 8 bit files, so float images are read back from them as srgb
+        if(image.is_float == True):
+            image.colorspace_settings.name = 'sRGB'
+        image.filepath = folderPath + "/" + image.name + ".png"
+        shaspriSetCompactFormat(scene, image, singleChannel)
+    if(scene.SHASPRILazyImages == True):
+        image['shaspri_placeholder'] = (imageWidth, imageHeight)
+        image['shaspri_placeholdercolor'] = fillColor
+        shaspriSetImageFormat(image, scene.SHASPRISaveFormat)
+    else:
+        shaspriLoadBlankImage(scene, image, imageWidth, imageHeight, fillColor)
+    return image
+
+#replace a lazy placeholder with its full size blank image, before it is painted or its pixels are read
+def shaspriRealizeImage(scene, image):
+    if(image == None or 'shaspri_placeholder' not in image):
+        return False
+    imageWidth, imageHeight = image['shaspri_placeholder']
+    fillColor = tuple(image['shaspri_placeholdercolor'])
+    del image['shaspri_placeholder']
+    del image['shaspri_placeholdercolor']
+    os.makedirs(os.path.dirname(bpy.path.abspath(image.filepath_raw)), exist_ok=True)
+    shaspriLoadBlankImage(scene, image, imageWidth, imageHeight, fillColor)
+    return True
+
+#images that can be painted in texture paint mode, the canvas and the images of the active painting object
+def shaspriActivePaintImages(scene):
+    paintImages = [scene.tool_settings.image_paint.canvas]
+    paintingObject = shaspriPaintingObject(bpy.context.active_object)
+    if(paintingObject != None and paintingObject.type == 'MESH'):
+        paintImages.extend(image for registeredSheet in paintingObject.SHASPRISheets for image in (registeredSheet.sheetImage, registeredSheet.maskImage))
+        if(paintingObject.active_material != None):
+            paintImages.extend(paintingObject.active_material.texture_paint_images)
+    return [paintImage for paintImage in paintImages if paintImage != None]
+
+#image being painted in texture paint mode, the canvas in single image mode or the image of the active paint slot in material mode
+def shaspriActivePaintImage(scene):
+    imagePaint = scene.tool_settings.image_paint
+    if(imagePaint.mode == 'IMAGE'):
+        return imagePaint.canvas
+    paintMaterial = bpy.context.active_object.active_material if bpy.context.active_object != None else None
+    if(paintMaterial != None and 0 <= paintMaterial.paint_active_slot < len(paintMaterial.texture_paint_images)):
+        return paintMaterial.texture_paint_images[paintMaterial.paint_active_slot]
+    return None
+
+#timer realizing the lazy placeholder of the image being painted, outside of the depsgraph handler
+def shaspriRealizeActivePaintImage():
+    if(bpy.context.mode == 'PAINT_TEXTURE'):
+        shaspriRealizeImage(bpy.context.scene, shaspriActivePaintImage(bpy.context.scene))
+    return None
+
+#handler to realize the lazy placeholder of the image being painted when texture painting starts without the edit operators
+#only the painted image is realized, other placeholders of the object stay lazy until they are painted themselves
+@bpy.app.handlers.persistent
+def shaspriRealizePaintedImages(scene, depsgraph=None):
+    if(bpy.context.mode != 'PAINT_TEXTURE'):
+        return
+    paintImage = shaspriActivePaintImage(scene)
+    if(paintImage != None and 'shaspri_placeholder' in paintImage and bpy.app.timers.is_registered(shaspriRealizeActivePaintImage) == False):
+        bpy.app.timers.register(shaspriRealizeActivePaintImage, first_interval=0)
+
+#number of updates of each image by name, a cheap marker of images possibly painted since a save was started
+#images updated in the depsgraph, the paint images while texture painting and images open for painting in an image editor are counted
+shaspriImageEditCounts = collections.Counter()
+
+#handler counting the updates of images that may have been painted
+@bpy.app.handlers.persistent
+def shaspriCountImageEdits(scene, depsgraph=None):
+    if(depsgraph != None):
+        for depsgraphUpdate in depsgraph.updates:
+            if(isinstance(depsgraphUpdate.id, bpy.types.Image)):
+                shaspriImageEditCounts[depsgraphUpdate.id.name] += 1
+    editedImages = set()
+    if(bpy.context.mode == 'PAINT_TEXTURE'):
+        editedImages.update(shaspriActivePaintImages(scene))
+    if(bpy.context.window_manager != None):
+        for paintingWindow in bpy.context.window_manager.windows:
+            for candidateArea in paintingWindow.screen.areas:
+                if(candidateArea.type == 'IMAGE_EDITOR' and candidateArea.spaces.active.mode == 'PAINT' and candidateArea.spaces.active.image != None):
+                    editedImages.add(candidateArea.spaces.active.image)
+    for editedImage in editedImages:
+        shaspriImageEditCounts[editedImage.name] += 1
+
+#pending background image saves, started a few at a time so only in-flight pixel copies are held in memory
+shaspriImageSaveQueue = collections.deque()
+shaspriImageSaveJobs = []
+shaspriImageSaveExecutor = None
+shaspriImageSaveStatus = {'queued':0, 'saved':0, 'failed':0, 'message':'', 'error':''}
+
+#set the file format and matching file extension of an image before saving
+def shaspriSetImageFormat(image, fileFormat):
+    imageExtension = '.tga' if fileFormat == 'TARGA_RAW' else '.png'
+    image.filepath_raw = os.path.splitext(image.filepath_raw)[0] + imageExtension
+    image.file_format = fileFormat
+
+#save an image using the scene save settings, either straight away or on the background worker threads
+def shaspriSaveImage(scene, image):
+    with shaspriProfilePhase(scene, 'Image save'):
+        shaspriSetImageFormat(image, scene.SHASPRISaveFormat)
+        if(scene.SHASPRIBackgroundSave == True):
+            shaspriQueueImageSave(image, scene.SHASPRISaveFormat, scene.SHASPRISaveCompression)
+        elif(shaspriCompactImage(image)):
+            #write single channel and 16 bit images with the addon encoders and read them back like after a regular save
+            shaspriWriteImageFile(bpy.path.abspath(image.filepath_raw), shaspriImageFileBytes(image, scene.SHASPRISaveFormat), scene.SHASPRISaveFormat, scene.SHASPRISaveCompression)
+            if(image.source == 'GENERATED'):
+                image.source = 'FILE'
+            else:
+                image.reload()
+        else:
+            image.save()
+
+#add an image to the background save queue
+def shaspriQueueImageSave(image, fileFormat, compression):
+    imageFilepath = bpy.path.abspath(image.filepath_raw)
+    #an image already waiting is only saved once, its pixels are copied when its save starts
+    if(any(queuedSave[1] == imageFilepath for queuedSave in shaspriImageSaveQueue)):
+        return False
+    if(len(shaspriImageSaveQueue) == 0 and len(shaspriImageSaveJobs) == 0):
+        shaspriImageSaveStatus.update({'queued':0, 'saved':0, 'failed':0, 'error':''})
+    shaspriImageSaveQueue.append((image.name, imageFilepath, fileFormat, compression))
+    shaspriImageSaveStatus['queued'] += 1
+    shaspriImageSaveStatus['message'] = 'Saving images: 0/' + str(shaspriImageSaveStatus['queued'])
+    if(bpy.app.timers.is_registered(shaspriPollImageSaves) == False):
+        bpy.app.timers.register(shaspriPollImageSaves, first_interval=0)
+    return True
+
+#timer to start queued saves and finish completed ones on the main thread
+def shaspriPollImageSaves():
+    global shaspriImageSaveExecutor
+    workerCount = max(1, (os.cpu_count() or 2) - 1)
+    if(shaspriImageSaveExecutor == None):
+        shaspriImageSaveExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=workerCount, thread_name_prefix='shaspri_save')
+    #finish completed saves
+    for saveJob in [runningJob for runningJob in shaspriImageSaveJobs if runningJob[2].done()]:
+        shaspriImageSaveJobs.remove(saveJob)
+        imageName, editCount, saveFuture, fileFormat, imageFilepath = saveJob
+        image = bpy.data.images.get(imageName)
+        if(saveFuture.exception() != None):
+            shaspriImageSaveStatus['failed'] += 1
+            shaspriImageSaveStatus['error'] = imageName + ': ' + str(saveFuture.exception())
+        else:
+            shaspriImageSaveStatus['saved'] += 1
+            #tiles are not an image file blender can reload, so tiled images keep their modified state and are marked as saved instead
+            if(image != None and fileFormat == 'TILES'):
+                shaspriTiledImageMarkers[imageName] = editCount
+            elif(image != None):
+                if(image.source == 'GENERATED'):
+                    #new images are read back from the written file like after a regular save
+                    image.source = 'FILE'
+                elif(image.is_dirty and shaspriImageEditCounts[imageName] == editCount):
+                    #only clear the modified state if the image was not updated while it was being written
+                    image.reload()
+    #start queued saves while worker slots are free, a file still being written waits for its running save to finish
+    while(len(shaspriImageSaveJobs) < workerCount*2):
+        runningFilepaths = set(runningJob[4] for runningJob in shaspriImageSaveJobs)
+        queuedSave = next((queuedSave for queuedSave in shaspriImageSaveQueue if queuedSave[1] not in runningFilepaths), None)
+        if(queuedSave == None):
+            break
+        shaspriImageSaveQueue.remove(queuedSave)
+        imageName, imageFilepath, fileFormat, compression = queuedSave
+        image = bpy.data.images.get(imageName)
+        if(image == None):
+            shaspriImageSaveStatus['failed'] += 1
+            shaspriImageSaveStatus['error'] = imageName + ': image was removed'
+            continue
+        imageSnapshot = shaspriImageFileBytes(image, fileFormat)
+        os.makedirs(os.path.dirname(imageFilepath), exist_ok=True)
+        saveFuture = shaspriImageSaveExecutor.submit(shaspriWriteImageFile, imageFilepath, imageSnapshot, fileFormat, compression)
+        shaspriImageSaveJobs.append((imageName, shaspriImageEditCounts[imageName], saveFuture, fileFormat, imageFilepath))
+    #report progress in the painting panel
+    finishedCount = shaspriImageSaveStatus['saved'] + shaspriImageSaveStatus['failed']
+    if(len(shaspriImageSaveQueue) > 0 or len(shaspriImageSaveJobs) > 0):
+        shaspriImageSaveStatus['message'] = 'Saving images: ' + str(finishedCount) + '/' + str(shaspriImageSaveStatus['queued'])
+    else:
+        shaspriImageSaveStatus['message'] = 'Saved ' + str(shaspriImageSaveStatus['saved']) + ' images'
+        if(shaspriImageSaveStatus['failed'] > 0):
+            shaspriImageSaveStatus['message'] += ', ' + str(shaspriImageSaveStatus['failed']) + ' failed (' + shaspriImageSaveStatus['error'] + ')'
+    if(bpy.context.window_manager != None):
+        for paintingWindow in bpy.context.window_manager.windows:
+            for candidate3darea in paintingWindow.screen.areas:
+                if(candidate3darea.type == 'VIEW_3D'):
+                    candidate3darea.tag_redraw()
+    if(len(shaspriImageSaveQueue) > 0 or len(shaspriImageSaveJobs) > 0):
+        return 0.1
+    return None
+
+#images used by spritesheet node groups and base color nodes
+def shaspriSpritesheetImages():
+    candidateImages = set()
+    for candidateImage in bpy.data.images:
+        if(candidateImage.name.startswith('shaspri_')):
+            candidateImages.add(candidateImage)
+    for candidateMaterial in bpy.data.materials:
+        if(candidateMaterial.node_tree != None and 'shaspri_basecolor' in candidateMaterial.node_tree.nodes):
+            if(candidateMaterial.node_tree.nodes['shaspri_basecolor'].image != None):
+                candidateImages.add(candidateMaterial.node_tree.nodes['shaspri_basecolor'].image)
+    return candidateImages
+
+#painting objects and spritesheets using an image as their sheet or mask, more than one when the image is shared
+def shaspriImageSheetUsers(image):
+    return [(candidateObject, registeredSheet) for candidateObject in bpy.data.objects for registeredSheet in candidateObject.SHASPRISheets if registeredSheet.sheetImage == image or registeredSheet.maskImage == image]
+
+#content hash of the pixels of an image and whether every pixel has the same value
+#the hash is cached on the image while it is unmodified and its file and tiles are unchanged, so unchanged images are not read again
+def shaspriImageContentHash(image):
+    if('shaspri_placeholder' in image):
+        #lazy placeholders are blank, so they are hashed by their size and color without creating the full image
+        placeholderKey = str(tuple(image['shaspri_placeholder'])) + str(tuple(image['shaspri_placeholdercolor'])) + str(image.get('shaspri_channels')) + str(image.get('shaspri_bitdepth'))
+        return hashlib.blake2b(placeholderKey.encode(), digest_size=16).hexdigest(), True
+    #16 bit and float images are hashed with 16 bit values, so images only equal once rounded to 8 bits hash differently
+    hashDepth = 16 if image.get('shaspri_bitdepth') == 16 or image.is_float else 8
+    hashStamp = None
+    imageFilepath = bpy.path.abspath(image.filepath_raw)
+    if(image.is_dirty == False and image.packed_file == None and os.path.isfile(imageFilepath)):
+        indexFilepath = os.path.join(shaspriTileFolder(imageFilepath), 'index.json')
+        fileTimes = [os.path.getmtime(changedFilepath) for changedFilepath in (imageFilepath, indexFilepath) if os.path.isfile(changedFilepath)]
+        hashStamp = imageFilepath + ':' + str(max(fileTimes)) + ':' + str(hashDepth)
+        if(image.get('shaspri_hashstamp') == hashStamp and 'shaspri_contenthash' in image):
+            return image['shaspri_contenthash'], bool(image.get('shaspri_contentuniform', False))
+    shaspriEnsureTiledImage(image)
+    imageBytes = shaspriImageBytes(image, hashDepth)
+    contentHash = hashlib.blake2b(str(imageBytes.shape).encode() + imageBytes.tobytes(), digest_size=16).hexdigest()
+    contentUniform = imageBytes.size == 0 or bool(numpy.all(imageBytes == imageBytes[0,0]))
+    if(hashStamp != None):
+        image['shaspri_hashstamp'] = hashStamp
+        image['shaspri_contenthash'] = contentHash
+        image['shaspri_contentuniform'] = contentUniform
+    return contentHash, contentUniform
+
+#collapse images with identical pixels, color space, alpha mode, bit depth and float buffer into the first of them by name, remapping every user to the kept image
+#images of a single color are left alone unless includeUniform is set, as new blank sheets are usually painted differently later
+#returns the number of images removed and the image memory saved
+def shaspriDeduplicateImages(candidateImages, includeUniform=False):
+    imageGroups = collections.OrderedDict()
+    for candidateImage in sorted(candidateImages, key=lambda image: image.name):
+        if(candidateImage.source not in ('FILE','GENERATED')):
+            continue
+        contentHash, contentUniform = shaspriImageContentHash(candidateImage)
+        if(contentUniform == False or includeUniform == True):
+            imageGroups.setdefault((contentHash, candidateImage.colorspace_settings.name, candidateImage.alpha_mode, candidateImage.get('shaspri_bitdepth', 8), candidateImage.is_float), []).append(candidateImage)
+    removedCount = 0
+    savedBytes = 0
+    for groupImages in imageGroups.values():
+        keptImage = groupImages[0]
+        for duplicateImage in groupImages[1:]:
+            duplicateImage.user_remap(keptImage)
+            bpy.data.images.remove(duplicateImage)
+        removedCount += len(groupImages) - 1
+        if(len(groupImages) > 1):
+            savedBytes += shaspriImageBytesInMemory(keptImage)*(len(groupImages) - 1)
+    return removedCount, savedBytes
+
+#handler to deduplicate spritesheet images of a newly loaded file when enabled in any of its scenes
+@bpy.app.handlers.persistent
+def shaspriLoadDeduplicateImages(dummy=None):
+    if(any(candidateScene.SHASPRIDeduplicateOnLoad for candidateScene in bpy.data.scenes)):
+        shaspriDeduplicateImages(shaspriSpritesheetImages())
+
+#function to save all modified spritesheet, mask and base color images in the background
+class SHASPRI_OT_SaveDirtyImages(bpy.types.Operator):
+    bl_idname = "shaspri.savedirtyimages"
+    bl_label = "Save modified spritesheet images"
+    bl_description = "Save all modified spritesheet, mask and base color images on worker threads, using the image save format and compression from layer setup"
+    
+    _timer = None
+    
+    def execute(self, context):
+        queuedCount = 0
+        for candidateImage in shaspriSpritesheetImages():
+            if(candidateImage.is_dirty and candidateImage.filepath_raw != ''):
+                if(context.scene.SHASPRITiledStorage == True):
+                    #skip tiled images not updated since their tiles were saved
+                    if(shaspriTiledImageMarkers.get(candidateImage.name) == shaspriImageEditCounts[candidateImage.name]):
+                        continue
+                    #write only the changed tiles next to the image file
+                    shaspriEnsureTiledImage(candidateImage)
+                    if(shaspriQueueImageSave(candidateImage, 'TILES', context.scene.SHASPRITileSize) == True):
+                        queuedCount += 1
+                else:
+                    shaspriSetImageFormat(candidateImage, context.scene.SHASPRISaveFormat)
+                    if(shaspriQueueImageSave(candidateImage, context.scene.SHASPRISaveFormat, context.scene.SHASPRISaveCompression) == True):
+                        queuedCount += 1
+        #images already being saved are waited for like new ones
+        if(queuedCount == 0 and len(shaspriImageSaveQueue) == 0 and len(shaspriImageSaveJobs) == 0):
+            self.report({'INFO'}, 'No modified spritesheet images to save.')
+            return {'FINISHED'}
+        #wait for the saves without blocking the interface
+        self._timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        context.window_manager.progress_begin(0, shaspriImageSaveStatus['queued'])
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if(event.type == 'TIMER'):
+            context.window_manager.progress_update(shaspriImageSaveStatus['saved'] + shaspriImageSaveStatus['failed'])
+            if(len(shaspriImageSaveQueue) == 0 and len(shaspriImageSaveJobs) == 0):
+                context.window_manager.event_timer_remove(self._timer)
+                context.window_manager.progress_end()
+                if(shaspriImageSaveStatus['failed'] > 0):
+                    self.report({'WARNING'}, shaspriImageSaveStatus['message'] + '.')
+                else:
+                    self.report({'INFO'}, shaspriImageSaveStatus['message'] + '.')
+                return {'FINISHED'}
+        return {'PASS_THROUGH'}
+
+#function to collapse identical spritesheet images into one image
+class SHASPRI_OT_DeduplicateImages(bpy.types.Operator):
+    bl_idname = "shaspri.deduplicateimages"
+    bl_label = "Deduplicate spritesheet images"
+    bl_description = "Find spritesheet, mask and base color images with identical pixels and make every object use one of them, removing the copies"
+    bl_options = {'REGISTER','UNDO'}
+    
+    includeUniform: bpy.props.BoolProperty(name="Include Single Color Images", description="Also collapse images of one color, such as spritesheets and masks that have not been painted yet", default=False)
+    
+    def execute(self, context):
+        with shaspriProfilePhase(context.scene, 'Deduplication'):
+            removedCount, savedBytes = shaspriDeduplicateImages(shaspriSpritesheetImages(), self.includeUniform)
+        self.report({'INFO'}, 'Removed ' + str(removedCount) + ' duplicate spritesheet images, saving ' + format(savedBytes/1048576, '.1f') + ' MB of image memory.')
+        return {'FINISHED'}
+
+#set up images, nodes and driver empties for a new masked spritesheet layer on a painting object without needing a ui context
+#new empties are linked to the target collection and any problems are returned as warning messages
+#with a shared sheet of another painting object, its images and offset empty are used instead of making new ones
+def shaspriAddMaskedSpriteLayer(scene, paintingObject, spriteSheetName, targetCollection, sharedSheet=None):
+    layerWarnings = []
+    #make sure that any existing spritesheet is using the correct node tree
+    shaspriReactivateSheet(paintingObject)
+    #if there is no material create one, otherwise operate on currently active material
+    objectMaterial = None
+    if(len(paintingObject.material_slots) < 1):
+        objectMaterial = bpy.data.materials.new("shaspri_mat_" + paintingObject.name)
+        paintingObject.data.materials.append(objectMaterial)
+    else:
+        objectMaterial = paintingObject.active_material
+    #make sure material is using nodes
+    objectMaterial.use_nodes = True
+    materialNodes = objectMaterial.node_tree.nodes
+    #if spritesheet folder name does not exist, create it
+    spritesheetFolderPath = bpy.path.abspath(scene.SHASPRISpritesheetsFolder)
+    #create node group if not already created
+    dataNodeGroup = None
+    nodeGroupOutputs = None
+    nodeGroupInputs = None
+    if(paintingObject.SHASPRINodeGroup == None):
+        dataNodeGroup = bpy.data.node_groups.new("shaspri_" + paintingObject.name + "_nodegroup",'ShaderNodeTree')
+        nodeGroupOutputs = dataNodeGroup.nodes.new('NodeGroupOutput')
+        nodeGroupOutputs.name = "shaspri_groupoutput"
+        nodeGroupOutputs.location = [400,0]
+        nodeGroupInputs = dataNodeGroup.nodes.new('NodeGroupInput')
+        nodeGroupInputs.name = "shaspri_groupinput"
+        nodeGroupInputs.location = [-900,0]
+        paintingObject.SHASPRINodeGroup = dataNodeGroup
+    else:
+        dataNodeGroup = paintingObject.SHASPRINodeGroup
+        nodeGroupOutputs = dataNodeGroup.nodes['shaspri_groupoutput']
+        nodeGroupInputs = dataNodeGroup.nodes['shaspri_groupinput']
+    #add node group to material if not already added
+    materialNodeGroup = None
+    if(("shaspri_NodeGroup" in materialNodes) == False):
+        materialNodeGroup = materialNodes.new('ShaderNodeGroup')
+        materialNodeGroup.node_tree = dataNodeGroup
+        materialNodeGroup.name = "shaspri_NodeGroup"
+        materialNodeGroup.location = [-400,0]
+    else:
+        materialNodeGroup = materialNodes['shaspri_NodeGroup']   
+    paintingObject.SHASPRIMaterial = objectMaterial
+    #determine number for next color mix node
+    colorMixNumber = len(paintingObject.SHASPRISheets)
+    #populate node group
+    spritesheetNode = None
+    sheetMaskNode = None
+    colorMixNode = None
+    maskMultiplyNode = None
+    newSpriteSheet = False
+    if(spriteSheetName in paintingObject.SHASPRISheets):
+        layerWarnings.append('Spritesheet \'' + spriteSheetName + '\' already exists for \'' + paintingObject.name + '\', please choose a different spritesheet name to make a new spritesheet.')
+    else:
+        if(os.path.isdir(spritesheetFolderPath) == False):
+            os.mkdir(spritesheetFolderPath)
+        with shaspriProfilePhase(scene, 'Node creation'):
+            spritesheetNode = dataNodeGroup.nodes.new(type='ShaderNodeTexImage')
+            spritesheetNode.name = "shaspri_" + spriteSheetName + "_sheet"
+            spritesheetNode.location = [-300,100 - (300*colorMixNumber)]
+            sheetMaskNode = dataNodeGroup.nodes.new(type='ShaderNodeTexImage')
+            sheetMaskNode.name = "shaspri_" + spriteSheetName + "_mask"
+            sheetMaskNode.location = [-300,-(300*colorMixNumber)]
+            colorMixNode = dataNodeGroup.nodes.new(type='ShaderNodeMixRGB')
+            colorMixNode.name = "shaspri_colormix_" + str(colorMixNumber)
+            colorMixNode.location = [200,-(300*colorMixNumber)]
+            maskMultiplyNode = dataNodeGroup.nodes.new(type='ShaderNodeMixRGB')
+            maskMultiplyNode.name = "shaspri_maskmultiply_" + str(colorMixNumber)
+            maskMultiplyNode.blend_type = 'MULTIPLY'
+            maskMultiplyNode.inputs[0].default_value = 1
+            maskMultiplyNode.location = [0,-(300*colorMixNumber)]
+        #create sheet and mask image textures and save them in the correct directory
+        if(sharedSheet == None):
+            sheetImage = shaspriNewBlankImage(scene, "shaspri_" + paintingObject.name + "_" + spriteSheetName + "_sheet", scene.SHASPRIXResolution, scene.SHASPRIYResolution, (0,0,0,0), spritesheetFolderPath)
+            #the mask is sampled at the mesh uv, so a smaller mask covers the same area at lower detail
+            maskDivisor = int(scene.SHASPRIMaskResolutionDivisor)
+            maskImage = shaspriNewBlankImage(scene, "shaspri_" + paintingObject.name + "_" + spriteSheetName + "_mask", max(1, scene.SHASPRIXResolution//maskDivisor), max(1, scene.SHASPRIYResolution//maskDivisor), (0,0,0,1), spritesheetFolderPath, alpha=False, singleChannel=scene.SHASPRIMaskSingleChannel)
+        else:
+            sheetImage = sharedSheet.sheetImage
+            maskImage = sharedSheet.maskImage
+        #assign images to image nodes, smoothing the edges of smaller masks as they are stretched over the sheet
+        spritesheetNode.image = sheetImage
+        sheetMaskNode.image = maskImage
+        maskSize = maskImage.get('shaspri_placeholder', maskImage.size)
+        sheetSize = sheetImage.get('shaspri_placeholder', sheetImage.size)
+        if(maskSize[0] < sheetSize[0] or maskSize[1] < sheetSize[1]):
+            sheetMaskNode.interpolation = 'Cubic'
+        #get color from group input or from previous color mix depending on number of color mix nodes
+        colorSourceNode = None
+        if(colorMixNumber == 0):
+            colorSourceNode = dataNodeGroup.nodes['shaspri_groupinput']
+        else:
+            colorSourceNode = dataNodeGroup.nodes['shaspri_colormix_' + str(colorMixNumber-1)]
+        with shaspriProfilePhase(scene, 'Node creation'):
+            #make sure object has uv data
+            uvLayerFinal = None
+            if(len(paintingObject.data.uv_layers) == 0):
+                uvLayerFinal = paintingObject.data.uv_layers.new(name="UVMap")
+            else:
+                uvLayerFinal = paintingObject.data.uv_layers[0]
+            #create vector nodes for uv offsets
+            uvInputNode = dataNodeGroup.nodes.new(type='ShaderNodeUVMap')
+            uvInputNode.name = "shaspri_" + spriteSheetName + "_uvsource"
+            uvInputNode.uv_map = uvLayerFinal.name
+            uvInputNode.location = [-700,-(300*colorMixNumber)]
+            vectorMappingNode = dataNodeGroup.nodes.new(type='ShaderNodeMapping')
+            vectorMappingNode.name = "shaspri_" + spriteSheetName + "_uvoffset"
+            vectorMappingNode.location = [-500,-(300*colorMixNumber)]
+            #make links in nodegroup
+            dataNodeGroup.links.new(nodeGroupOutputs.inputs[0],colorMixNode.outputs[0])
+            dataNodeGroup.links.new(colorMixNode.inputs[0],maskMultiplyNode.outputs[0])
+            dataNodeGroup.links.new(colorMixNode.inputs[2],spritesheetNode.outputs[0])
+            dataNodeGroup.links.new(colorMixNode.inputs[1],colorSourceNode.outputs[0])
+            dataNodeGroup.links.new(maskMultiplyNode.inputs[1],spritesheetNode.outputs[1])
+            dataNodeGroup.links.new(maskMultiplyNode.inputs[2],sheetMaskNode.outputs[0])
+            dataNodeGroup.links.new(spritesheetNode.inputs[0],vectorMappingNode.outputs[0])
+            dataNodeGroup.links.new(vectorMappingNode.inputs[0],uvInputNode.outputs[0])
+        #if link output is enabled, attempt to connect output of node group to existing shader nodes
+        if(scene.SHASPRILinkOutput == True):
+            colorInputNode = None
+            for candidateNode in materialNodes:
+                #prefer common shaders over other node types, prioritised one after the other
+                if(candidateNode != materialNodeGroup):
+                    if(colorInputNode != None):
+                        if not(colorInputNode.type == 'BSDF_PRINCIPLED'):
+                            if not(colorInputNode.type == 'BSDF_DIFFUSE'):
+                                if not(colorInputNode.type == 'BSDF_GLOSSY' and (candidateNode.inputs[0].type == 'RGBA' or candidateNode.inputs[0].type == 'SHADER')):
+                                    colorInputNode = candidateNode
+                    elif(candidateNode.inputs[0].type == 'RGBA' or candidateNode.inputs[0].type == 'SHADER'):
+                        colorInputNode = candidateNode
+            if(colorInputNode != None):
+                objectMaterial.node_tree.links.new(colorInputNode.inputs[0],materialNodeGroup.outputs[0])
+        #register the new sheet
+        registeredSheet = paintingObject.SHASPRISheets.add()
+        registeredSheet.name = spriteSheetName
+        registeredSheet.layerIndex = colorMixNumber
+        registeredSheet.sheetImage = sheetImage
+        registeredSheet.maskImage = maskImage
+        registeredSheet.mappingNodeName = vectorMappingNode.name
+        registeredSheet.uvSourceNodeName = uvInputNode.name
+        shaspriRegisterPaintingObject(paintingObject)
+        #create empty driver
+        with shaspriProfilePhase(scene, 'Driver creation'):
+            if(sharedSheet != None):
+                #drive the uv offset with the empty of the shared spritesheet
+                uvDriverObject = sharedSheet.offsetObject
+                registeredSheet.offsetObject = uvDriverObject
+                registeredSheet.imageBaseObject = sharedSheet.imageBaseObject
+            else:
+                #make parent image for driver empty at the 3d cursor
+                driverBaseObject = bpy.data.objects.new("shaspri_" + paintingObject.name + "_" + spriteSheetName + "_imagebase", None)
+                targetCollection.objects.link(driverBaseObject)
+                driverBaseObject.empty_display_type = 'IMAGE'
+                driverBaseObject.location = scene.cursor.location
+                driverBaseObject.rotation_euler = (math.radians(90),0,0)
+                driverBaseObject.empty_display_size = 50
+                driverBaseObject.data = sheetImage
+                driverBaseObject.scale = (0.05,0.05,0.05)
+                #make driver empty object
+                uvDriverObject = bpy.data.objects.new("shaspri_" + paintingObject.name + "_" + spriteSheetName + "_offset", None)
+                targetCollection.objects.link(uvDriverObject)
+                uvDriverObject.empty_display_type = 'ARROWS'
+                uvDriverObject.show_name = True
+                uvDriverObject.parent = driverBaseObject
+                uvDriverObject.empty_display_size = 1
+                uvDriverObject.lock_location[2] = True
+                registeredSheet.offsetObject = uvDriverObject
+                registeredSheet.imageBaseObject = driverBaseObject
+                shaspriRegisterSheetEmpty(uvDriverObject, paintingObject, spriteSheetName)
+                shaspriRegisterSheetEmpty(driverBaseObject, paintingObject, spriteSheetName)
+            #create drivers in vector mapping node
+            driverAxisNames = ['X','Y','Z']
+            axisDrivers = vectorMappingNode.inputs[1].driver_add('default_value')
+            for axisNumber in range(0,3):
+                emptyLocationVar = axisDrivers[axisNumber].driver.variables.new()
+                emptyLocationVar.type = 'TRANSFORMS'
+                emptyLocationVar.name = 'EMPTYDRIVER' + driverAxisNames[axisNumber] + 'POS'
+                emptyLocationVar.targets[0].transform_space = 'LOCAL_SPACE'
+                emptyLocationVar.targets[0].transform_type = 'LOC_' + driverAxisNames[axisNumber]
+                emptyLocationVar.targets[0].id = uvDriverObject
+                axisDrivers[axisNumber].driver.expression = emptyLocationVar.name + '/' + str(scene.SHASPRISheetMappingScale)
+                if(scene.SHASPRISnapSpritesheet == True):
+                    axisDrivers[axisNumber].driver.expression = 'floor(abs(' + emptyLocationVar.name + '))/' + str(scene.SHASPRISheetMappingScale)
+                #keep the mapping scale and snapping of the shared spritesheet, which may have been repacked
+                if(sharedSheet != None):
+                    sharedDriver = shaspriSheetMappingDriver(sharedSheet.id_data, sharedSheet, axisNumber)
+                    if(sharedDriver != None):
+                        axisDrivers[axisNumber].driver.expression = sharedDriver.driver.expression
+            if(sharedSheet != None and sharedSheet.id_data.SHASPRINodeGroup != None and sharedSheet.mappingNodeName in sharedSheet.id_data.SHASPRINodeGroup.nodes):
+                vectorMappingNode.inputs[3].default_value = sharedSheet.id_data.SHASPRINodeGroup.nodes[sharedSheet.mappingNodeName].inputs[3].default_value
+            #switch image paint to single image
+            scene.tool_settings.image_paint.mode = 'IMAGE'
+    #generate a base color image texture if requested
+    if(scene.SHASPRIMakeBaseColor == True and ("shaspri_basecolor" in materialNodes) == False):
+        baseColorDivisor = int(scene.SHASPRIBaseColorResolutionDivisor)
+        baseColorBitmap = shaspriNewBlankImage(scene, paintingObject.name + "_" + scene.SHASPRIBaseColorName, max(1, scene.SHASPRIXResolution//baseColorDivisor), max(1, scene.SHASPRIYResolution//baseColorDivisor), (0.5,0.5,0.5,1), spritesheetFolderPath)
+        baseColorNode = materialNodes.new('ShaderNodeTexImage')
+        baseColorNode.name = "shaspri_basecolor"
+        baseColorNode.image = baseColorBitmap
+        baseColorNode.location = [-700,0]
+        objectMaterial.node_tree.links.new(materialNodeGroup.inputs[0],baseColorNode.outputs[0])
+    return layerWarnings
+
 #function to add a layer frame of vector displacement and color to selected
 class SHASPRI_OT_AddMaskedSpriteLayer(bpy.types.Operator):
     bl_idname = "shaspri.addmaskedspritelayer"
     bl_label = "Add mask and sprite sheet"
     bl_description = "Set up images and nodes for a layer of masked sprite sheet driven by an empty"
+    bl_options = {'REGISTER','UNDO'}
     
     def execute(self, context):
         originalSelectedObjects = bpy.context.selected_objects
         for candidatePaintingObject in originalSelectedObjects:
             if(candidatePaintingObject.type == 'MESH'):
-                #make sure that any existing spritesheet is using the correct node tree
-                bpy.ops.object.select_all(action='DESELECT')
-                candidatePaintingObject.select_set(True)
-                context.view_layer.objects.active = candidatePaintingObject
-                bpy.ops.shaspri.reactivatesheet()
-                #if there is no material create one, otherwise operate on currently active material
-                paintingObject = candidatePaintingObject
-                objectMaterial = None
-                if(len(paintingObject.material_slots) < 1):
-                    objectMaterial = bpy.data.materials.new("shaspri_mat_" + paintingObject.name)
-                    paintingObject.data.materials.append(objectMaterial)
-                else:
-                    objectMaterial = paintingObject.active_material
-                #make sure material is using nodes
-                objectMaterial.use_nodes = True
-                materialNodes = objectMaterial.node_tree.nodes
-                #if spritesheet folder name does not exist, create it
-                spritesheetFolderPath = bpy.path.abspath(context.scene.SHASPRISpritesheetsFolder)
-                #create node group if not already created
-                dataNodeGroup = None
-                nodeGroupOutputs = None
-                nodeGroupInputs = None
-                if(("shaspri_" + paintingObject.name + "_nodegroup" in bpy.data.node_groups) == False):
-                    dataNodeGroup = bpy.data.node_groups.new("shaspri_" + paintingObject.name + "_nodegroup",'ShaderNodeTree')
-                    nodeGroupOutputs = dataNodeGroup.nodes.new('NodeGroupOutput')
-                    nodeGroupOutputs.name = "shaspri_groupoutput"
-                    nodeGroupOutputs.location = [400,0]
-                    nodeGroupInputs = dataNodeGroup.nodes.new('NodeGroupInput')
-                    nodeGroupInputs.name = "shaspri_groupinput"
-                    nodeGroupInputs.location = [-900,0]
-                else:
-                    dataNodeGroup = bpy.data.node_groups["shaspri_" + paintingObject.name + "_nodegroup"]
-                    nodeGroupOutputs = dataNodeGroup.nodes['shaspri_groupoutput']
-                    nodeGroupInputs = dataNodeGroup.nodes['shaspri_groupinput']
-                #add node group to material if not already added
-                materialNodeGroup = None
-                if(("shaspri_NodeGroup" in materialNodes) == False):
-                    materialNodeGroup = materialNodes.new('ShaderNodeGroup')
-                    materialNodeGroup.node_tree = dataNodeGroup
-                    materialNodeGroup.name = "shaspri_NodeGroup"
-                    materialNodeGroup.location = [-400,0]
-                else:
-                    materialNodeGroup = materialNodes['shaspri_NodeGroup']   
-                #determine number for next color mix node
-                colorMixNumber = 0
-                for potentialMixNode in dataNodeGroup.nodes:
-                    if("shaspri_colormix_" in potentialMixNode.name):
-                        colorMixNumber += 1 
-                #populate node group
-                spritesheetNode = None
-                sheetMaskNode = None
-                colorMixNode = None
-                maskMultiplyNode = None
-                newSpriteSheet = False
-                spriteSheetName = context.scene.SHASPRISpritesheetName
-                if(("shaspri_" + spriteSheetName + "_sheet") in dataNodeGroup.nodes):
-                    self.report({'WARNING'}, 'Spritesheet \'' + spriteSheetName + '\' already exists for \'' + paintingObject.name + '\', please choose a different spritesheet name to make a new spritesheet.')
-                else:
-                    if(os.path.isdir(spritesheetFolderPath) == False):
-                        os.mkdir(spritesheetFolderPath)
-                    spritesheetNode = dataNodeGroup.nodes.new(type='ShaderNodeTexImage')
-                    spritesheetNode.name = "shaspri_" + spriteSheetName + "_sheet"
-                    spritesheetNode.location = [-300,100 - (300*colorMixNumber)]
-                    sheetMaskNode = dataNodeGroup.nodes.new(type='ShaderNodeTexImage')
-                    sheetMaskNode.name = "shaspri_" + spriteSheetName + "_mask"
-                    sheetMaskNode.location = [-300,-(300*colorMixNumber)]
-                    colorMixNode = dataNodeGroup.nodes.new(type='ShaderNodeMixRGB')
-                    colorMixNode.name = "shaspri_colormix_" + str(colorMixNumber)
-                    colorMixNode.location = [200,-(300*colorMixNumber)]
-                    maskMultiplyNode = dataNodeGroup.nodes.new(type='ShaderNodeMixRGB')
-                    maskMultiplyNode.name = "shaspri_maskmultiply_" + str(colorMixNumber)
-                    maskMultiplyNode.blend_type = 'MULTIPLY'
-                    maskMultiplyNode.inputs[0].default_value = 1
-                    maskMultiplyNode.location = [0,-(300*colorMixNumber)]
-                    #create sheet and mask image textures and save them in the correct directory
-                    sheetImage = bpy.data.images.new("shaspri_" + paintingObject.name + "_" + spriteSheetName + "_sheet",context.scene.SHASPRIXResolution,context.scene.SHASPRIYResolution,alpha=True)
-                    sheetImage.generated_color = (0,0,0,0)
-                    sheetImage.filepath = spritesheetFolderPath + "/" + sheetImage.name + ".png"
-                    sheetImage.save()
-                    maskImage = bpy.data.images.new("shaspri_" + paintingObject.name + "_" + spriteSheetName + "_mask",context.scene.SHASPRIXResolution,context.scene.SHASPRIYResolution,alpha=False)
-                    maskImage.generated_color = (0,0,0,1)
-                    maskImage.filepath = spritesheetFolderPath + "/" + maskImage.name + ".png"
-                    maskImage.save()
-                    #assign images to image nodes
-                    spritesheetNode.image = sheetImage
-                    sheetMaskNode.image = maskImage
-                    #get color from group input or from previous color mix depending on number of color mix nodes
-                    colorSourceNode = None
-                    if(colorMixNumber == 0):
-                        colorSourceNode = dataNodeGroup.nodes['shaspri_groupinput']
-                    else:
-                        colorSourceNode = dataNodeGroup.nodes['shaspri_colormix_' + str(colorMixNumber-1)]
-                    #make sure object has uv data
-                    uvLayerFinal = None
-                    if(len(paintingObject.data.uv_layers) == 0):
-                        paintingObject.data.uv_layers.new(name="UVMap")
-                    else:
-                        uvLayerFinal = paintingObject.data.uv_layers[0]
-                    #create vector nodes for uv offsets
-                    uvInputNode = dataNodeGroup.nodes.new(type='ShaderNodeUVMap')
-                    uvInputNode.name = "shaspri_" + spriteSheetName + "_uvsource"
-                    uvInputNode.uv_map = uvLayerFinal.name
-                    uvInputNode.location = [-700,-(300*colorMixNumber)]
-                    vectorMappingNode = dataNodeGroup.nodes.new(type='ShaderNodeMapping')
-                    vectorMappingNode.name = "shaspri_" + spriteSheetName + "_uvoffset"
-                    vectorMappingNode.location = [-500,-(300*colorMixNumber)]
-                    #make links in nodegroup
-                    dataNodeGroup.links.new(nodeGroupOutputs.inputs[0],colorMixNode.outputs[0])
-                    dataNodeGroup.links.new(colorMixNode.inputs[0],maskMultiplyNode.outputs[0])
-                    dataNodeGroup.links.new(colorMixNode.inputs[2],spritesheetNode.outputs[0])
-                    dataNodeGroup.links.new(colorMixNode.inputs[1],colorSourceNode.outputs[0])
-                    dataNodeGroup.links.new(maskMultiplyNode.inputs[1],spritesheetNode.outputs[1])
-                    dataNodeGroup.links.new(maskMultiplyNode.inputs[2],sheetMaskNode.outputs[0])
-                    dataNodeGroup.links.new(spritesheetNode.inputs[0],vectorMappingNode.outputs[0])
-                    dataNodeGroup.links.new(vectorMappingNode.inputs[0],uvInputNode.outputs[0])
-                    #if link output is enabled, attempt to connect output of node group to existing shader nodes
-                    if(context.scene.SHASPRILinkOutput == True):
-                        colorInputNode = None
-                        for candidateNode in materialNodes:
-                            #prefer common shaders over other node types, prioritised one after the other
-                            if(candidateNode != materialNodeGroup):
-                                if(colorInputNode != None):
-                                    if not(colorInputNode.type == 'BSDF_PRINCIPLED'):
-                                        if not(colorInputNode.type == 'BSDF_DIFFUSE'):
-                                            if not(colorInputNode.type == 'BSDF_GLOSSY' and (candidateNode.inputs[0].type == 'RGBA' or candidateNode.inputs[0].type == 'SHADER')):
-                                                colorInputNode = candidateNode
-                                elif(candidateNode.inputs[0].type == 'RGBA' or candidateNode.inputs[0].type == 'SHADER'):
-                                    colorInputNode = candidateNode
-                        if(colorInputNode != None):
-                            objectMaterial.node_tree.links.new(colorInputNode.inputs[0],materialNodeGroup.outputs[0])
-                    #create empty driver
-                    sceneObjects = bpy.context.scene.objects
-                    uvOffsetObjectName = "shaspri_" + spriteSheetName + "_offset"
-                    if((uvOffsetObjectName in sceneObjects) == False):
-                        #make parent image for driver empty
-                        bpy.ops.object.empty_add(type='IMAGE',rotation=(math.radians(90),0,0))
-                        driverBaseObject = bpy.context.selected_objects[0]
-                        driverBaseObject.name = "shaspri_" + paintingObject.name + "_" + spriteSheetName + "_imagebase"
-                        driverBaseObject.empty_display_size = 50
-                        driverBaseObject.data = sheetImage
-                        driverBaseObject.scale = (0.05,0.05,0.05)
-                        #make driver empty object
-                        bpy.ops.object.empty_add(type='ARROWS',location=(0,0,0))
-                        uvDriverObject = bpy.context.selected_objects[0]
-                        uvDriverObject.name = "shaspri_" + paintingObject.name + "_" + spriteSheetName + "_offset"
-                        uvDriverObject.show_name = True
-                        uvDriverObject.parent = driverBaseObject
-                        uvDriverObject.empty_display_size = 1
-                        uvDriverObject.lock_location[2] = True
-                        #create drivers in vector mapping node
-                        driverAxisNames = ['X','Y','Z']
-                        axisDrivers = vectorMappingNode.inputs[1].driver_add('default_value')
-                        for axisNumber in range(0,3):
-                            emptyLocationVar = axisDrivers[axisNumber].driver.variables.new()
-                            emptyLocationVar.type = 'TRANSFORMS'
-                            emptyLocationVar.name = 'EMPTYDRIVER' + driverAxisNames[axisNumber] + 'POS'
-                            emptyLocationVar.targets[0].transform_space = 'LOCAL_SPACE'
-                            emptyLocationVar.targets[0].transform_type = 'LOC_' + driverAxisNames[axisNumber]
-                            emptyLocationVar.targets[0].id = uvDriverObject
-                            axisDrivers[axisNumber].driver.expression = emptyLocationVar.name + '/' + str(context.scene.SHASPRISheetMappingScale)
-                            if(context.scene.SHASPRISnapSpritesheet == True):
-                                axisDrivers[axisNumber].driver.expression = 'floor(abs(' + emptyLocationVar.name + '))/' + str(context.scene.SHASPRISheetMappingScale)
-                        #switch image paint to single image
-                        bpy.context.scene.tool_settings.image_paint.mode = 'IMAGE'
-                #generate a base color image texture if requested
-                if(context.scene.SHASPRIMakeBaseColor == True and ("shaspri_basecolor" in materialNodes) == False):
-                    baseColorBitmap = bpy.data.images.new(paintingObject.name + "_" + context.scene.SHASPRIBaseColorName,context.scene.SHASPRIXResolution,context.scene.SHASPRIYResolution,alpha=True)
-                    baseColorBitmap.generated_color = (0.5,0.5,0.5,1)
-                    baseColorBitmap.filepath = spritesheetFolderPath + "/" + baseColorBitmap.name + ".png"
-                    baseColorBitmap.save()
-                    baseColorNode = materialNodes.new('ShaderNodeTexImage')
-                    baseColorNode.name = "shaspri_basecolor"
-                    baseColorNode.image = baseColorBitmap
-                    baseColorNode.location = [-700,0]
-                    objectMaterial.node_tree.links.new(materialNodeGroup.inputs[0],baseColorNode.outputs[0])
+                for layerWarning in shaspriAddMaskedSpriteLayer(context.scene, candidatePaintingObject, context.scene.SHASPRISpritesheetName, context.collection):
+                    self.report({'WARNING'}, layerWarning)
+        #report the memory of the new images for comparing the image options
+        layerFootprint = shaspriLayerImageFootprint(context.scene)
+        self.report({'INFO'}, 'Image memory per object: ' + ', '.join(imageName + ' ' + str(imageWidth) + 'x' + str(imageHeight) + ' ' + format(imageBytes/1048576, '.1f') + ' MB' for imageName, imageWidth, imageHeight, imageBytes, fileChannels in layerFootprint) + ', ' + format(sum(footprintEntry[3] for footprintEntry in layerFootprint)/1048576, '.1f') + ' MB in total.')
+        return {'FINISHED'}
+    
+#function to add a spritesheet of the active object to the other selected objects without copying its images and empties
+class SHASPRI_OT_ShareSheetWithSelected(bpy.types.Operator):
+    bl_idname = "shaspri.sharesheetwithselected"
+    bl_label = "Share spritesheet with selected"
+    bl_description = "Add the spritesheet with the current spritesheet name of the active object to the other selected objects, using the same sheet and mask images and the same offset empty instead of copies"
+    bl_options = {'REGISTER','UNDO'}
+    
+    def execute(self, context):
+        sourceObject = shaspriPaintingObject(context.active_object)
+        spriteSheetName = context.scene.SHASPRISpritesheetName
+        sharedSheet = None
+        if(sourceObject != None and sourceObject.type == 'MESH'):
+            sharedSheet = sourceObject.SHASPRISheets.get(spriteSheetName)
+        if(sharedSheet == None or sharedSheet.offsetObject == None or sharedSheet.sheetImage == None):
+            self.report({'WARNING'}, 'The active object has no spritesheet \'' + spriteSheetName + '\' to share. Please use \'Add New Masked Spritesheet Layer\' to set up this spritesheet.')
+            return {'FINISHED'}
+        if(sharedSheet.flattened == True):
+            self.report({'WARNING'}, 'Spritesheet \'' + spriteSheetName + '\' has been flattened. Please use \'Restore Flattened Layers\' before sharing it.')
+            return {'FINISHED'}
+        sharedCount = 0
+        for candidatePaintingObject in set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects):
+            if(candidatePaintingObject == sourceObject or candidatePaintingObject.type != 'MESH'):
+                continue
+            #objects using the material of the active object already show its spritesheet
+            if(sourceObject.SHASPRIMaterial != None and any(materialSlot.material == sourceObject.SHASPRIMaterial for materialSlot in candidatePaintingObject.material_slots)):
+                self.report({'WARNING'}, '\'' + candidatePaintingObject.name + '\' uses the material of \'' + sourceObject.name + '\' and already shows its spritesheets.')
+                continue
+            layerWarnings = shaspriAddMaskedSpriteLayer(context.scene, candidatePaintingObject, spriteSheetName, context.collection, sharedSheet)
+            for layerWarning in layerWarnings:
+                self.report({'WARNING'}, layerWarning)
+            if(len(layerWarnings) == 0):
+                sharedCount += 1
+        self.report({'INFO'}, 'Shared spritesheet \'' + spriteSheetName + '\' of \'' + sourceObject.name + '\' with ' + str(sharedCount) + ' objects.')
         return {'FINISHED'}
     
+#create a shape key at the current uv offset of a spritesheet, with a target empty and a distance driver or batched weight
+#returns the new shape key, or None when the spritesheet has no driver empty
+def shaspriCreateShapeKeyForOffset(scene, paintingObject, spriteSheetName):
+    registeredSheet = paintingObject.SHASPRISheets.get(spriteSheetName)
+    if(registeredSheet == None or registeredSheet.offsetObject == None):
+        return None
+    #get empty driver
+    uvDriverObject = registeredSheet.offsetObject
+    #make sure object has basis shape key and add new key for current offset
+    if(paintingObject.data.shape_keys == None):
+        paintingObject.shape_key_add(name="Basis",from_mix=False)
+    shaspriClearPreviewCache(paintingObject)
+    offsetShapeKey = paintingObject.shape_key_add(name="shaspri_" + spriteSheetName + "_key",from_mix=False)
+    paintingObject.active_shape_key_index += 1
+    with shaspriProfilePhase(scene, 'Driver creation'):
+        #copy driver empty as a static location target in the same collections
+        uvDriverTarget = uvDriverObject.copy()
+        uvDriverTarget.name = offsetShapeKey.name + "_target"
+        uvDriverTarget.animation_data_clear()
+        for driverCollection in uvDriverObject.users_collection:
+            driverCollection.objects.link(uvDriverTarget)
+        keyTarget = registeredSheet.keyTargets.add()
+        keyTarget.name = offsetShapeKey.name
+        keyTarget.targetObject = uvDriverTarget
+        keyTarget.falloff = scene.SHASPRIShapeKeyFalloff
+        if(scene.SHASPRIBatchedKeyWeights == True):
+            #hand the shape key to the batched solver of the painting object
+            keyTarget.batched = True
+            paintingObject.SHASPRIHasBatchedKeys = True
+            shaspriBatchedSolvers.pop(paintingObject.name, None)
+        else:
+            #add distance driver to shape key value
+            keyValueDriver = offsetShapeKey.driver_add('value')
+            emptyLocationVar = keyValueDriver.driver.variables.new()
+            emptyLocationVar.type = 'LOC_DIFF'
+            emptyLocationVar.name = 'EMPTYDRIVER_DISTANCE'
+            emptyLocationVar.targets[0].id = uvDriverObject
+            emptyLocationVar.targets[1].id = uvDriverTarget
+            keyValueDriver.driver.expression = 'clamp(1 - (' + emptyLocationVar.name + '*' + str(scene.SHASPRIShapeKeyFalloff) + '),0,1)'
+    uvDriverTarget.hide_select = True
+    return offsetShapeKey
+
 #function to create a driven shape key for the current uv offset
 class SHASPRI_OT_CreateShapeKeyForOffset(bpy.types.Operator):
     bl_idname = "shaspri.createshapekeyforoffset"
     bl_label = "Create shape key for current uv offset"
     bl_description = "Create and edit a driven shape key for the current uv offset"
+    bl_options = {'REGISTER','UNDO'}
     
     def execute(self, context):
-        sceneObjects = bpy.context.scene.objects
         originalSelectedObjects = bpy.context.selected_objects
         for candidatePaintingObject in originalSelectedObjects:
             #if selected object is uv offset empty, switch to the related object
-            if('shaspri_' in candidatePaintingObject.name):
-                if(candidatePaintingObject.name.split('_')[1] in sceneObjects):
-                    candidatePaintingObject = sceneObjects[candidatePaintingObject.name.split('_')[1]]
+            candidatePaintingObject = shaspriPaintingObject(candidatePaintingObject)
             if(candidatePaintingObject.type == 'MESH'):
-                paintingObject = candidatePaintingObject
                 #check if empty driver exists
                 spriteSheetName = context.scene.SHASPRISpritesheetName
-                driverObjectName = "shaspri_" + paintingObject.name + "_" + spriteSheetName + "_offset"
-                if((driverObjectName in sceneObjects) == False):
+                if(shaspriCreateShapeKeyForOffset(context.scene, candidatePaintingObject, spriteSheetName) == None):
                     self.report({'WARNING'}, 'No driver empty found for sheet \'' + spriteSheetName + '\'. Please use \'Add New Masked Spritesheet Layer\' to set up this sheet.')
-                else:
-                    #get empty driver
-                    uvDriverObject = sceneObjects[driverObjectName]
-                    #make sure object has basis shape key and add new key for current offset
-                    if(paintingObject.data.shape_keys == None):
-                        paintingObject.shape_key_add(name="Basis",from_mix=False)
-                    offsetShapeKey = paintingObject.shape_key_add(name="shaspri_" + spriteSheetName + "_key",from_mix=False)
-                    paintingObject.active_shape_key_index += 1
-                    #duplicate driver empty as location target
-                    bpy.ops.object.select_all(action='DESELECT')
-                    uvDriverObject.select_set(True)
-                    context.view_layer.objects.active = uvDriverObject
-                    bpy.ops.object.duplicate()
-                    uvDriverTarget = bpy.context.active_object
-                    uvDriverTarget.name = offsetShapeKey.name + "_target"
-                    #return to painting mode
-                    bpy.ops.object.select_all(action='DESELECT')
-                    paintingObject.select_set(True)
-                    context.view_layer.objects.active = paintingObject
-                    #add distance driver to shape key value
-                    keyValueDriver = offsetShapeKey.driver_add('value')
-                    emptyLocationVar = keyValueDriver.driver.variables.new()
-                    emptyLocationVar.type = 'LOC_DIFF'
-                    emptyLocationVar.name = 'EMPTYDRIVER_DISTANCE'
-                    emptyLocationVar.targets[0].id = uvDriverObject
-                    emptyLocationVar.targets[1].id = uvDriverTarget
-                    keyValueDriver.driver.expression = 'clamp(1 - (' + emptyLocationVar.name + '*' + str(context.scene.SHASPRIShapeKeyFalloff) + '),0,1)'
-                    uvDriverTarget.hide_select = True
         return {'FINISHED'}
     
+#shape key weights for distances between the offset empty and the key targets, matching the driver expression clamp(1 - (distance*falloff),0,1)
+def shaspriKeyWeights(targetDistances, keyFalloffs):
+    return numpy.clip(1.0 - (targetDistances*keyFalloffs), 0.0, 1.0)
+
+#batched solvers for painting objects by name, rebuilt on demand when missing or when the spritesheets of the object changed
+#solvers keep object names and look the objects up on every update, blender data is reallocated by undo and redo
+shaspriBatchedSolvers = {}
+
+#cheap stamp of the spritesheets and shape key targets a solver was built from
+def shaspriSolverStamp(paintingObject):
+    return tuple((registeredSheet.name, registeredSheet.offsetObject.name if registeredSheet.offsetObject != None else None, len(registeredSheet.keyTargets)) for registeredSheet in paintingObject.SHASPRISheets)
+
+#object of a solver by name, raising a reference error like removed blender data when it is gone
+def shaspriSolverObject(objectName):
+    solverObject = bpy.data.objects.get(objectName)
+    if(solverObject == None):
+        raise ReferenceError('Object \'' + objectName + '\' of a batched shape key solver was removed')
+    return solverObject
+
+#solver computing all batched shape key weights of one painting object in one vectorized step
+#with allKeys the driven shape keys are included too, for reading weights outside of blender
+class ShaspriBatchedKeySolver:
+    
+    def __init__(self, paintingObject, allKeys=False):
+        self.keyNames = []
+        self.offsetObjectNames = []
+        self.parentObjectNames = [None]
+        self.stamp = shaspriSolverStamp(paintingObject)
+        offsetIndices = []
+        parentIndices = []
+        targetPositions = []
+        keyFalloffs = []
+        for registeredSheet in paintingObject.SHASPRISheets:
+            if(registeredSheet.offsetObject == None):
+                continue
+            for keyTarget in registeredSheet.keyTargets:
+                if((keyTarget.batched == False and allKeys == False) or keyTarget.targetObject == None):
+                    continue
+                if(registeredSheet.offsetObject.name not in self.offsetObjectNames):
+                    self.offsetObjectNames.append(registeredSheet.offsetObject.name)
+                #cache target positions relative to their parent so moving the image base keeps them lined up
+                targetParentName = keyTarget.targetObject.parent.name if keyTarget.targetObject.parent != None else None
+                if(targetParentName not in self.parentObjectNames):
+                    self.parentObjectNames.append(targetParentName)
+                self.keyNames.append(keyTarget.name)
+                offsetIndices.append(self.offsetObjectNames.index(registeredSheet.offsetObject.name))
+                parentIndices.append(self.parentObjectNames.index(targetParentName))
+                targetPositions.append(keyTarget.targetObject.matrix_local.translation[:])
+                keyFalloffs.append(keyTarget.falloff)
+        self.offsetIndices = numpy.array(offsetIndices, dtype=numpy.int64)
+        self.parentIndices = numpy.array(parentIndices, dtype=numpy.int64)
+        self.targetPositions = numpy.array(targetPositions, dtype=numpy.float64).reshape(-1,3)
+        self.keyFalloffs = numpy.array(keyFalloffs, dtype=numpy.float64)
+        self.lastWeights = numpy.full(len(self.keyNames), numpy.nan)
+    
+    #compute weights for the current empty positions in the given depsgraph, or with offset empties by name placed at given world positions
+    def computeWeights(self, depsgraph=None, offsetOverrides=None):
+        parentMatrices = numpy.empty((len(self.parentObjectNames),4,4))
+        parentMatrices[0] = numpy.identity(4)
+        for parentIndex in range(1,len(self.parentObjectNames)):
+            parentObject = shaspriSolverObject(self.parentObjectNames[parentIndex])
+            if(depsgraph != None):
+                parentObject = parentObject.evaluated_get(depsgraph)
+            parentMatrices[parentIndex] = numpy.array(parentObject.matrix_world)
+        offsetPositions = numpy.empty((len(self.offsetObjectNames),3))
+        for offsetIndex, offsetObjectName in enumerate(self.offsetObjectNames):
+            if(offsetOverrides != None and offsetObjectName in offsetOverrides):
+                offsetPositions[offsetIndex] = offsetOverrides[offsetObjectName][:]
+                continue
+            offsetObject = shaspriSolverObject(offsetObjectName)
+            if(depsgraph != None):
+                offsetObject = offsetObject.evaluated_get(depsgraph)
+            offsetPositions[offsetIndex] = offsetObject.matrix_world.translation[:]
+        keyMatrices = parentMatrices[self.parentIndices]
+        targetWorldPositions = numpy.einsum('nij,nj->ni', keyMatrices[:,:3,:3], self.targetPositions) + keyMatrices[:,:3,3]
+        targetDistances = numpy.linalg.norm(offsetPositions[self.offsetIndices] - targetWorldPositions, axis=1)
+        return shaspriKeyWeights(targetDistances, self.keyFalloffs)
+    
+    #write only the shape key values that changed since the last update
+    def update(self, paintingObject, depsgraph=None):
+        if(len(self.keyNames) == 0 or paintingObject.data.shape_keys == None):
+            return
+        keyWeights = self.computeWeights(depsgraph)
+        changedKeys = numpy.flatnonzero(~(numpy.abs(keyWeights - self.lastWeights) < 1e-6))
+        keyBlocks = paintingObject.data.shape_keys.key_blocks
+        for keyIndex in changedKeys:
+            keyBlock = keyBlocks.get(self.keyNames[keyIndex])
+            if(keyBlock != None):
+                keyBlock.value = keyWeights[keyIndex]
+        self.lastWeights = keyWeights
+
+#handler to forget the batched solvers after undo and redo, which rebuild the blender data they were made from
+@bpy.app.handlers.persistent
+def shaspriClearBatchedSolvers(scene=None, dummy=None):
+    shaspriBatchedSolvers.clear()
+
+#handler to update batched shape key weights after frame changes and edits
+@bpy.app.handlers.persistent
+def shaspriUpdateBatchedKeys(scene, depsgraph=None):
+    for paintingReference in scene.SHASPRIPaintingObjects:
+        paintingObject = paintingReference.paintingObject
+        #baked objects get their weights from keyframes
+        if(paintingObject == None or paintingObject.SHASPRIHasBatchedKeys == False or paintingObject.SHASPRIBaked == True):
+            continue
+        keySolver = shaspriBatchedSolvers.get(paintingObject.name)
+        try:
+            if(keySolver == None or keySolver.stamp != shaspriSolverStamp(paintingObject)):
+                keySolver = ShaspriBatchedKeySolver(paintingObject)
+                shaspriBatchedSolvers[paintingObject.name] = keySolver
+            keySolver.update(paintingObject, depsgraph)
+        except ReferenceError:
+            #cached objects were removed or reloaded, rebuild on next update
+            shaspriBatchedSolvers.pop(paintingObject.name, None)
+    
+#moved vertices of the spritesheet shape keys of a painting object as vertex indices and offsets from their relative key
+#with snapKeys, vertices moved less than the threshold are set back to the exact relative key position
+def shaspriSparseKeyDeltas(paintingObject, snapThreshold, snapKeys=False):
+    keyDeltas = collections.OrderedDict()
+    shapeKeys = paintingObject.data.shape_keys
+    if(shapeKeys == None):
+        return keyDeltas
+    keyCoordinates = numpy.empty(len(paintingObject.data.vertices)*3, dtype=numpy.float32)
+    relativeCoordinates = {}
+    for registeredSheet in paintingObject.SHASPRISheets:
+        for keyTarget in registeredSheet.keyTargets:
+            keyBlock = shapeKeys.key_blocks.get(keyTarget.name)
+            if(keyBlock == None or keyBlock.relative_key == keyBlock):
+                continue
+            #read each relative key once, usually the basis shared by every key
+            if(keyBlock.relative_key.name not in relativeCoordinates):
+                keyBlock.relative_key.data.foreach_get('co', keyCoordinates)
+                relativeCoordinates[keyBlock.relative_key.name] = keyCoordinates.reshape(-1,3).copy()
+            relativePositions = relativeCoordinates[keyBlock.relative_key.name]
+            keyBlock.data.foreach_get('co', keyCoordinates)
+            keyOffsets = keyCoordinates.reshape(-1,3) - relativePositions
+            vertexMoved = numpy.abs(keyOffsets).max(axis=1) > snapThreshold
+            snappedCount = int(numpy.count_nonzero(numpy.any(keyOffsets[~vertexMoved] != 0.0, axis=1)))
+            if(snapKeys == True and snappedCount > 0):
+                keyPositions = numpy.where(vertexMoved[:,None], keyCoordinates.reshape(-1,3), relativePositions)
+                keyBlock.data.foreach_set('co', keyPositions.ravel())
+            movedIndices = numpy.flatnonzero(vertexMoved).astype(numpy.uint32)
+            keyDeltas[keyBlock.name] = {'indices':movedIndices, 'offsets':keyOffsets[movedIndices], 'snapped':snappedCount}
+    if(snapKeys == True):
+        paintingObject.data.update()
+    return keyDeltas
+
+#write sparse shape key deltas to a numpy npz file, with the indices and offsets of each key numbered in the order of keyNames
+def shaspriWriteKeyDeltas(keyDeltas, vertexCount, deltaFilepath):
+    deltaArrays = {'keyNames':numpy.array(list(keyDeltas.keys()), dtype=str), 'vertexCount':numpy.array(vertexCount)}
+    for keyIndex, keyDelta in enumerate(keyDeltas.values()):
+        deltaArrays['indices_' + str(keyIndex)] = keyDelta['indices']
+        deltaArrays['offsets_' + str(keyIndex)] = keyDelta['offsets']
+    with open(deltaFilepath, 'wb') as deltaFile:
+        numpy.savez_compressed(deltaFile, **deltaArrays)
+    return os.path.getsize(deltaFilepath)
+
+#function to snap unmoved vertices of spritesheet shape keys and report the vertices each key moves
+class SHASPRI_OT_CompactShapeKeys(bpy.types.Operator):
+    bl_idname = "shaspri.compactshapekeys"
+    bl_label = "Compact spritesheet shape keys"
+    bl_description = "Snap vertices that spritesheet shape keys barely move back to the basis, report how many vertices each key moves and optionally export the sparse key deltas"
+    bl_options = {'REGISTER','UNDO'}
+    
+    exportDeltas: bpy.props.BoolProperty(name="Export Sparse Deltas", description="Write the moved vertices of every key to an npz file in the export folder", default=False)
+    
+    def execute(self, context):
+        for paintingObject in set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects):
+            if(paintingObject.type != 'MESH'):
+                continue
+            shaspriClearPreviewCache(paintingObject)
+            keyDeltas = shaspriSparseKeyDeltas(paintingObject, context.scene.SHASPRIKeySnapThreshold, snapKeys=True)
+            if(len(keyDeltas) == 0):
+                continue
+            vertexCount = len(paintingObject.data.vertices)
+            for keyName, keyDelta in keyDeltas.items():
+                self.report({'INFO'}, keyName + ' moves ' + str(len(keyDelta['indices'])) + ' of ' + str(vertexCount) + ' vertices, snapped ' + str(keyDelta['snapped']))
+            #dense keys store every vertex position, sparse deltas store an index and offset per moved vertex
+            denseBytes = len(keyDeltas)*vertexCount*12
+            sparseBytes = sum(len(keyDelta['indices'])*16 for keyDelta in keyDeltas.values())
+            compactReport = 'Compacted ' + str(len(keyDeltas)) + ' shape keys on \'' + paintingObject.name + '\', snapped ' + str(sum(keyDelta['snapped'] for keyDelta in keyDeltas.values())) + ' vertices. Key data ' + format(denseBytes/1048576, '.2f') + ' MB dense, ' + format(sparseBytes/1048576, '.2f') + ' MB sparse'
+            if(self.exportDeltas == True):
+                exportFolderPath = bpy.path.abspath(context.scene.SHASPRIExportFolder)
+                os.makedirs(exportFolderPath, exist_ok=True)
+                deltaFilepath = os.path.join(exportFolderPath, bpy.path.clean_name("shaspri_" + paintingObject.name) + "_deltas.npz")
+                compactReport += ', ' + format(shaspriWriteKeyDeltas(keyDeltas, vertexCount, deltaFilepath)/1048576, '.2f') + ' MB written to ' + deltaFilepath
+            self.report({'INFO'}, compactReport + '.')
+        return {'FINISHED'}
+    
+#driver fcurves of a painting object that are evaluated from its spritesheet empties, as (animated data block, driver) pairs
+def shaspriSheetDrivers(paintingObject):
+    sheetDrivers = []
+    dataNodeGroup = paintingObject.SHASPRINodeGroup
+    if(dataNodeGroup != None and dataNodeGroup.animation_data != None):
+        mappingPaths = set('nodes["' + registeredSheet.mappingNodeName + '"].inputs[1].default_value' for registeredSheet in paintingObject.SHASPRISheets)
+        sheetDrivers.extend((dataNodeGroup, mappingDriver) for mappingDriver in dataNodeGroup.animation_data.drivers if mappingDriver.data_path in mappingPaths)
+    shapeKeys = paintingObject.data.shape_keys
+    if(shapeKeys != None and shapeKeys.animation_data != None):
+        sheetDrivers.extend((shapeKeys, keyValueDriver) for keyValueDriver in shapeKeys.animation_data.drivers if 'EMPTYDRIVER_DISTANCE' in keyValueDriver.driver.variables)
+    return sheetDrivers
+
+#get or create the fcurve of an animated data block for baking, clearing keyframes of an earlier bake
+def shaspriBakeFCurve(animatedBlock, actionName, dataPath, pathIndex):
+    animatedBlock.animation_data_create()
+    if(animatedBlock.animation_data.action == None):
+        animatedBlock.animation_data.action = bpy.data.actions.new(actionName)
+    bakeAction = animatedBlock.animation_data.action
+    bakeFCurve = bakeAction.fcurves.find(dataPath, index=pathIndex)
+    if(bakeFCurve != None):
+        bakeAction.fcurves.remove(bakeFCurve)
+    return bakeAction.fcurves.new(dataPath, index=pathIndex, action_group='shaspri_bake')
+
+#write baked values to an fcurve with linear keyframes, leaving out keyframes inside runs of unchanged values
+def shaspriWriteBakedKeyframes(bakeFCurve, frameNumbers, frameValues):
+    keepFrames = numpy.ones(len(frameValues), dtype=bool)
+    if(len(frameValues) > 2):
+        keepFrames[1:-1] = ~((numpy.abs(frameValues[1:-1] - frameValues[:-2]) < 1e-6) & (numpy.abs(frameValues[1:-1] - frameValues[2:]) < 1e-6))
+    if(len(frameValues) > 1 and numpy.all(numpy.abs(frameValues - frameValues[0]) < 1e-6)):
+        keepFrames[1:] = False
+    keyCoordinates = numpy.column_stack((frameNumbers[keepFrames], frameValues[keepFrames])).astype(numpy.float32)
+    bakeFCurve.keyframe_points.add(len(keyCoordinates))
+    bakeFCurve.keyframe_points.foreach_set('co', keyCoordinates.ravel())
+    bakeFCurve.keyframe_points.foreach_set('interpolation', [bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items['LINEAR'].value]*len(keyCoordinates))
+    bakeFCurve.update()
+    return len(keyCoordinates)
+
+#evaluate the spritesheet offsets and shape key weights of painting objects over a frame range and write them as keyframes
+#the frame range is stepped once for all objects, reading every offset and weight of a frame together
+def shaspriBakeDrivers(scene, paintingObjects, frameStart, frameEnd):
+    bakeObjects = []
+    for paintingObject in paintingObjects:
+        if(paintingObject.type != 'MESH' or paintingObject.SHASPRIBaked == True or len(paintingObject.SHASPRISheets) == 0):
+            continue
+        shaspriReactivateSheet(paintingObject)
+        mappingChannels = []
+        for registeredSheet in paintingObject.SHASPRISheets:
+            for axisNumber in range(3):
+                if(paintingObject.SHASPRINodeGroup.animation_data != None and paintingObject.SHASPRINodeGroup.animation_data.drivers.find('nodes["' + registeredSheet.mappingNodeName + '"].inputs[1].default_value', index=axisNumber) != None):
+                    mappingChannels.append((registeredSheet.mappingNodeName, axisNumber))
+        keySolver = ShaspriBatchedKeySolver(paintingObject, allKeys=True)
+        bakeObjects.append((paintingObject, mappingChannels, keySolver))
+    if(len(bakeObjects) == 0):
+        return 0
+    frameNumbers = numpy.arange(frameStart, frameEnd + 1)
+    bakedValues = [(numpy.empty((len(frameNumbers), len(mappingChannels))), numpy.empty((len(frameNumbers), len(keySolver.keyNames)))) for paintingObject, mappingChannels, keySolver in bakeObjects]
+    originalFrame = scene.frame_current
+    for frameIndex, frameNumber in enumerate(frameNumbers):
+        scene.frame_set(int(frameNumber))
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for (paintingObject, mappingChannels, keySolver), (mappingValues, keyValues) in zip(bakeObjects, bakedValues):
+            evaluatedNodes = paintingObject.SHASPRINodeGroup.evaluated_get(depsgraph).nodes
+            mappingValues[frameIndex] = [evaluatedNodes[nodeName].inputs[1].default_value[axisNumber] for nodeName, axisNumber in mappingChannels]
+            if(len(keySolver.keyNames) > 0):
+                keyValues[frameIndex] = keySolver.computeWeights(depsgraph)
+    scene.frame_set(originalFrame)
+    #write keyframes, then mute the drivers so the keyframes are used
+    keyframeCount = 0
+    for (paintingObject, mappingChannels, keySolver), (mappingValues, keyValues) in zip(bakeObjects, bakedValues):
+        for channelIndex, (nodeName, axisNumber) in enumerate(mappingChannels):
+            bakeFCurve = shaspriBakeFCurve(paintingObject.SHASPRINodeGroup, "shaspri_" + paintingObject.name + "_offsetbake", 'nodes["' + nodeName + '"].inputs[1].default_value', axisNumber)
+            keyframeCount += shaspriWriteBakedKeyframes(bakeFCurve, frameNumbers, mappingValues[:,channelIndex])
+        shapeKeys = paintingObject.data.shape_keys
+        for keyIndex, keyName in enumerate(keySolver.keyNames):
+            bakeFCurve = shaspriBakeFCurve(shapeKeys, "shaspri_" + paintingObject.name + "_keybake", 'key_blocks["' + keyName + '"].value', 0)
+            keyframeCount += shaspriWriteBakedKeyframes(bakeFCurve, frameNumbers, keyValues[:,keyIndex])
+        for animatedBlock, sheetDriver in shaspriSheetDrivers(paintingObject):
+            sheetDriver.mute = True
+        paintingObject.SHASPRIBaked = True
+        shaspriBatchedSolvers.pop(paintingObject.name, None)
+    return keyframeCount
+
+#remove baked keyframes of a painting object and unmute its drivers
+def shaspriUnbakeDrivers(paintingObject):
+    if(paintingObject.SHASPRIBaked == False):
+        return False
+    bakedPaths = set('nodes["' + registeredSheet.mappingNodeName + '"].inputs[1].default_value' for registeredSheet in paintingObject.SHASPRISheets)
+    bakedPaths.update('key_blocks["' + keyTarget.name + '"].value' for registeredSheet in paintingObject.SHASPRISheets for keyTarget in registeredSheet.keyTargets)
+    for animatedBlock in (paintingObject.SHASPRINodeGroup, paintingObject.data.shape_keys):
+        if(animatedBlock == None or animatedBlock.animation_data == None or animatedBlock.animation_data.action == None):
+            continue
+        bakeAction = animatedBlock.animation_data.action
+        for bakeFCurve in [candidateFCurve for candidateFCurve in bakeAction.fcurves if candidateFCurve.data_path in bakedPaths]:
+            bakeAction.fcurves.remove(bakeFCurve)
+        #remove actions that only held baked keyframes
+        if(len(bakeAction.fcurves) == 0 and bakeAction.name.startswith("shaspri_")):
+            animatedBlock.animation_data.action = None
+            bpy.data.actions.remove(bakeAction)
+    for animatedBlock, sheetDriver in shaspriSheetDrivers(paintingObject):
+        sheetDriver.mute = False
+    paintingObject.SHASPRIBaked = False
+    shaspriBatchedSolvers.pop(paintingObject.name, None)
+    return True
+
+#function to bake spritesheet drivers to keyframes over the scene frame range
+class SHASPRI_OT_BakeDrivers(bpy.types.Operator):
+    bl_idname = "shaspri.bakedrivers"
+    bl_label = "Bake spritesheet drivers to keyframes"
+    bl_description = "Evaluate the uv offset and shape key drivers of the selected objects over the scene frame range, write them as keyframes and mute the drivers for faster playback and rendering"
+    bl_options = {'REGISTER','UNDO'}
+    
+    def execute(self, context):
+        paintingObjects = set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects)
+        keyframeCount = shaspriBakeDrivers(context.scene, paintingObjects, context.scene.frame_start, context.scene.frame_end)
+        if(keyframeCount == 0):
+            self.report({'WARNING'}, 'No unbaked spritesheet drivers found on the selected objects.')
+        else:
+            self.report({'INFO'}, 'Baked spritesheet drivers to ' + str(keyframeCount) + ' keyframes.')
+        return {'FINISHED'}
+
+#function to return baked objects to their spritesheet drivers
+class SHASPRI_OT_UnbakeDrivers(bpy.types.Operator):
+    bl_idname = "shaspri.unbakedrivers"
+    bl_label = "Unbake spritesheet drivers"
+    bl_description = "Remove the baked spritesheet keyframes of the selected objects and unmute their uv offset and shape key drivers"
+    bl_options = {'REGISTER','UNDO'}
+    
+    def execute(self, context):
+        for paintingObject in set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects):
+            if(paintingObject.type == 'MESH'):
+                shaspriUnbakeDrivers(paintingObject)
+        return {'FINISHED'}
+
 #function to prepare nodes and texture paint for mask editing
 class SHASPRI_OT_EditSheetMask(bpy.types.Operator):
     bl_idname = "shaspri.editsheetmask"
@@ -319,38 +1620,114 @@ class SHASPRI_OT_EditSheetMask(bpy.types.Operator):
     bl_description = "Adjust nodes and texture paint settings to edit the mask related to the active object and specified spritesheet name"
     
     def execute(self, context):
-        sceneObjects = bpy.context.scene.objects
-        candidatePaintingObject = bpy.context.active_object
         #if selected object is uv offset empty, switch to the related object
-        if('shaspri_' in candidatePaintingObject.name):
-            if(candidatePaintingObject.name.split('_')[1] in sceneObjects):
-                candidatePaintingObject = sceneObjects[candidatePaintingObject.name.split('_')[1]]
+        candidatePaintingObject = shaspriPaintingObject(bpy.context.active_object)
         #determine if object has the required nodegroup and nodes
         materialLocated = False
         spriteSheetName = context.scene.SHASPRISpritesheetName
-        if(candidatePaintingObject.type == 'MESH'):
-            for candidateMaterial in candidatePaintingObject.material_slots:
-                if('shaspri_NodeGroup' in candidateMaterial.material.node_tree.nodes and materialLocated == False):
-                    nodeGroupTree = candidateMaterial.material.node_tree.nodes['shaspri_NodeGroup'].node_tree
-                    maskImageName = "shaspri_" + candidatePaintingObject.name + "_" + spriteSheetName + "_mask"
-                    if(maskImageName in bpy.data.images):
-                        materialLocated = True
-                        #change painting canvas to mask image
-                        bpy.context.scene.tool_settings.image_paint.mode = 'IMAGE'
-                        bpy.context.scene.tool_settings.image_paint.canvas = bpy.data.images[maskImageName]
-                        bpy.context.scene.tool_settings.image_paint.brush.color = (1.0,1.0,1.0)
-                        #select object with material and enter image paint mode with 3d views in solid for mask preview
-                        bpy.ops.object.select_all(action='DESELECT')
-                        candidatePaintingObject.select_set(True)
-                        context.view_layer.objects.active = candidatePaintingObject
-                        bpy.ops.paint.texture_paint_toggle()
-                        for candidate3darea in bpy.context.screen.areas:
-                            if(candidate3darea.type == 'VIEW_3D'):
-                                candidate3darea.spaces[0].shading.type = 'SOLID'
+        if(candidatePaintingObject.type == 'MESH' and shaspriMaterialNodeGroup(candidatePaintingObject) != None):
+            registeredSheet = candidatePaintingObject.SHASPRISheets.get(spriteSheetName)
+            if(registeredSheet != None and registeredSheet.flattened == True):
+                self.report({'WARNING'}, 'Spritesheet \'' + spriteSheetName + '\' has been flattened. Please use \'Restore Flattened Layers\' to edit it.')
+                return {'FINISHED'}
+            if(registeredSheet != None and registeredSheet.maskImage != None):
+                materialLocated = True
+                shaspriRealizeImage(context.scene, registeredSheet.maskImage)
+                #change painting canvas to mask image
+                bpy.context.scene.tool_settings.image_paint.mode = 'IMAGE'
+                bpy.context.scene.tool_settings.image_paint.canvas = registeredSheet.maskImage
+                bpy.context.scene.tool_settings.image_paint.brush.color = (1.0,1.0,1.0)
+                #select object with material and enter image paint mode with 3d views in solid for mask preview
+                bpy.ops.object.select_all(action='DESELECT')
+                candidatePaintingObject.select_set(True)
+                context.view_layer.objects.active = candidatePaintingObject
+                bpy.ops.paint.texture_paint_toggle()
+                #there are no 3d views to switch when running in the background
+                if(bpy.context.screen != None):
+                    for candidate3darea in bpy.context.screen.areas:
+                        if(candidate3darea.type == 'VIEW_3D'):
+                            candidate3darea.spaces[0].shading.type = 'SOLID'
         if(materialLocated == False):
             self.report({'WARNING'}, 'Could not edit spritesheet mask for sheet \'' + spriteSheetName + '\'. Please use \'Add New Masked Spritesheet Layer\' to set up this spritesheet.')
         return {'FINISHED'}
     
+#shift the temporary uv layer to a uv offset over the whole loop array at once, after the uv scale of a repacked spritesheet
+#an existing temporary uv is moved by the change in offset only instead of being rebuilt from the source uv
+def shaspriOffsetTemporaryUV(paintingMesh, sourceUVName, uvOffset, uvScale=(1.0,1.0)):
+    uvCoordinates = numpy.empty(len(paintingMesh.loops)*2, dtype=numpy.float32)
+    previousOffset = paintingMesh.get('shaspri_tempuv_offset')
+    previousScale = paintingMesh.get('shaspri_tempuv_scale', (1.0,1.0))
+    if('shaspri_tempuv' in paintingMesh.uv_layers and previousOffset != None and paintingMesh.get('shaspri_tempuv_source') == sourceUVName and tuple(previousScale) == (uvScale[0], uvScale[1])):
+        temporaryUV = paintingMesh.uv_layers['shaspri_tempuv']
+        temporaryUV.data.foreach_get('uv', uvCoordinates)
+        uvCoordinates = uvCoordinates.reshape(-1,2)
+        uvShift = (uvOffset[0] - previousOffset[0], uvOffset[1] - previousOffset[1])
+    else:
+        if('shaspri_tempuv' in paintingMesh.uv_layers):
+            temporaryUV = paintingMesh.uv_layers['shaspri_tempuv']
+        else:
+            temporaryUV = paintingMesh.uv_layers.new(name='shaspri_tempuv')
+        paintingMesh.uv_layers[sourceUVName].data.foreach_get('uv', uvCoordinates)
+        uvCoordinates = uvCoordinates.reshape(-1,2)
+        if(uvScale[0] != 1.0 or uvScale[1] != 1.0):
+            uvCoordinates *= numpy.array(uvScale[:2], dtype=numpy.float32)
+        uvShift = (uvOffset[0], uvOffset[1])
+    uvCoordinates += numpy.array(uvShift, dtype=numpy.float32)
+    temporaryUV.data.foreach_set('uv', uvCoordinates.ravel())
+    paintingMesh['shaspri_tempuv_offset'] = (uvOffset[0], uvOffset[1])
+    paintingMesh['shaspri_tempuv_scale'] = (uvScale[0], uvScale[1])
+    paintingMesh['shaspri_tempuv_source'] = sourceUVName
+    paintingMesh.update()
+    return temporaryUV
+
+#get the editing node group of a painting object, updated in place to match its driven node group but without drivers
+#the group is only copied again when the layer nodes changed, such as after adding or flattening layers
+def shaspriUpdateEditNodeGroup(paintingObject):
+    dataNodeGroup = paintingObject.SHASPRINodeGroup
+    editNodeGroup = bpy.data.node_groups.get("shaspri_" + paintingObject.name + "_editnodegroup")
+    if(editNodeGroup != None and set(editNodeGroup.nodes.keys()) != set(dataNodeGroup.nodes.keys())):
+        bpy.data.node_groups.remove(editNodeGroup)
+        editNodeGroup = None
+    if(editNodeGroup == None):
+        editNodeGroup = dataNodeGroup.copy()
+        editNodeGroup.name = "shaspri_" + paintingObject.name + "_editnodegroup"
+        editNodeGroup.animation_data_clear()
+        return editNodeGroup
+    #copy the current offsets, uv maps and images, as the drivers of the driven group are not evaluated here
+    for dataNode in dataNodeGroup.nodes:
+        editNode = editNodeGroup.nodes[dataNode.name]
+        if(dataNode.type == 'MAPPING'):
+            editNode.inputs[1].default_value = dataNode.inputs[1].default_value
+            editNode.inputs[3].default_value = dataNode.inputs[3].default_value
+        elif(dataNode.type == 'UVMAP'):
+            editNode.uv_map = dataNode.uv_map
+        elif(dataNode.type == 'TEX_IMAGE'):
+            editNode.image = dataNode.image
+    return editNodeGroup
+
+#show a spritesheet of a painting object at a uv offset through its editing node group and a temporary uv moved to the offset
+#returns the temporary uv
+def shaspriShowEditNodeGroup(scene, paintingObject, registeredSheet, uvOffset):
+    dataNodeGroup = paintingObject.SHASPRINodeGroup
+    shaspriRealizeImage(scene, registeredSheet.sheetImage)
+    #make temporary offset uv, or move the existing one to the new offset
+    vectorMappingNode = dataNodeGroup.nodes[registeredSheet.mappingNodeName]
+    uvSourceName = dataNodeGroup.nodes[registeredSheet.uvSourceNodeName].uv_map
+    with shaspriProfilePhase(scene, 'UV offset'):
+        temporaryUV = shaspriOffsetTemporaryUV(paintingObject.data, uvSourceName, uvOffset, vectorMappingNode.inputs[3].default_value[:2])
+    #use the editing node group to access the shifted uv
+    editNodeGroup = shaspriUpdateEditNodeGroup(paintingObject)
+    editNodeGroup.nodes[registeredSheet.mappingNodeName].inputs[1].default_value = (0,0,0)
+    editNodeGroup.nodes[registeredSheet.mappingNodeName].inputs[3].default_value = (1,1,1)
+    editNodeGroup.nodes[registeredSheet.uvSourceNodeName].uv_map = temporaryUV.name
+    #prevent loss of original node group during save
+    dataNodeGroup.use_fake_user = 1
+    nodeGroup = shaspriMaterialNodeGroup(paintingObject)
+    if(nodeGroup.node_tree != editNodeGroup):
+        nodeGroup.node_tree = editNodeGroup
+    paintingObject.data.uv_layers.active = temporaryUV
+    return temporaryUV
+
 #function to create a temporary uv layer offset by the empty amound and edit the sprite sheet texture using the uv
 class SHASPRI_OT_OffsetEditSheet(bpy.types.Operator):
     bl_idname = "shaspri.offseteditsheet"
@@ -358,59 +1735,215 @@ class SHASPRI_OT_OffsetEditSheet(bpy.types.Operator):
     bl_description = "Switch to a temporary UV layer and node setup at the current spritesheet uv offset for editing the spritesheet colors"
     
     def execute(self, context):
-        sceneObjects = bpy.context.scene.objects
-        candidatePaintingObject = bpy.context.active_object
         #if selected object is uv offset empty, switch to the related object
-        if('shaspri_' in candidatePaintingObject.name):
-            if(candidatePaintingObject.name.split('_')[1] in sceneObjects):
-                candidatePaintingObject = sceneObjects[candidatePaintingObject.name.split('_')[1]]
+        candidatePaintingObject = shaspriPaintingObject(bpy.context.active_object)
         #determine if object has the required nodegroup and nodes
         materialLocated = False
         spriteSheetName = context.scene.SHASPRISpritesheetName
-        if(candidatePaintingObject.type == 'MESH'):
-            for candidateMaterial in candidatePaintingObject.material_slots:
-                if('shaspri_NodeGroup' in candidateMaterial.material.node_tree.nodes and materialLocated == False):
-                    nodeGroup = candidateMaterial.material.node_tree.nodes['shaspri_NodeGroup']
-                    if("shaspri_" + spriteSheetName + "_uvoffset" in nodeGroup.node_tree.nodes):
-                        materialLocated = True
-                        #get desired uv offset for current sheet
-                        vectorMappingNode = nodeGroup.node_tree.nodes["shaspri_" + spriteSheetName + "_uvoffset"]
-                        uvOffset = vectorMappingNode.inputs[1].default_value
-                        #make temporary offset uv
-                        if('shaspri_tempuv' in candidatePaintingObject.data.uv_layers):
-                            candidatePaintingObject.data.uv_layers.remove(candidatePaintingObject.data.uv_layers['shaspri_tempuv'])
-                        temporaryUV = candidatePaintingObject.data.uv_layers.new(name='shaspri_tempuv')
-                        for temporaryUVPosition in temporaryUV.data:
-                            temporaryUVPosition.uv[0] = temporaryUVPosition.uv[0] + uvOffset[0]
-                            temporaryUVPosition.uv[1] = temporaryUVPosition.uv[1] + uvOffset[1]
-                        #use temporary nodegroup to access the shifted uv
-                        duplicateDataNodeGroup = nodeGroup.node_tree.copy()
-                        duplicateDataNodeGroup.name = 'shaspri_tempnodegroup'
-                        tempOffsetNode = duplicateDataNodeGroup.nodes["shaspri_" + spriteSheetName + "_uvoffset"]
-                        tempUVInputNode = duplicateDataNodeGroup.nodes["shaspri_" + spriteSheetName + "_uvsource"]
-                        duplicateDataNodeGroup.animation_data_clear()
-                        tempOffsetNode.inputs[1].default_value = (0,0,0)
-                        tempUVInputNode.uv_map = temporaryUV.name
-                        #prevent loss of original node group during save
-                        nodeGroup.node_tree.use_fake_user = 1
-                        nodeGroup.node_tree = duplicateDataNodeGroup
-                        #select object with material, set to offset uv layer and enter image paint mode
-                        bpy.ops.object.select_all(action='DESELECT')
-                        candidatePaintingObject.select_set(True)
-                        context.view_layer.objects.active = candidatePaintingObject
-                        bpy.context.scene.tool_settings.image_paint.mode = 'IMAGE'
-                        bpy.context.scene.tool_settings.image_paint.canvas = bpy.data.images["shaspri_" + candidatePaintingObject.name + "_" + spriteSheetName + "_sheet"]
-                        candidatePaintingObject.data.uv_layers.active_index += 1
+        nodeGroup = shaspriMaterialNodeGroup(candidatePaintingObject)
+        dataNodeGroup = candidatePaintingObject.SHASPRINodeGroup
+        registeredSheet = candidatePaintingObject.SHASPRISheets.get(spriteSheetName)
+        if(registeredSheet != None and registeredSheet.flattened == True):
+            self.report({'WARNING'}, 'Spritesheet \'' + spriteSheetName + '\' has been flattened. Please use \'Restore Flattened Layers\' to edit it.')
+            return {'FINISHED'}
+        if(candidatePaintingObject.type == 'MESH' and nodeGroup != None and dataNodeGroup != None and registeredSheet != None):
+            if(registeredSheet.mappingNodeName in dataNodeGroup.nodes):
+                materialLocated = True
+                #when already editing at an offset, return to the driven node group so the offset drivers are evaluated again
+                if(nodeGroup.node_tree != dataNodeGroup):
+                    nodeGroup.node_tree = dataNodeGroup
+                    context.view_layer.update()
+                #get desired uv offset for current sheet and show it through the editing node group
+                uvOffset = dataNodeGroup.nodes[registeredSheet.mappingNodeName].inputs[1].default_value
+                shaspriShowEditNodeGroup(context.scene, candidatePaintingObject, registeredSheet, uvOffset)
+                #select object with material and enter image paint mode
+                bpy.ops.object.select_all(action='DESELECT')
+                candidatePaintingObject.select_set(True)
+                context.view_layer.objects.active = candidatePaintingObject
+                bpy.context.scene.tool_settings.image_paint.mode = 'IMAGE'
+                bpy.context.scene.tool_settings.image_paint.canvas = registeredSheet.sheetImage
         if(materialLocated == False):
             self.report({'WARNING'}, 'Could not edit sheet \'' + spriteSheetName + '\'. Please use \'Add New Masked Spritesheet Layer\' to set up this spritesheet.')
         else:
             #switch to texture paint with minimum material shading mode
             bpy.ops.paint.texture_paint_toggle()
-            for candidate3darea in bpy.context.screen.areas:
-                if(candidate3darea.type == 'VIEW_3D' and candidate3darea.spaces[0].shading.type != 'MATERIAL' and candidate3darea.spaces[0].shading.type != 'RENDERED'):
-                    candidate3darea.spaces[0].shading.type = 'MATERIAL'
+            if(bpy.context.screen != None):
+                for candidate3darea in bpy.context.screen.areas:
+                    if(candidate3darea.type == 'VIEW_3D' and candidate3darea.spaces[0].shading.type != 'MATERIAL' and candidate3darea.spaces[0].shading.type != 'RENDERED'):
+                        candidate3darea.spaces[0].shading.type = 'MATERIAL'
         return {'FINISHED'}
     
+#evaluated shape key mixes and uv offsets of previewed spritesheet cells by painting object, sheet and shape key name, least recently shown first
+shaspriPreviewCache = collections.OrderedDict()
+#bytes of the cached shape key mixes, kept up to date as cells are added and dropped
+shaspriPreviewCacheStatus = {'bytes':0}
+
+#forget the previewed cells of a painting object after its shape keys or targets change
+def shaspriClearPreviewCache(paintingObject):
+    for cacheKey in [cacheKey for cacheKey in shaspriPreviewCache if cacheKey[0] == paintingObject.name]:
+        shaspriPreviewCacheStatus['bytes'] -= shaspriPreviewCache.pop(cacheKey)['coordinates'].nbytes
+
+#values of the shape keys a cached cell was mixed from, a cached cell is only shown again while they are unchanged
+def shaspriPreviewStamp(paintingObject):
+    return tuple((keyBlock.name, round(keyBlock.value, 6), keyBlock.mute, keyBlock.relative_key.name) for keyBlock in paintingObject.data.shape_keys.key_blocks if keyBlock.name != 'shaspri_preview')
+
+#handler to forget the previewed cells of objects whose geometry was edited
+#the preview itself only changes the preview shape key, so updates while it is the active shape key are left out
+@bpy.app.handlers.persistent
+def shaspriClearEditedPreviews(scene, depsgraph=None):
+    if(depsgraph == None or len(shaspriPreviewCache) == 0):
+        return
+    cachedObjectNames = set(cacheKey[0] for cacheKey in shaspriPreviewCache)
+    for depsgraphUpdate in depsgraph.updates:
+        if(depsgraphUpdate.is_updated_geometry and isinstance(depsgraphUpdate.id, bpy.types.Object) and depsgraphUpdate.id.name in cachedObjectNames):
+            paintingObject = depsgraphUpdate.id.original
+            if(paintingObject.active_shape_key == None or paintingObject.active_shape_key.name != 'shaspri_preview'):
+                shaspriClearPreviewCache(paintingObject)
+
+#uv offset of a spritesheet at a cell location of its offset empty, following the mapping scale and snapping of its drivers
+def shaspriCellUVOffset(scene, paintingObject, registeredSheet, cellLocation):
+    uvOffset = [0.0, 0.0, 0.0]
+    for axisNumber in range(2):
+        mappingDriver = shaspriSheetMappingDriver(paintingObject, registeredSheet, axisNumber)
+        scaleMatch = re.search(r'/([0-9.]+)$', mappingDriver.driver.expression) if mappingDriver != None else None
+        mappingScale = float(scaleMatch.group(1)) if scaleMatch != None else float(scene.SHASPRISheetMappingScale)
+        axisLocation = cellLocation[axisNumber]
+        if(mappingDriver != None and mappingDriver.driver.expression.startswith('floor(')):
+            axisLocation = math.floor(abs(axisLocation))
+        uvOffset[axisNumber] = axisLocation/mappingScale
+    return tuple(uvOffset)
+
+#vertex coordinates of the shape key mix of a painting object with the offset empty of a spritesheet placed on a shape key target
+#spritesheet keys are weighted as their drivers would weight them there and other shape keys keep their current values
+def shaspriCellKeyMix(paintingObject, registeredSheet, keyTarget):
+    shapeKeys = paintingObject.data.shape_keys
+    keySolver = ShaspriBatchedKeySolver(paintingObject, allKeys=True)
+    cellWeights = dict(zip(keySolver.keyNames, keySolver.computeWeights(offsetOverrides={registeredSheet.offsetObject.name: keyTarget.targetObject.matrix_world.translation})))
+    keyCoordinates = numpy.empty(len(paintingObject.data.vertices)*3, dtype=numpy.float32)
+    shapeKeys.reference_key.data.foreach_get('co', keyCoordinates)
+    mixCoordinates = keyCoordinates.reshape(-1,3).copy()
+    relativeCoordinates = {shapeKeys.reference_key.name: mixCoordinates.copy()}
+    for keyBlock in shapeKeys.key_blocks:
+        if(keyBlock == shapeKeys.reference_key or keyBlock.name == 'shaspri_preview' or keyBlock.mute == True):
+            continue
+        #only keys with a weight at the cell are read, usually just the key of the cell
+        keyWeight = cellWeights.get(keyBlock.name, keyBlock.value)
+        if(abs(keyWeight) < 1e-6):
+            continue
+        if(keyBlock.relative_key.name not in relativeCoordinates):
+            keyBlock.relative_key.data.foreach_get('co', keyCoordinates)
+            relativeCoordinates[keyBlock.relative_key.name] = keyCoordinates.reshape(-1,3).copy()
+        keyBlock.data.foreach_get('co', keyCoordinates)
+        mixCoordinates += keyWeight*(keyCoordinates.reshape(-1,3) - relativeCoordinates[keyBlock.relative_key.name])
+    return mixCoordinates
+
+#show a spritesheet cell of a painting object without moving its offset empty or waiting for drivers
+#the shape key mix of the cell is shown through a preview shape key and its uv offset through the editing node group
+def shaspriPreviewCell(scene, paintingObject, registeredSheet, keyTarget):
+    cacheKey = (paintingObject.name, registeredSheet.name, keyTarget.name)
+    cellState = shaspriPreviewCache.pop(cacheKey, None)
+    if(cellState != None):
+        shaspriPreviewCacheStatus['bytes'] -= cellState['coordinates'].nbytes
+    previewStamp = shaspriPreviewStamp(paintingObject)
+    if(cellState == None or len(cellState['coordinates']) != len(paintingObject.data.vertices) or cellState['stamp'] != previewStamp):
+        with shaspriProfilePhase(scene, 'Cell evaluation'):
+            cellState = {'coordinates': shaspriCellKeyMix(paintingObject, registeredSheet, keyTarget), 'uvOffset': shaspriCellUVOffset(scene, paintingObject, registeredSheet, keyTarget.targetObject.location), 'stamp': previewStamp}
+    #keep the cell as most recently shown and drop the least recently shown cells over the memory limit
+    shaspriPreviewCache[cacheKey] = cellState
+    shaspriPreviewCacheStatus['bytes'] += cellState['coordinates'].nbytes
+    while(len(shaspriPreviewCache) > 1 and shaspriPreviewCacheStatus['bytes'] > scene.SHASPRIPreviewCacheSize*1048576):
+        shaspriPreviewCacheStatus['bytes'] -= shaspriPreviewCache.popitem(last=False)[1]['coordinates'].nbytes
+    with shaspriProfilePhase(scene, 'Cell preview'):
+        shapeKeys = paintingObject.data.shape_keys
+        previewKey = shapeKeys.key_blocks.get('shaspri_preview')
+        if(previewKey == None):
+            paintingObject['shaspri_preview_restore'] = (paintingObject.active_shape_key_index, paintingObject.show_only_shape_key)
+            previewKey = paintingObject.shape_key_add(name='shaspri_preview', from_mix=False)
+        previewKey.data.foreach_set('co', cellState['coordinates'].ravel())
+        paintingObject.active_shape_key_index = shapeKeys.key_blocks.find('shaspri_preview')
+        paintingObject.show_only_shape_key = True
+        paintingObject['shaspri_preview_cell'] = keyTarget.name
+        paintingObject.data.update()
+        shaspriShowEditNodeGroup(scene, paintingObject, registeredSheet, cellState['uvOffset'])
+
+#remove the preview shape key of a painting object and show its shape keys as before the preview
+def shaspriEndCellPreview(paintingObject):
+    shaspriClearPreviewCache(paintingObject)
+    if('shaspri_preview_cell' in paintingObject):
+        del paintingObject['shaspri_preview_cell']
+    shapeKeys = paintingObject.data.shape_keys
+    if(shapeKeys == None or 'shaspri_preview' not in shapeKeys.key_blocks):
+        return False
+    paintingObject.shape_key_remove(shapeKeys.key_blocks['shaspri_preview'])
+    activeKeyIndex, showOnlyShapeKey = paintingObject.get('shaspri_preview_restore', (0, False))
+    paintingObject.active_shape_key_index = activeKeyIndex
+    paintingObject.show_only_shape_key = bool(showOnlyShapeKey)
+    if('shaspri_preview_restore' in paintingObject):
+        del paintingObject['shaspri_preview_restore']
+    return True
+
+#function to step through the spritesheet cells that have shape keys
+class SHASPRI_OT_PreviewCell(bpy.types.Operator):
+    bl_idname = "shaspri.previewcell"
+    bl_label = "Preview spritesheet cell"
+    bl_description = "Show the next or previous spritesheet cell with a shape key on the active object from cached shape key mixes and uv offsets, without moving the offset empty. The shown cell can be painted. Reactivate the spritesheet drivers to leave the preview"
+    
+    step: bpy.props.IntProperty(name="Step", description="Number of cells to move, negative to move back", default=1)
+    
+    def execute(self, context):
+        #if selected object is uv offset empty, switch to the related object
+        paintingObject = shaspriPaintingObject(context.active_object)
+        spriteSheetName = context.scene.SHASPRISpritesheetName
+        registeredSheet = None
+        if(paintingObject != None and paintingObject.type == 'MESH' and paintingObject.SHASPRINodeGroup != None and shaspriMaterialNodeGroup(paintingObject) != None):
+            registeredSheet = paintingObject.SHASPRISheets.get(spriteSheetName)
+        if(registeredSheet == None or registeredSheet.offsetObject == None or (registeredSheet.mappingNodeName in paintingObject.SHASPRINodeGroup.nodes) == False):
+            self.report({'WARNING'}, 'Could not preview sheet \'' + spriteSheetName + '\'. Please use \'Add New Masked Spritesheet Layer\' to set up this spritesheet.')
+            return {'FINISHED'}
+        if(registeredSheet.flattened == True):
+            self.report({'WARNING'}, 'Spritesheet \'' + spriteSheetName + '\' has been flattened. Please use \'Restore Flattened Layers\' to preview it.')
+            return {'FINISHED'}
+        shapeKeys = paintingObject.data.shape_keys
+        cellTargets = [keyTarget for keyTarget in registeredSheet.keyTargets if keyTarget.targetObject != None and shapeKeys != None and keyTarget.name in shapeKeys.key_blocks]
+        if(len(cellTargets) == 0):
+            self.report({'WARNING'}, 'Spritesheet \'' + spriteSheetName + '\' has no shape key cells to preview. Please use \'Create Shape Key At UV Offset\' to add some.')
+            return {'FINISHED'}
+        cellNames = [keyTarget.name for keyTarget in cellTargets]
+        currentCell = paintingObject.get('shaspri_preview_cell')
+        if(currentCell in cellNames):
+            cellIndex = (cellNames.index(currentCell) + self.step) % len(cellNames)
+        else:
+            cellIndex = 0 if self.step > 0 else len(cellNames) - 1
+        shaspriPreviewCell(context.scene, paintingObject, registeredSheet, cellTargets[cellIndex])
+        context.scene.tool_settings.image_paint.mode = 'IMAGE'
+        context.scene.tool_settings.image_paint.canvas = registeredSheet.sheetImage
+        self.report({'INFO'}, 'Showing cell ' + cellNames[cellIndex] + ' (' + str(cellIndex + 1) + '/' + str(len(cellNames)) + ').')
+        return {'FINISHED'}
+
+#revert a painting object to its main nodegroup and final uv after using the temporary ones
+def shaspriReactivateSheet(paintingObject):
+    materialLocated = False
+    if(paintingObject.type == 'MESH' and paintingObject.SHASPRINodeGroup != None):
+        nodeGroup = shaspriMaterialNodeGroup(paintingObject)
+        if(nodeGroup != None and nodeGroup.node_tree != paintingObject.SHASPRINodeGroup and nodeGroup.node_tree.name in ("shaspri_" + paintingObject.name + "_editnodegroup", 'shaspri_tempnodegroup')):
+            #the editing node group is kept for the next edit and is not saved once unused
+            materialLocated = True
+            temporaryNodeGroup = nodeGroup.node_tree
+            nodeGroup.node_tree = paintingObject.SHASPRINodeGroup
+            #the temporary node group of older versions is removed like before
+            if(temporaryNodeGroup.name == 'shaspri_tempnodegroup'):
+                bpy.data.node_groups.remove(temporaryNodeGroup)
+        #remove the cell preview shape key and bring back the shape key shown before the preview
+        if(shaspriEndCellPreview(paintingObject) == True):
+            materialLocated = True
+        #remove temporary uv to revert to final uv
+        if('shaspri_tempuv' in paintingObject.data.uv_layers):
+            paintingObject.data.uv_layers.remove(paintingObject.data.uv_layers['shaspri_tempuv'])
+        for temporaryUVProperty in ('shaspri_tempuv_offset','shaspri_tempuv_scale','shaspri_tempuv_source'):
+            if(temporaryUVProperty in paintingObject.data):
+                del paintingObject.data[temporaryUVProperty]
+    return materialLocated
+
 #function to revert to main nodegroup after using temporary nodegroup
 class SHASPRI_OT_ReactivateSheet(bpy.types.Operator):
     bl_idname = "shaspri.reactivatesheet"
@@ -418,42 +1951,670 @@ class SHASPRI_OT_ReactivateSheet(bpy.types.Operator):
     bl_description = "Clear temporary offsets on uv and re-enable uv offset drivers"
     
     def execute(self, context):
-        sceneObjects = bpy.context.scene.objects
-        candidatePaintingObject = bpy.context.active_object
         #if selected object is uv offset empty, switch to the related object
-        if('shaspri_' in candidatePaintingObject.name):
-            if(candidatePaintingObject.name.split('_')[1] in sceneObjects):
-                candidatePaintingObject = sceneObjects[candidatePaintingObject.name.split('_')[1]]
+        candidatePaintingObject = shaspriPaintingObject(bpy.context.active_object)
         #determine if object has the required nodegroup and nodes
-        materialLocated = False
         spriteSheetName = context.scene.SHASPRISpritesheetName
-        if(candidatePaintingObject.type == 'MESH' and ("shaspri_" + candidatePaintingObject.name + "_nodegroup") in bpy.data.node_groups):
-            for candidateMaterial in candidatePaintingObject.material_slots:
-                if('shaspri_NodeGroup' in candidateMaterial.material.node_tree.nodes):
-                    nodeGroup = candidateMaterial.material.node_tree.nodes['shaspri_NodeGroup']
-                    if(nodeGroup.node_tree.name == 'shaspri_tempnodegroup'):
-                        materialLocated = True
-                        nodeGroup.node_tree = bpy.data.node_groups["shaspri_" + candidatePaintingObject.name + "_nodegroup"]
-                        bpy.data.node_groups.remove(bpy.data.node_groups['shaspri_tempnodegroup'])
-            #remove temporary uv to revert to final uv
-            if('shaspri_tempuv' in candidatePaintingObject.data.uv_layers):
-                candidatePaintingObject.data.uv_layers.remove(candidatePaintingObject.data.uv_layers['shaspri_tempuv'])
-        if(materialLocated == False):
+        if(shaspriReactivateSheet(candidatePaintingObject) == False):
             self.report({'WARNING'}, 'No drivers to reactivate for \'' + spriteSheetName + '\'. Drivers may already be activated or the spritesheet may need to be created.')
         return {'FINISHED'}
     
     
+#convert srgb encoded color values to linear color values
+def shaspriSRGBToLinear(colorValues):
+    colorValues = numpy.maximum(colorValues, 0.0)
+    return numpy.where(colorValues <= 0.04045, colorValues/12.92, numpy.power((colorValues + 0.055)/1.055, 2.4))
+
+#convert linear color values to srgb encoded color values
+def shaspriLinearToSRGB(colorValues):
+    colorValues = numpy.maximum(colorValues, 0.0)
+    return numpy.where(colorValues <= 0.0031308, colorValues*12.92, 1.055*numpy.power(colorValues, 1/2.4) - 0.055)
+
+#copy the pixels of an image as linear rgba values with rows ordered bottom to top
+def shaspriLinearImagePixels(image):
+    imageWidth, imageHeight = image.size
+    imagePixels = numpy.empty(imageWidth*imageHeight*4, dtype=numpy.float32)
+    image.pixels.foreach_get(imagePixels)
+    imagePixels = imagePixels.reshape(imageHeight, imageWidth, 4)
+    if(image.is_float == False and image.colorspace_settings.name == 'sRGB'):
+        imagePixels[:,:,:3] = shaspriSRGBToLinear(imagePixels[:,:,:3])
+    return imagePixels
+
+#sample image pixels at the pixel centres of an output image through a mapping scale and offset, repeating like an image texture node
+def shaspriSampleImagePixels(imagePixels, outputWidth, outputHeight, uvScale=(1.0,1.0), uvOffset=(0.0,0.0)):
+    imageHeight, imageWidth = imagePixels.shape[:2]
+    uCoordinates = (numpy.arange(outputWidth) + 0.5)/outputWidth*uvScale[0] + uvOffset[0]
+    vCoordinates = (numpy.arange(outputHeight) + 0.5)/outputHeight*uvScale[1] + uvOffset[1]
+    xIndices = numpy.minimum((numpy.mod(uCoordinates, 1.0)*imageWidth).astype(numpy.int64), imageWidth - 1)
+    yIndices = numpy.minimum((numpy.mod(vCoordinates, 1.0)*imageHeight).astype(numpy.int64), imageHeight - 1)
+    return imagePixels[yIndices[:,None], xIndices[None,:]]
+
+#composite one layer of linear sheet pixels and mask factors like a color mix of the node group, updating the flattened color and factor in place
+#the color is accumulated premultiplied so the whole chain becomes one mix over the node group input
+def shaspriCompositeLayer(flatColor, flatFactor, sheetPixels, maskFactor):
+    layerFactor = numpy.clip(sheetPixels[:,:,3]*maskFactor, 0.0, 1.0)
+    flatColor *= (1.0 - layerFactor)[:,:,None]
+    flatColor += sheetPixels[:,:,:3]*layerFactor[:,:,None]
+    flatFactor *= 1.0 - layerFactor
+    flatFactor += layerFactor
+
+#straight color of the premultiplied flattened color, for mixing it over the node group input with the flattened factor
+def shaspriStraightColor(flatColor, flatFactor):
+    return numpy.divide(flatColor, flatFactor[:,:,None], out=numpy.zeros_like(flatColor), where=flatFactor[:,:,None] > 0)
+
+#function to bake all spritesheet layers at their current offsets into one image and node
+class SHASPRI_OT_FlattenLayers(bpy.types.Operator):
+    bl_idname = "shaspri.flattenlayers"
+    bl_label = "Flatten spritesheet layers"
+    bl_description = "Composite every spritesheet layer of the selected objects at its current uv offset through its mask into one image, and replace the layer nodes with a single image texture"
+    bl_options = {'REGISTER','UNDO'}
+    
+    def execute(self, context):
+        flattenedCount = 0
+        for candidatePaintingObject in set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects):
+            paintingObject = candidatePaintingObject
+            dataNodeGroup = paintingObject.SHASPRINodeGroup
+            layerSheets = sorted([registeredSheet for registeredSheet in paintingObject.SHASPRISheets if registeredSheet.flattened == False and registeredSheet.sheetImage != None], key=lambda registeredSheet: registeredSheet.layerIndex)
+            if(paintingObject.type != 'MESH' or dataNodeGroup == None or len(layerSheets) == 0):
+                continue
+            #make sure the mapping drivers are evaluated on the main node group
+            if(shaspriReactivateSheet(paintingObject) == True):
+                context.view_layer.update()
+            #flatten at the largest layer resolution, including a previously flattened image
+            previousFlatNode = dataNodeGroup.nodes.get('shaspri_flattened')
+            flatSizes = [registeredSheet.sheetImage.size[:] for registeredSheet in layerSheets]
+            if(previousFlatNode != None and previousFlatNode.image != None):
+                flatSizes.append(previousFlatNode.image.size[:])
+            flatWidth = max(flatSize[0] for flatSize in flatSizes)
+            flatHeight = max(flatSize[1] for flatSize in flatSizes)
+            flatColor = numpy.zeros((flatHeight, flatWidth, 3), dtype=numpy.float32)
+            flatFactor = numpy.zeros((flatHeight, flatWidth), dtype=numpy.float32)
+            if(previousFlatNode != None and previousFlatNode.image != None):
+                previousPixels = shaspriSampleImagePixels(shaspriLinearImagePixels(previousFlatNode.image), flatWidth, flatHeight)
+                flatFactor[:] = previousPixels[:,:,3]
+                flatColor[:] = previousPixels[:,:,:3]*flatFactor[:,:,None]
+                del previousPixels
+            #sample every layer through its mapping node and mask, compositing it straight away so only one layer is held at a time
+            for registeredSheet in layerSheets:
+                shaspriRealizeImage(context.scene, registeredSheet.sheetImage)
+                shaspriRealizeImage(context.scene, registeredSheet.maskImage)
+                vectorMappingNode = dataNodeGroup.nodes[registeredSheet.mappingNodeName]
+                uvOffset = vectorMappingNode.inputs[1].default_value
+                uvScale = vectorMappingNode.inputs[3].default_value
+                sheetPixels = shaspriSampleImagePixels(shaspriLinearImagePixels(registeredSheet.sheetImage), flatWidth, flatHeight, uvScale, uvOffset)
+                #masks are painted in gray, so their first channel is the factor of the mask multiply node
+                if(registeredSheet.maskImage != None):
+                    maskFactor = shaspriSampleImagePixels(shaspriLinearImagePixels(registeredSheet.maskImage)[:,:,0], flatWidth, flatHeight)
+                else:
+                    maskFactor = 1.0
+                shaspriCompositeLayer(flatColor, flatFactor, sheetPixels, maskFactor)
+                del sheetPixels, maskFactor
+            straightColor = shaspriStraightColor(flatColor, flatFactor)
+            #write the flattened image to the spritesheets folder
+            flatImageName = "shaspri_" + paintingObject.name + "_flattened"
+            if(flatImageName in bpy.data.images):
+                bpy.data.images.remove(bpy.data.images[flatImageName])
+            flatImage = bpy.data.images.new(flatImageName, flatWidth, flatHeight, alpha=True)
+            flatPixels = numpy.empty((flatHeight, flatWidth, 4), dtype=numpy.float32)
+            flatPixels[:,:,:3] = shaspriLinearToSRGB(straightColor)
+            flatPixels[:,:,3] = flatFactor
+            flatImage.pixels.foreach_set(flatPixels.ravel())
+            spritesheetFolderPath = bpy.path.abspath(context.scene.SHASPRISpritesheetsFolder)
+            if(os.path.isdir(spritesheetFolderPath) == False):
+                os.mkdir(spritesheetFolderPath)
+            flatImage.filepath = spritesheetFolderPath + "/" + flatImage.name + ".png"
+            shaspriSaveImage(context.scene, flatImage)
+            #keep the layer setup for restoring, unless one is already kept from an earlier flatten
+            if(context.scene.SHASPRIFlattenKeepOriginal == True and paintingObject.SHASPRILayerNodeGroup == None):
+                layerNodeGroup = dataNodeGroup.copy()
+                layerNodeGroup.name = "shaspri_" + paintingObject.name + "_layers"
+                layerNodeGroup.use_fake_user = True
+                paintingObject.SHASPRILayerNodeGroup = layerNodeGroup
+            #replace the layer chain with the flattened image
+            uvMapName = None
+            for registeredSheet in layerSheets:
+                vectorMappingNode = dataNodeGroup.nodes[registeredSheet.mappingNodeName]
+                vectorMappingNode.inputs[1].driver_remove('default_value')
+                uvSourceNode = dataNodeGroup.nodes.get(registeredSheet.uvSourceNodeName)
+                if(uvSourceNode != None and uvMapName == None):
+                    uvMapName = uvSourceNode.uv_map
+                for layerNodeName in (registeredSheet.mappingNodeName, registeredSheet.uvSourceNodeName, "shaspri_" + registeredSheet.name + "_sheet", "shaspri_" + registeredSheet.name + "_mask", "shaspri_colormix_" + str(registeredSheet.layerIndex), "shaspri_maskmultiply_" + str(registeredSheet.layerIndex)):
+                    if(layerNodeName in dataNodeGroup.nodes):
+                        dataNodeGroup.nodes.remove(dataNodeGroup.nodes[layerNodeName])
+                registeredSheet.flattened = True
+            if(previousFlatNode != None):
+                for previousMixNode in [previousFlatLink.to_node for previousFlatLink in previousFlatNode.outputs[0].links]:
+                    dataNodeGroup.nodes.remove(previousMixNode)
+                dataNodeGroup.nodes.remove(previousFlatNode)
+            if('shaspri_flattened_uvsource' in dataNodeGroup.nodes):
+                uvMapName = dataNodeGroup.nodes['shaspri_flattened_uvsource'].uv_map
+                dataNodeGroup.nodes.remove(dataNodeGroup.nodes['shaspri_flattened_uvsource'])
+            #the flattened mix takes the number of the top layer so new layers continue the chain from it
+            topLayerIndex = max(registeredSheet.layerIndex for registeredSheet in paintingObject.SHASPRISheets)
+            uvInputNode = dataNodeGroup.nodes.new(type='ShaderNodeUVMap')
+            uvInputNode.name = 'shaspri_flattened_uvsource'
+            uvInputNode.uv_map = uvMapName if uvMapName != None else paintingObject.data.uv_layers[0].name
+            uvInputNode.location = [-500,300]
+            flatNode = dataNodeGroup.nodes.new(type='ShaderNodeTexImage')
+            flatNode.name = 'shaspri_flattened'
+            flatNode.image = flatImage
+            flatNode.location = [-300,300]
+            colorMixNode = dataNodeGroup.nodes.new(type='ShaderNodeMixRGB')
+            colorMixNode.name = "shaspri_colormix_" + str(topLayerIndex)
+            colorMixNode.location = [200,300]
+            dataNodeGroup.links.new(flatNode.inputs[0],uvInputNode.outputs[0])
+            dataNodeGroup.links.new(colorMixNode.inputs[0],flatNode.outputs[1])
+            dataNodeGroup.links.new(colorMixNode.inputs[1],dataNodeGroup.nodes['shaspri_groupinput'].outputs[0])
+            dataNodeGroup.links.new(colorMixNode.inputs[2],flatNode.outputs[0])
+            dataNodeGroup.links.new(dataNodeGroup.nodes['shaspri_groupoutput'].inputs[0],colorMixNode.outputs[0])
+            flattenedCount += 1
+        if(flattenedCount == 0):
+            self.report({'WARNING'}, 'No spritesheet layers to flatten. Please select objects set up with \'Add New Masked Spritesheet Layer\'.')
+        else:
+            self.report({'INFO'}, 'Flattened spritesheet layers for ' + str(flattenedCount) + ' objects.')
+        return {'FINISHED'}
+
+#function to bring back the layer node setup kept when flattening
+class SHASPRI_OT_RestoreLayers(bpy.types.Operator):
+    bl_idname = "shaspri.restorelayers"
+    bl_label = "Restore flattened spritesheet layers"
+    bl_description = "Switch the selected objects back to the spritesheet layer nodes kept when flattening, so the layers can be edited again"
+    bl_options = {'REGISTER','UNDO'}
+    
+    def execute(self, context):
+        for candidatePaintingObject in set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects):
+            paintingObject = candidatePaintingObject
+            layerNodeGroup = paintingObject.SHASPRILayerNodeGroup
+            nodeGroup = shaspriMaterialNodeGroup(paintingObject)
+            if(layerNodeGroup == None or nodeGroup == None):
+                continue
+            #layers added after flattening only exist in the flattened node group
+            missingSheets = [registeredSheet.name for registeredSheet in paintingObject.SHASPRISheets if (registeredSheet.mappingNodeName in layerNodeGroup.nodes) == False]
+            if(len(missingSheets) > 0):
+                self.report({'WARNING'}, 'Could not restore layers for \'' + paintingObject.name + '\', spritesheets ' + ', '.join(missingSheets) + ' were added after flattening.')
+                continue
+            shaspriReactivateSheet(paintingObject)
+            flatNodeGroupName = paintingObject.SHASPRINodeGroup.name
+            bpy.data.node_groups.remove(paintingObject.SHASPRINodeGroup)
+            layerNodeGroup.name = flatNodeGroupName
+            nodeGroup.node_tree = layerNodeGroup
+            paintingObject.SHASPRINodeGroup = layerNodeGroup
+            paintingObject.SHASPRILayerNodeGroup = None
+            for registeredSheet in paintingObject.SHASPRISheets:
+                registeredSheet.flattened = False
+        return {'FINISHED'}
+
+#shelf pack rectangles of (width, height) pixels into the smallest power of two square between the minimum and maximum size
+#positions are rounded up to multiples of the (x, y) alignment, returns the square size and positions or None when nothing fits
+def shaspriShelfPack(rectangleSizes, alignment, minimumSize, maximumSize):
+    packOrder = sorted(range(len(rectangleSizes)), key=lambda rectangleIndex: -rectangleSizes[rectangleIndex][1])
+    atlasSize = minimumSize
+    while(atlasSize <= maximumSize):
+        rectanglePositions = [None]*len(rectangleSizes)
+        shelfX = 0
+        shelfY = 0
+        shelfHeight = 0
+        for rectangleIndex in packOrder:
+            rectangleWidth, rectangleHeight = rectangleSizes[rectangleIndex]
+            if(shelfX + rectangleWidth > atlasSize):
+                shelfX = 0
+                shelfY = -(-(shelfY + shelfHeight)//alignment[1])*alignment[1]
+                shelfHeight = 0
+            if(shelfX + rectangleWidth > atlasSize or shelfY + rectangleHeight > atlasSize):
+                break
+            rectanglePositions[rectangleIndex] = (shelfX, shelfY)
+            shelfX = -(-(shelfX + rectangleWidth)//alignment[0])*alignment[0]
+            shelfHeight = max(shelfHeight, rectangleHeight)
+        else:
+            return atlasSize, rectanglePositions
+        atlasSize *= 2
+    return None
+
+#pack the pixel rectangles of a sheet shown at each shape key into a smaller power of two square
+#painted keys whose rectangles overlap are kept together and unpainted keys share one blank area
+#returns the square size and pixels, the pixel shift of every key and the number of painted pixels left out, or None when it cannot be smaller
+def shaspriPackSheetCells(sheetPixels, rectangleMin, rectangleMax, packAlignment):
+    def rectanglePixels(pixelMin, pixelMax):
+        return sheetPixels[numpy.ix_(numpy.arange(pixelMin[1], pixelMax[1]) % sheetPixels.shape[0], numpy.arange(pixelMin[0], pixelMax[0]) % sheetPixels.shape[1])]
+    keyPainted = [bool(rectanglePixels(rectangleMin[keyIndex], rectangleMax[keyIndex])[:,:,3].any()) for keyIndex in range(len(rectangleMin))]
+    keyClusters = list(range(len(rectangleMin)))
+    def clusterRoot(keyIndex):
+        while(keyClusters[keyIndex] != keyIndex):
+            keyIndex = keyClusters[keyIndex]
+        return keyIndex
+    paintedKeys = [keyIndex for keyIndex in range(len(rectangleMin)) if keyPainted[keyIndex]]
+    for firstIndex, firstKey in enumerate(paintedKeys):
+        for secondKey in paintedKeys[firstIndex + 1:]:
+            if(numpy.all(rectangleMin[firstKey] < rectangleMax[secondKey]) and numpy.all(rectangleMin[secondKey] < rectangleMax[firstKey])):
+                keyClusters[clusterRoot(secondKey)] = clusterRoot(firstKey)
+    clusterKeys = collections.OrderedDict()
+    for keyIndex in paintedKeys:
+        clusterKeys.setdefault(clusterRoot(keyIndex), []).append(keyIndex)
+    packAreas = [(rectangleMin[keyIndices].min(axis=0), rectangleMax[keyIndices].max(axis=0), keyIndices, False) for keyIndices in clusterKeys.values()]
+    blankKeys = [keyIndex for keyIndex in range(len(rectangleMin)) if keyPainted[keyIndex] == False]
+    if(len(blankKeys) > 0):
+        blankSize = (rectangleMax[blankKeys] - rectangleMin[blankKeys]).max(axis=0)
+        packAreas.append((numpy.zeros(2, dtype=int), blankSize, blankKeys, True))
+    packSizes = [tuple(int(sizeValue) for sizeValue in areaMax - areaMin) for areaMin, areaMax, keyIndices, blankArea in packAreas]
+    #find the smallest power of two square holding every area that is smaller than the sheet
+    minimumSize = 1
+    while(minimumSize*minimumSize < sum(areaWidth*areaHeight for areaWidth, areaHeight in packSizes) or minimumSize < max(max(packSize) for packSize in packSizes)):
+        minimumSize *= 2
+    maximumSize = 1
+    while((maximumSize*2)**2 < sheetPixels.shape[0]*sheetPixels.shape[1]):
+        maximumSize *= 2
+    atlasPacking = shaspriShelfPack(packSizes, packAlignment, minimumSize, maximumSize)
+    if(atlasPacking == None):
+        return None
+    atlasSize, packPositions = atlasPacking
+    #copy each area to its packed position and find how far each key moved in pixels
+    atlasPixels = numpy.zeros((atlasSize, atlasSize, 4), dtype=numpy.float32)
+    keyPixelShifts = numpy.zeros((len(rectangleMin), 2), dtype=int)
+    for (areaMin, areaMax, keyIndices, blankArea), packPosition in zip(packAreas, packPositions):
+        packPosition = numpy.array(packPosition)
+        if(blankArea == False):
+            atlasPixels[packPosition[1]:packPosition[1] + areaMax[1] - areaMin[1], packPosition[0]:packPosition[0] + areaMax[0] - areaMin[0]] = rectanglePixels(areaMin, areaMax)
+            keyPixelShifts[keyIndices] = packPosition - areaMin
+        else:
+            keyPixelShifts[keyIndices] = packPosition - rectangleMin[keyIndices]
+    #painted pixels outside every shape key cell are never shown and are left out
+    shownPixels = numpy.zeros(sheetPixels.shape[:2], dtype=bool)
+    for keyIndex in paintedKeys:
+        shownPixels[numpy.ix_(numpy.arange(rectangleMin[keyIndex][1], rectangleMax[keyIndex][1]) % sheetPixels.shape[0], numpy.arange(rectangleMin[keyIndex][0], rectangleMax[keyIndex][0]) % sheetPixels.shape[1])] = True
+    droppedCount = int(numpy.count_nonzero((sheetPixels[:,:,3] > 0.0) & (shownPixels == False)))
+    return atlasSize, atlasPixels, keyPixelShifts, droppedCount
+
+#move keyframed and current positions of an offset empty that sit on a moved shape key target along with the target
+#returns the number of keyframes that did not match any target
+def shaspriShiftOffsetPositions(offsetObject, targetPositions, targetShifts):
+    def positionShift(offsetPosition):
+        matchingTargets = numpy.flatnonzero(numpy.all(numpy.abs(targetPositions - offsetPosition) < 1e-4, axis=1))
+        return targetShifts[matchingTargets[0]] if len(matchingTargets) > 0 else None
+    unmatchedCount = 0
+    if(offsetObject.animation_data != None and offsetObject.animation_data.action != None):
+        locationCurves = [offsetObject.animation_data.action.fcurves.find('location', index=axisNumber) for axisNumber in range(2)]
+        #find every shift from the unchanged curves before moving any keyframe
+        keyframeShifts = []
+        for axisNumber, locationCurve in enumerate(locationCurves):
+            if(locationCurve == None):
+                continue
+            for locationKeyframe in locationCurve.keyframe_points:
+                keyedPosition = [locationCurves[positionAxis].evaluate(locationKeyframe.co[0]) if locationCurves[positionAxis] != None else offsetObject.location[positionAxis] for positionAxis in range(2)]
+                keyedShift = positionShift(numpy.array(keyedPosition))
+                if(keyedShift == None):
+                    unmatchedCount += 1
+                else:
+                    keyframeShifts.append((locationKeyframe, keyedShift[axisNumber]))
+        for locationKeyframe, axisShift in keyframeShifts:
+            locationKeyframe.co[1] += axisShift
+            locationKeyframe.handle_left[1] += axisShift
+            locationKeyframe.handle_right[1] += axisShift
+        for locationCurve in locationCurves:
+            if(locationCurve != None):
+                locationCurve.update()
+    currentShift = positionShift(numpy.array(offsetObject.location[:2]))
+    if(currentShift != None):
+        offsetObject.location[0] += currentShift[0]
+        offsetObject.location[1] += currentShift[1]
+    return unmatchedCount
+
+#repack the parts of a spritesheet shown by its shape keys into a smaller power of two image
+#returns the image memory saved and warnings, the sheet is left unchanged when it cannot be repacked
+def shaspriRepackSheet(scene, paintingObject, registeredSheet):
+    sheetImage = registeredSheet.sheetImage
+    if(paintingObject.SHASPRIBaked == True or registeredSheet.flattened == True):
+        return 0, ['Spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' is baked or flattened, please unbake or restore it before repacking.']
+    if(sheetImage != None and len(shaspriImageSheetUsers(sheetImage)) > 1):
+        return 0, ['Spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' shares its image with other objects and cannot be repacked for one of them.']
+    keyTargets = [keyTarget for keyTarget in registeredSheet.keyTargets if keyTarget.targetObject != None]
+    if(sheetImage == None or registeredSheet.maskImage == None or len(keyTargets) == 0):
+        return 0, ['Spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' has no shape keys to repack.']
+    mappingDrivers = [shaspriSheetMappingDriver(paintingObject, registeredSheet, axisNumber) for axisNumber in range(2)]
+    scaleMatches = [re.search(r'/([0-9.]+)$', mappingDriver.driver.expression) if mappingDriver != None else None for mappingDriver in mappingDrivers]
+    if(None in scaleMatches):
+        return 0, ['Could not find the uv offset drivers of spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\'.']
+    mappingScales = numpy.array([float(scaleMatch.group(1)) for scaleMatch in scaleMatches])
+    snappedOffsets = mappingDrivers[0].driver.expression.startswith('floor(')
+    shaspriRealizeImage(scene, sheetImage)
+    shaspriRealizeImage(scene, registeredSheet.maskImage)
+    shaspriEnsureTiledImage(sheetImage)
+    shaspriEnsureTiledImage(registeredSheet.maskImage)
+    sheetSize = numpy.array(sheetImage.size[:])
+    #pixels of the sheet per unit of offset empty movement, targets move by whole cells when these are whole pixels
+    cellSize = sheetSize/mappingScales
+    cellAligned = bool(numpy.all(numpy.abs(cellSize - numpy.round(cellSize)) < 1e-6))
+    if(snappedOffsets == True and cellAligned == False):
+        return 0, ['Spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' snaps to cells that are not whole pixels and cannot be repacked.']
+    packAlignment = numpy.round(cellSize).astype(int) if cellAligned else numpy.ones(2, dtype=int)
+    #the mask is sampled at the mesh uv, so only its painted area within the mesh uv bounds ever shows the sheet
+    uvSourceName = paintingObject.SHASPRINodeGroup.nodes[registeredSheet.uvSourceNodeName].uv_map
+    uvCoordinates = numpy.empty(len(paintingObject.data.loops)*2, dtype=numpy.float32)
+    paintingObject.data.uv_layers[uvSourceName].data.foreach_get('uv', uvCoordinates)
+    uvCoordinates = uvCoordinates.reshape(-1,2)
+    footprintMin = uvCoordinates.min(axis=0)
+    footprintMax = uvCoordinates.max(axis=0)
+    maskPixels = shaspriImageBytes(registeredSheet.maskImage)
+    maskedRows = numpy.flatnonzero(maskPixels[:,:,:3].any(axis=(1,2)))
+    maskedColumns = numpy.flatnonzero(maskPixels[:,:,:3].any(axis=(0,2)))
+    if(len(maskedRows) == 0):
+        return 0, ['The mask of spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' is empty, nothing of the sheet is shown.']
+    if(numpy.all(footprintMin >= 0.0) and numpy.all(footprintMax <= 1.0)):
+        maskSize = numpy.array([maskPixels.shape[1], maskPixels.shape[0]])
+        footprintMin = numpy.maximum(footprintMin, numpy.array([maskedColumns[0], maskedRows[0]])/maskSize)
+        footprintMax = numpy.minimum(footprintMax, numpy.array([maskedColumns[-1] + 1, maskedRows[-1] + 1])/maskSize)
+    #pixel rectangle of the sheet shown at each shape key, padded for texture filtering
+    #snapped drivers show the cell at floor(abs(location)), the same mapping is used to find and to move the cell of each target
+    mappingNode = paintingObject.SHASPRINodeGroup.nodes[registeredSheet.mappingNodeName]
+    uvScale = numpy.array(mappingNode.inputs[3].default_value[:2])
+    targetPositions = numpy.array([keyTarget.targetObject.location[:2] for keyTarget in keyTargets])
+    uvOffsets = (numpy.floor(numpy.abs(targetPositions)) if snappedOffsets else targetPositions)/mappingScales
+    rectangleMin = numpy.floor((footprintMin*uvScale + uvOffsets)*sheetSize).astype(int)
+    rectangleMax = numpy.ceil((footprintMax*uvScale + uvOffsets)*sheetSize).astype(int)
+    if(cellAligned == True):
+        #keys move by whole cells, so only the origin is aligned to a cell and the padding stays inside the cells already shown
+        rectangleMax = numpy.minimum(rectangleMax + 2, -(-rectangleMax//packAlignment)*packAlignment)
+        rectangleMin = (rectangleMin//packAlignment)*packAlignment
+    else:
+        rectangleMin -= 2
+        rectangleMax += 2
+    sheetPixels = numpy.empty(sheetSize[0]*sheetSize[1]*4, dtype=numpy.float32)
+    sheetImage.pixels.foreach_get(sheetPixels)
+    sheetPixels = sheetPixels.reshape(sheetSize[1], sheetSize[0], 4)
+    packedSheet = shaspriPackSheetCells(sheetPixels, rectangleMin, rectangleMax, packAlignment)
+    if(packedSheet == None):
+        return 0, ['The shape key cells of spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' fill too much of the sheet to repack into a smaller image.']
+    atlasSize, atlasPixels, keyPixelShifts, droppedCount = packedSheet
+    warnings = []
+    if(droppedCount > 0):
+        warnings.append('Left out ' + str(droppedCount) + ' painted pixels of spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' that no shape key shows.')
+    #move targets so each key shows its packed area, the same distance from the offset empty in empty units as before
+    targetShifts = keyPixelShifts/cellSize
+    if(snappedOffsets == True):
+        #targets on the negative side are moved away from zero to reach a higher cell, check every target lands on its packed cell
+        targetShifts = numpy.where(targetPositions < 0.0, -targetShifts, targetShifts)
+        if(numpy.any(numpy.floor(numpy.abs(targetPositions + targetShifts)) != numpy.floor(numpy.abs(targetPositions)) + numpy.round(keyPixelShifts/cellSize))):
+            return 0, ['The shape key targets of spritesheet \'' + registeredSheet.name + '\' of \'' + paintingObject.name + '\' cannot reach their packed cells with snapped offsets.']
+    for keyTarget, targetShift in zip(keyTargets, targetShifts):
+        keyTarget.targetObject.location[0] += targetShift[0]
+        keyTarget.targetObject.location[1] += targetShift[1]
+    unmatchedCount = shaspriShiftOffsetPositions(registeredSheet.offsetObject, targetPositions, targetShifts)
+    if(unmatchedCount > 0):
+        warnings.append(str(unmatchedCount) + ' keyframes of \'' + registeredSheet.offsetObject.name + '\' are not on a shape key target and were not moved.')
+    #scale the uv mapping to the smaller image and keep one empty unit moving the same number of pixels
+    atlasScales = mappingScales*atlasSize/sheetSize
+    for mappingDriver, atlasScale in zip(mappingDrivers, atlasScales):
+        mappingDriver.driver.expression = re.sub(r'/[0-9.]+$', '/' + str(round(float(atlasScale), 6)), mappingDriver.driver.expression)
+    mappingNode.inputs[3].default_value[0] = uvScale[0]*sheetSize[0]/atlasSize
+    mappingNode.inputs[3].default_value[1] = uvScale[1]*sheetSize[1]/atlasSize
+    #replace the sheet pixels with the packed image
+    memoryBefore = shaspriImageBytesInMemory(sheetImage)
+    sheetImage.scale(atlasSize, atlasSize)
+    sheetImage.pixels.foreach_set(atlasPixels.ravel())
+    sheetImage.update()
+    shaspriSaveImage(scene, sheetImage)
+    shaspriBatchedSolvers.pop(paintingObject.name, None)
+    shaspriClearPreviewCache(paintingObject)
+    return memoryBefore - shaspriImageBytesInMemory(sheetImage), warnings
+
+#function to shrink spritesheets to the cells used by their shape keys
+class SHASPRI_OT_RepackSheet(bpy.types.Operator):
+    bl_idname = "shaspri.repacksheet"
+    bl_label = "Repack spritesheet cells"
+    bl_description = "Pack the spritesheet cells shown by shape keys of the selected objects into a smaller power of two image, moving the shape key targets and uv mapping so every key still shows the same pixels"
+    bl_options = {'REGISTER','UNDO'}
+    
+    allSheets: bpy.props.BoolProperty(name="All Spritesheets", description="Repack every spritesheet of the selected objects instead of only the spritesheet with the current spritesheet name", default=False)
+    
+    def execute(self, context):
+        repackedCount = 0
+        savedBytes = 0
+        for paintingObject in set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects):
+            if(paintingObject.type != 'MESH' or paintingObject.SHASPRINodeGroup == None):
+                continue
+            shaspriReactivateSheet(paintingObject)
+            for registeredSheet in paintingObject.SHASPRISheets:
+                if(self.allSheets == False and registeredSheet.name != context.scene.SHASPRISpritesheetName):
+                    continue
+                sheetSavedBytes, repackWarnings = shaspriRepackSheet(context.scene, paintingObject, registeredSheet)
+                for repackWarning in repackWarnings:
+                    self.report({'WARNING'}, repackWarning)
+                if(sheetSavedBytes > 0):
+                    repackedCount += 1
+                    savedBytes += sheetSavedBytes
+        self.report({'INFO'}, 'Repacked ' + str(repackedCount) + ' spritesheets, saving ' + format(savedBytes/1048576, '.1f') + ' MB of image memory.')
+        return {'FINISHED'}
+
+#get the driver of an axis of the uv offset of a spritesheet, which holds the mapping scale and snapping it was created with
+def shaspriSheetMappingDriver(paintingObject, registeredSheet, axisNumber=0):
+    dataNodeGroup = paintingObject.SHASPRINodeGroup
+    if(dataNodeGroup == None or dataNodeGroup.animation_data == None):
+        return None
+    return dataNodeGroup.animation_data.drivers.find('nodes["' + registeredSheet.mappingNodeName + '"].inputs[1].default_value', index=axisNumber)
+
+#write an image as a png file for export, returning its header entry or None when there is no image to write
+def shaspriExportImage(scene, image, exportFolderPath, exportSummary):
+    if(image == None):
+        return None
+    shaspriRealizeImage(scene, image)
+    if(image.size[0] == 0):
+        return None
+    shaspriEnsureTiledImage(image)
+    imageFilename = bpy.path.clean_name(image.name) + ".png"
+    imageBytes = shaspriImageFileBytes(image, 'PNG')
+    exportSummary['bytes'] += shaspriWriteImageFile(os.path.join(exportFolderPath, imageFilename), imageBytes, 'PNG', scene.SHASPRISaveCompression)
+    exportSummary['files'].append(imageFilename)
+    return {'file': imageFilename, 'width': image.size[0], 'height': image.size[1], 'channels': imageBytes.shape[2], 'bitDepth': 8*imageBytes.itemsize}
+
+#export the spritesheet images, shape key cells and per frame weights of painting objects for use outside of blender
+#frames are stepped once for all objects and written to their binary files one at a time, each frame is a little endian float32 record of
+#the uv offset of every sheet followed by the weight of every shape key, in the order listed in the json header
+def shaspriExportSpritesheets(scene, paintingObjects, exportFolder, frameStart=None, frameEnd=None):
+    exportFolderPath = bpy.path.abspath(exportFolder)
+    os.makedirs(exportFolderPath, exist_ok=True)
+    frameStart = scene.frame_start if frameStart == None else frameStart
+    frameEnd = scene.frame_end if frameEnd == None else frameEnd
+    originalFrame = scene.frame_current
+    exportSummary = {'objects':0, 'sheets':0, 'keys':0, 'frames':frameEnd - frameStart + 1, 'bytes':0, 'files':[]}
+    exportObjects = []
+    for paintingObject in paintingObjects:
+        if(paintingObject.type != 'MESH' or paintingObject.SHASPRINodeGroup == None):
+            continue
+        #export the driven offsets, not the zeroed mapping of an object still being edited
+        if(shaspriReactivateSheet(paintingObject) == True):
+            bpy.context.view_layer.update()
+        #flattened layers have no mapping node left, their pixels are exported with the flattened image
+        exportSheets = [registeredSheet for registeredSheet in paintingObject.SHASPRISheets if registeredSheet.offsetObject != None and registeredSheet.flattened == False and registeredSheet.mappingNodeName in paintingObject.SHASPRINodeGroup.nodes]
+        flatNode = paintingObject.SHASPRINodeGroup.nodes.get('shaspri_flattened')
+        flatImage = flatNode.image if flatNode != None else None
+        if(len(exportSheets) == 0 and flatImage == None):
+            continue
+        exportName = bpy.path.clean_name("shaspri_" + paintingObject.name)
+        #write sheet and mask images next to the header
+        sheetEntries = []
+        for registeredSheet in exportSheets:
+            sheetEntry = {'name': registeredSheet.name, 'layerIndex': registeredSheet.layerIndex, 'mappingScale': float(scene.SHASPRISheetMappingScale), 'uvScale': [1.0, 1.0], 'snapped': False, 'keys': []}
+            sheetEntry['uvScale'] = list(paintingObject.SHASPRINodeGroup.nodes[registeredSheet.mappingNodeName].inputs[3].default_value[:2])
+            mappingDriver = shaspriSheetMappingDriver(paintingObject, registeredSheet)
+            if(mappingDriver != None):
+                scaleMatch = re.search(r'/([0-9.]+)$', mappingDriver.driver.expression)
+                if(scaleMatch != None):
+                    sheetEntry['mappingScale'] = float(scaleMatch.group(1))
+                sheetEntry['snapped'] = mappingDriver.driver.expression.startswith('floor(')
+            for imageKey, image in (('sheetImage', registeredSheet.sheetImage), ('maskImage', registeredSheet.maskImage)):
+                imageEntry = shaspriExportImage(scene, image, exportFolderPath, exportSummary)
+                if(imageEntry != None):
+                    sheetEntry[imageKey] = imageEntry
+            sheetEntries.append(sheetEntry)
+        #shape key cells, in the same order as the weights of the solver, with the sparse vertex offsets of each key
+        keySolver = ShaspriBatchedKeySolver(paintingObject, allKeys=True)
+        keyDeltas = shaspriSparseKeyDeltas(paintingObject, scene.SHASPRIKeySnapThreshold)
+        for keyIndex, keyName in enumerate(keySolver.keyNames):
+            for sheetEntry, registeredSheet in zip(sheetEntries, exportSheets):
+                keyTarget = registeredSheet.keyTargets.get(keyName)
+                if(keyTarget != None and keyTarget.targetObject != None):
+                    cellLocation = keyTarget.targetObject.matrix_local.translation
+                    sheetEntry['keys'].append({
+                        'name': keyName,
+                        'weightIndex': keyIndex,
+                        'cellLocation': [cellLocation[0], cellLocation[1]],
+                        'uvOffset': list(shaspriCellUVOffset(scene, paintingObject, registeredSheet, cellLocation)[:2]),
+                        'falloff': keyTarget.falloff,
+                        'movedVertices': len(keyDeltas[keyName]['indices']) if keyName in keyDeltas else 0
+                        })
+                    break
+        exportHeader = {
+            'object': paintingObject.name,
+            'mappingScale': scene.SHASPRISheetMappingScale,
+            'falloff': scene.SHASPRIShapeKeyFalloff,
+            'weightCurve': 'clamp(1 - distance*falloff, 0, 1), distance between the offset empty and the key cell in world space',
+            'frameStart': frameStart,
+            'frameEnd': frameEnd,
+            'fps': scene.render.fps/scene.render.fps_base,
+            'frameFile': exportName + ".bin",
+            'frameRecord': {'dtype': '<f4', 'uvOffsets': len(exportSheets)*2, 'weights': len(keySolver.keyNames)},
+            'deltaFile': exportName + "_deltas.npz" if len(keyDeltas) > 0 else None,
+            'sheets': sheetEntries,
+            'flattenedImage': shaspriExportImage(scene, flatImage, exportFolderPath, exportSummary)
+            }
+        if(len(keyDeltas) > 0):
+            exportSummary['bytes'] += shaspriWriteKeyDeltas(keyDeltas, len(paintingObject.data.vertices), os.path.join(exportFolderPath, exportName + "_deltas.npz"))
+            exportSummary['files'].append(exportName + "_deltas.npz")
+        with open(os.path.join(exportFolderPath, exportName + ".json"), 'w') as headerFile:
+            json.dump(exportHeader, headerFile, indent=2)
+        exportObjects.append((paintingObject, exportSheets, keySolver, exportName + ".bin"))
+        exportSummary['files'].extend([exportName + ".json", exportName + ".bin"])
+        exportSummary['objects'] += 1
+        exportSummary['sheets'] += len(exportSheets)
+        exportSummary['keys'] += len(keySolver.keyNames)
+    if(len(exportObjects) == 0):
+        return exportSummary
+    #step through the frames once for all objects and stream one record per frame to the file of each object
+    frameRecords = [numpy.empty(len(exportSheets)*2 + len(keySolver.keyNames), dtype='<f4') for paintingObject, exportSheets, keySolver, frameFilename in exportObjects]
+    with contextlib.ExitStack() as fileStack:
+        frameFiles = [fileStack.enter_context(open(os.path.join(exportFolderPath, frameFilename), 'wb')) for paintingObject, exportSheets, keySolver, frameFilename in exportObjects]
+        for frameNumber in range(frameStart, frameEnd + 1):
+            scene.frame_set(frameNumber)
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            for (paintingObject, exportSheets, keySolver, frameFilename), frameRecord, frameFile in zip(exportObjects, frameRecords, frameFiles):
+                evaluatedNodeGroup = paintingObject.SHASPRINodeGroup.evaluated_get(depsgraph)
+                for sheetIndex, registeredSheet in enumerate(exportSheets):
+                    frameRecord[sheetIndex*2:sheetIndex*2 + 2] = evaluatedNodeGroup.nodes[registeredSheet.mappingNodeName].inputs[1].default_value[:2]
+                if(len(keySolver.keyNames) > 0):
+                    frameRecord[len(exportSheets)*2:] = keySolver.computeWeights(depsgraph)
+                frameFile.write(frameRecord.tobytes())
+    exportSummary['bytes'] += sum(frameRecord.nbytes for frameRecord in frameRecords)*exportSummary['frames']
+    scene.frame_set(originalFrame)
+    return exportSummary
+
+#function to export spritesheets and shape key frames for game engines
+class SHASPRI_OT_ExportSpritesheets(bpy.types.Operator):
+    bl_idname = "shaspri.exportspritesheets"
+    bl_label = "Export spritesheets and shape key frames"
+    bl_description = "Write the spritesheet images, shape key cells and per frame uv offsets and weights of the selected objects to the export folder"
+    bl_options = {'REGISTER'}
+    
+    def execute(self, context):
+        paintingObjects = [paintingObject for paintingObject in set(shaspriPaintingObject(selectedObject) for selectedObject in bpy.context.selected_objects) if paintingObject.type == 'MESH']
+        exportSummary = shaspriExportSpritesheets(context.scene, paintingObjects, context.scene.SHASPRIExportFolder)
+        if(exportSummary['objects'] == 0):
+            self.report({'WARNING'}, 'No spritesheets found on the selected objects.')
+        else:
+            self.report({'INFO'}, 'Exported ' + str(exportSummary['sheets']) + ' spritesheets, ' + str(exportSummary['keys']) + ' shape keys and ' + str(exportSummary['frames']) + ' frames for ' + str(exportSummary['objects']) + ' objects.')
+        return {'FINISHED'}
+
 #register and unregister all Shape Sprite Painter classes
-shaspriClasses = (  SHASPRI_PT_LayerSetup,
+shaspriClasses = (  SHASPRI_PG_KeyTarget,
+                    SHASPRI_PG_Sheet,
+                    SHASPRI_PG_PaintingObject,
+                    SHASPRI_PT_LayerSetup,
                     SHASPRI_PT_SheetPainting,
                     SHASPRI_OT_AddMaskedSpriteLayer,
+                    SHASPRI_OT_ShareSheetWithSelected,
                     SHASPRI_OT_CreateShapeKeyForOffset,
+                    SHASPRI_OT_CompactShapeKeys,
+                    SHASPRI_OT_BakeDrivers,
+                    SHASPRI_OT_UnbakeDrivers,
                     SHASPRI_OT_EditSheetMask,
                     SHASPRI_OT_OffsetEditSheet,
-                    SHASPRI_OT_ReactivateSheet
+                    SHASPRI_OT_PreviewCell,
+                    SHASPRI_OT_ReactivateSheet,
+                    SHASPRI_OT_SaveDirtyImages,
+                    SHASPRI_OT_DeduplicateImages,
+                    SHASPRI_OT_DumpProfile,
+                    SHASPRI_OT_FlattenLayers,
+                    SHASPRI_OT_RestoreLayers,
+                    SHASPRI_OT_RepackSheet,
+                    SHASPRI_OT_ExportSpritesheets
                     )
 
-register, unregister = bpy.utils.register_classes_factory(shaspriClasses)
+shaspriRegisterClasses, shaspriUnregisterClasses = bpy.utils.register_classes_factory(shaspriClasses)
+
+def register():
+    shaspriRegisterClasses()
+    bpy.types.Object.SHASPRISheets = bpy.props.CollectionProperty(type=SHASPRI_PG_Sheet)
+    bpy.types.Object.SHASPRINodeGroup = bpy.props.PointerProperty(name="Spritesheet Node Group", type=bpy.types.NodeTree)
+    bpy.types.Object.SHASPRIMaterial = bpy.props.PointerProperty(name="Spritesheet Material", type=bpy.types.Material)
+    bpy.types.Object.SHASPRILayerNodeGroup = bpy.props.PointerProperty(name="Original Layer Node Group", description="Layer node setup kept when flattening", type=bpy.types.NodeTree)
+    bpy.types.Object.SHASPRIHasBatchedKeys = bpy.props.BoolProperty(name="Has Batched Shape Keys", default=False)
+    bpy.types.Object.SHASPRIBaked = bpy.props.BoolProperty(name="Spritesheet Drivers Baked", description="Spritesheet uv offsets and shape key weights are played back from baked keyframes", default=False)
+    bpy.types.Object.SHASPRIPaintingObject = bpy.props.PointerProperty(name="Painting Object", description="Painting object a spritesheet empty belongs to", type=bpy.types.Object)
+    bpy.types.Object.SHASPRISheetName = bpy.props.StringProperty(name="Spritesheet Name", description="Spritesheet a spritesheet empty belongs to")
+    bpy.types.Scene.SHASPRIPaintingObjects = bpy.props.CollectionProperty(type=SHASPRI_PG_PaintingObject)
+    bpy.app.handlers.frame_change_post.append(shaspriUpdateBatchedKeys)
+    bpy.app.handlers.depsgraph_update_post.append(shaspriUpdateBatchedKeys)
+    bpy.app.handlers.depsgraph_update_post.append(shaspriRealizePaintedImages)
+    bpy.app.handlers.depsgraph_update_post.append(shaspriCountImageEdits)
+    bpy.app.handlers.depsgraph_update_post.append(shaspriClearEditedPreviews)
+    bpy.app.handlers.depsgraph_update_post.append(shaspriUnshareDuplicates)
+    bpy.app.handlers.undo_post.append(shaspriClearBatchedSolvers)
+    bpy.app.handlers.redo_post.append(shaspriClearBatchedSolvers)
+    bpy.app.handlers.load_post.append(shaspriLoadRegistry)
+    bpy.app.handlers.load_post.append(shaspriLoadTiledImages)
+    bpy.app.handlers.load_post.append(shaspriLoadDeduplicateImages)
+    #rebuild the registry of the already open file once data access is allowed
+    bpy.app.timers.register(shaspriLoadRegistry, first_interval=0)
+    bpy.app.timers.register(shaspriLoadTiledImages, first_interval=0)
+
+def unregister():
+    global shaspriImageSaveExecutor
+    for registeredTimer in (shaspriLoadRegistry, shaspriLoadTiledImages, shaspriPollImageSaves, shaspriPollTileRebuilds, shaspriRealizeActivePaintImage):
+        if(bpy.app.timers.is_registered(registeredTimer)):
+            bpy.app.timers.unregister(registeredTimer)
+    #finish the saves already being written, queued saves are dropped
+    shaspriImageSaveQueue.clear()
+    if(shaspriImageSaveExecutor != None):
+        shaspriImageSaveExecutor.shutdown(wait=True)
+        shaspriImageSaveExecutor = None
+    shaspriImageSaveJobs.clear()
+    bpy.app.handlers.load_post.remove(shaspriLoadDeduplicateImages)
+    bpy.app.handlers.load_post.remove(shaspriLoadTiledImages)
+    bpy.app.handlers.load_post.remove(shaspriLoadRegistry)
+    bpy.app.handlers.redo_post.remove(shaspriClearBatchedSolvers)
+    bpy.app.handlers.undo_post.remove(shaspriClearBatchedSolvers)
+    shaspriBatchedSolvers.clear()
+    bpy.app.handlers.depsgraph_update_post.remove(shaspriUnshareDuplicates)
+    bpy.app.handlers.depsgraph_update_post.remove(shaspriClearEditedPreviews)
+    #remove the preview shape keys so they are not saved with the file
+    if(isinstance(bpy.data, bpy.types.BlendData)):
+        for candidatePaintingObject in bpy.data.objects:
+            if(candidatePaintingObject.type == 'MESH'):
+                shaspriEndCellPreview(candidatePaintingObject)
+    shaspriPreviewCache.clear()
+    shaspriPreviewCacheStatus['bytes'] = 0
+    bpy.app.handlers.depsgraph_update_post.remove(shaspriCountImageEdits)
+    bpy.app.handlers.depsgraph_update_post.remove(shaspriRealizePaintedImages)
+    bpy.app.handlers.depsgraph_update_post.remove(shaspriUpdateBatchedKeys)
+    bpy.app.handlers.frame_change_post.remove(shaspriUpdateBatchedKeys)
+    del bpy.types.Scene.SHASPRIPaintingObjects
+    del bpy.types.Object.SHASPRISheetName
+    del bpy.types.Object.SHASPRIPaintingObject
+    del bpy.types.Object.SHASPRIBaked
+    del bpy.types.Object.SHASPRIHasBatchedKeys
+    del bpy.types.Object.SHASPRILayerNodeGroup
+    del bpy.types.Object.SHASPRIMaterial
+    del bpy.types.Object.SHASPRINodeGroup
+    del bpy.types.Object.SHASPRISheets
+    shaspriUnregisterClasses()
 
 if __name__ == '__main__':
     register()
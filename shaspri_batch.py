@@ -0,0 +1,264 @@
+# Shape Spritesheet Painter Blender Addon
+# Copyright (C) 2021 Pierre
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#headless batch setup of spritesheet layers over many blend files
+#
+#run the driver with a regular python to spread the files of a manifest over a pool of blender processes:
+#    python shaspri_batch.py manifest.json --workers 4 --summary summary.json
+#each blender process runs this same script as a worker on one file:
+#    blender --background --factory-startup file.blend --python shaspri_batch.py -- --worker job.json result.json
+#
+#manifest layout, where each job can override any of the defaults:
+#    {
+#        "blender": "blender",
+#        "workers": 4,
+#        "retries": 1,
+#        "timeout": 900,
+#        "defaults": {"sheets": ["ShaspriSheet"], "resolution": [2048,2048], "mappingScale": 20, "falloff": 20},
+#        "jobs": [
+#            {"file": "props/crate.blend", "objects": ["Crate"], "output": "rigged/crate.blend", "export": "engine/crate"},
+#            {"file": "chars/hero.blend", "sheets": [{"name": "Mouth", "keyOffsets": [[0,0],[1,0],[2,0]]}]}
+#        ]
+#    }
+
+import argparse
+import concurrent.futures
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+
+#job settings used when neither the job nor the manifest defaults set them
+shaspriJobDefaults = {
+    "objects": None,
+    "sheets": ["ShaspriSheet"],
+    "resolution": [2048,2048],
+    "mappingScale": 20,
+    "falloff": 20,
+    "snap": False,
+    "batched": False,
+    "linkOutput": True,
+    "baseColor": False,
+    "baseColorName": "ShaspriBase",
+    "spritesheetsFolder": "//",
+    "backgroundSave": True,
+    "saveFormat": "PNG",
+    "compression": 15,
+    "lazyImages": False,
+    "output": None,
+    "export": None
+    }
+
+#combine job settings with the manifest defaults and built in defaults
+def shaspriJobSettings(manifestDefaults, manifestJob):
+    jobSettings = dict(shaspriJobDefaults)
+    jobSettings.update(manifestDefaults)
+    jobSettings.update(manifestJob)
+    #sheets can be listed by name only
+    jobSettings["sheets"] = [sheetSettings if isinstance(sheetSettings, dict) else {"name": sheetSettings} for sheetSettings in jobSettings["sheets"]]
+    return jobSettings
+
+#load and register the addon from the folder of this script inside a blender worker
+def shaspriLoadAddon():
+    addonPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__init__.py")
+    addonSpec = importlib.util.spec_from_file_location("shaspri_addon", addonPath)
+    shaspriAddon = importlib.util.module_from_spec(addonSpec)
+    sys.modules["shaspri_addon"] = shaspriAddon
+    addonSpec.loader.exec_module(shaspriAddon)
+    try:
+        shaspriAddon.register()
+    except ValueError:
+        #already registered by an enabled copy of the addon, the properties are available either way
+        pass
+    #the file was loaded before the addon was registered, so rebuild the registry of older setups here
+    shaspriAddon.shaspriLoadRegistry()
+    return shaspriAddon
+
+#set up the spritesheet layers of one job in the currently open file, run inside blender
+def shaspriRunJob(jobSettings):
+    shaspriAddon = shaspriLoadAddon()
+    scene = bpy.context.scene
+    scene.SHASPRISpritesheetsFolder = jobSettings["spritesheetsFolder"]
+    scene.SHASPRIXResolution = jobSettings["resolution"][0]
+    scene.SHASPRIYResolution = jobSettings["resolution"][1]
+    scene.SHASPRISheetMappingScale = jobSettings["mappingScale"]
+    scene.SHASPRIShapeKeyFalloff = jobSettings["falloff"]
+    scene.SHASPRISnapSpritesheet = jobSettings["snap"]
+    scene.SHASPRIBatchedKeyWeights = jobSettings["batched"]
+    scene.SHASPRILinkOutput = jobSettings["linkOutput"]
+    scene.SHASPRIMakeBaseColor = jobSettings["baseColor"]
+    scene.SHASPRIBaseColorName = jobSettings["baseColorName"]
+    scene.SHASPRIBackgroundSave = jobSettings["backgroundSave"]
+    scene.SHASPRISaveFormat = jobSettings["saveFormat"]
+    scene.SHASPRISaveCompression = jobSettings["compression"]
+    scene.SHASPRILazyImages = jobSettings["lazyImages"]
+    #find the painting objects, defaulting to every mesh in the scene
+    if(jobSettings["objects"] == None):
+        paintingObjects = [candidateObject for candidateObject in scene.objects if candidateObject.type == 'MESH']
+    else:
+        paintingObjects = [scene.objects[objectName] for objectName in jobSettings["objects"]]
+    jobResult = {"objects": len(paintingObjects), "layers": 0, "keys": 0, "warnings": []}
+    for paintingObject in paintingObjects:
+        #empties go in the first collection of the painting object, like selecting it and adding them in the ui
+        targetCollection = paintingObject.users_collection[0] if len(paintingObject.users_collection) > 0 else scene.collection
+        for sheetSettings in jobSettings["sheets"]:
+            layerWarnings = shaspriAddon.shaspriAddMaskedSpriteLayer(scene, paintingObject, sheetSettings["name"], targetCollection)
+            jobResult["warnings"].extend(layerWarnings)
+            if(len(layerWarnings) == 0):
+                jobResult["layers"] += 1
+            #create shape keys with the offset empty moved to each listed position
+            registeredSheet = paintingObject.SHASPRISheets.get(sheetSettings["name"])
+            for keyOffset in sheetSettings.get("keyOffsets", []):
+                registeredSheet.offsetObject.location[0] = keyOffset[0]
+                registeredSheet.offsetObject.location[1] = keyOffset[1]
+                if(shaspriAddon.shaspriCreateShapeKeyForOffset(scene, paintingObject, sheetSettings["name"]) != None):
+                    jobResult["keys"] += 1
+            if(len(sheetSettings.get("keyOffsets", [])) > 0):
+                registeredSheet.offsetObject.location[0] = 0
+                registeredSheet.offsetObject.location[1] = 0
+    #timers do not run in background mode, so finish any background image saves here
+    while(shaspriAddon.shaspriPollImageSaves() != None):
+        time.sleep(0.05)
+    jobResult["imagesSaved"] = shaspriAddon.shaspriImageSaveStatus["saved"]
+    if(shaspriAddon.shaspriImageSaveStatus["failed"] > 0):
+        raise RuntimeError(str(shaspriAddon.shaspriImageSaveStatus["failed"]) + " images could not be saved")
+    outputFilepath = jobSettings["output"] if jobSettings["output"] != None else bpy.data.filepath
+    os.makedirs(os.path.dirname(os.path.abspath(outputFilepath)), exist_ok=True)
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(outputFilepath))
+    #write the spritesheets and shape key frames for game engines if requested
+    if(jobSettings["export"] != None):
+        exportSummary = shaspriAddon.shaspriExportSpritesheets(scene, paintingObjects, jobSettings["export"])
+        jobResult["exportedFiles"] = len(exportSummary["files"])
+        jobResult["exportedBytes"] = exportSummary["bytes"]
+    return jobResult
+
+#worker entry point, reads one job and writes its result file
+def shaspriWorkerMain(jobFilepath, resultFilepath):
+    startTime = time.perf_counter()
+    with open(jobFilepath) as jobFile:
+        jobSettings = json.load(jobFile)
+    try:
+        jobResult = shaspriRunJob(jobSettings)
+        jobResult["status"] = "ok"
+    except Exception:
+        jobResult = {"status": "failed", "error": traceback.format_exc()}
+    jobResult["seconds"] = time.perf_counter() - startTime
+    with open(resultFilepath, "w") as resultFile:
+        json.dump(jobResult, resultFile, indent=2)
+
+#run one job in a new blender process, retrying failed attempts
+def shaspriRunWorker(blenderPath, jobSettings, retryCount, timeoutSeconds, workFolder, jobNumber):
+    jobFilepath = os.path.join(workFolder, "job_" + str(jobNumber) + ".json")
+    resultFilepath = os.path.join(workFolder, "result_" + str(jobNumber) + ".json")
+    with open(jobFilepath, "w") as jobFile:
+        json.dump(jobSettings, jobFile)
+    startTime = time.perf_counter()
+    jobResult = {}
+    for attemptNumber in range(retryCount + 1):
+        if(os.path.exists(resultFilepath)):
+            os.remove(resultFilepath)
+        workerCommand = [blenderPath, "--background", "--factory-startup", os.path.abspath(jobSettings["file"]), "--python", os.path.abspath(__file__), "--", "--worker", jobFilepath, resultFilepath]
+        try:
+            workerProcess = subprocess.run(workerCommand, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=timeoutSeconds)
+            if(os.path.exists(resultFilepath)):
+                with open(resultFilepath) as resultFile:
+                    jobResult = json.load(resultFile)
+            else:
+                jobResult = {"status": "failed", "error": "Blender exited with code " + str(workerProcess.returncode) + " without a result\n" + workerProcess.stdout[-2000:]}
+        except subprocess.TimeoutExpired:
+            jobResult = {"status": "failed", "error": "Timed out after " + str(timeoutSeconds) + " seconds"}
+        jobResult["attempts"] = attemptNumber + 1
+        if(jobResult["status"] == "ok"):
+            break
+    jobResult["file"] = jobSettings["file"]
+    jobResult["wallSeconds"] = time.perf_counter() - startTime
+    return jobResult
+
+#driver entry point, spreads the manifest jobs over a pool of blender worker processes
+def shaspriDriverMain(commandArguments):
+    argumentParser = argparse.ArgumentParser(description="Set up Shape Spritesheet Painter layers on many blend files using parallel background Blender processes.")
+    argumentParser.add_argument("manifest", help="JSON manifest listing the files, objects and sheet settings")
+    argumentParser.add_argument("--blender", help="Blender executable, overrides the manifest")
+    argumentParser.add_argument("--workers", type=int, help="Number of Blender processes to run at once, overrides the manifest")
+    argumentParser.add_argument("--retries", type=int, help="Number of retries for a failed file, overrides the manifest")
+    argumentParser.add_argument("--summary", help="Write per-file results and the summary to this JSON file")
+    parsedArguments = argumentParser.parse_args(commandArguments)
+    with open(parsedArguments.manifest) as manifestFile:
+        batchManifest = json.load(manifestFile)
+    #job files are relative to the manifest
+    manifestFolder = os.path.dirname(os.path.abspath(parsedArguments.manifest))
+    blenderPath = parsedArguments.blender or batchManifest.get("blender", "blender")
+    workerCount = parsedArguments.workers or batchManifest.get("workers", max(1, (os.cpu_count() or 2)//2))
+    retryCount = parsedArguments.retries if parsedArguments.retries != None else batchManifest.get("retries", 1)
+    timeoutSeconds = batchManifest.get("timeout", 900)
+    batchJobs = []
+    for manifestJob in batchManifest["jobs"]:
+        jobSettings = shaspriJobSettings(batchManifest.get("defaults", {}), manifestJob)
+        jobSettings["file"] = os.path.join(manifestFolder, jobSettings["file"])
+        if(jobSettings["output"] != None):
+            jobSettings["output"] = os.path.join(manifestFolder, jobSettings["output"])
+        if(jobSettings["export"] != None):
+            jobSettings["export"] = os.path.join(manifestFolder, jobSettings["export"])
+        batchJobs.append(jobSettings)
+    startTime = time.perf_counter()
+    jobResults = []
+    with tempfile.TemporaryDirectory(prefix="shaspri_batch_") as workFolder:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workerCount) as workerPool:
+            workerFutures = [workerPool.submit(shaspriRunWorker, blenderPath, jobSettings, retryCount, timeoutSeconds, workFolder, jobNumber) for jobNumber, jobSettings in enumerate(batchJobs)]
+            for workerFuture in concurrent.futures.as_completed(workerFutures):
+                jobResult = workerFuture.result()
+                jobResults.append(jobResult)
+                print("[" + str(len(jobResults)) + "/" + str(len(batchJobs)) + "] " + jobResult["status"] + " " + jobResult["file"] + " (" + format(jobResult["wallSeconds"], ".1f") + "s, " + str(jobResult["attempts"]) + " attempts)")
+                if(jobResult["status"] != "ok"):
+                    print(jobResult["error"])
+                for jobWarning in jobResult.get("warnings", []):
+                    print("    warning: " + jobWarning)
+    totalSeconds = time.perf_counter() - startTime
+    succeededResults = [jobResult for jobResult in jobResults if jobResult["status"] == "ok"]
+    batchSummary = {
+        "files": len(jobResults),
+        "succeeded": len(succeededResults),
+        "failed": len(jobResults) - len(succeededResults),
+        "retried": sum(1 for jobResult in jobResults if jobResult["attempts"] > 1),
+        "objects": sum(jobResult["objects"] for jobResult in succeededResults),
+        "layers": sum(jobResult["layers"] for jobResult in succeededResults),
+        "keys": sum(jobResult["keys"] for jobResult in succeededResults),
+        "workers": workerCount,
+        "seconds": totalSeconds,
+        "filesPerSecond": len(jobResults)/totalSeconds if totalSeconds > 0 else 0,
+        "objectsPerSecond": sum(jobResult["objects"] for jobResult in succeededResults)/totalSeconds if totalSeconds > 0 else 0
+        }
+    print("Processed " + str(batchSummary["files"]) + " files (" + str(batchSummary["failed"]) + " failed) with " + str(batchSummary["objects"]) + " objects, " + str(batchSummary["layers"]) + " layers and " + str(batchSummary["keys"]) + " shape keys in " + format(totalSeconds, ".1f") + "s using " + str(workerCount) + " workers: " + format(batchSummary["filesPerSecond"], ".2f") + " files/s, " + format(batchSummary["objectsPerSecond"], ".2f") + " objects/s")
+    if(parsedArguments.summary != None):
+        with open(parsedArguments.summary, "w") as summaryFile:
+            json.dump({"summary": batchSummary, "results": jobResults}, summaryFile, indent=2)
+    return 0 if batchSummary["failed"] == 0 else 1
+
+if __name__ == '__main__':
+    if(bpy != None and "--" in sys.argv):
+        workerArguments = sys.argv[sys.argv.index("--") + 1:]
+        shaspriWorkerMain(workerArguments[1], workerArguments[2])
+    else:
+        sys.exit(shaspriDriverMain(sys.argv[1:]))
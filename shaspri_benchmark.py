@@ -0,0 +1,481 @@
+# Shape Spritesheet Painter Blender Addon
+# Copyright (C) 2021 Pierre
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#benchmarks of the addon operators on synthetic scenes of growing size
+#
+#run inside background blender, writing the timings of every case to a json file:
+#    blender --background --factory-startup --python shaspri_benchmark.py -- --output results.json
+#compare two result files with a regular python or inside blender, exiting with 1 when a case got slower:
+#    python shaspri_benchmark.py --compare baseline.json results.json
+#only time the temporary edit uv shift of the old per loop code against the bulk shift on a 200k loop uv layer:
+#    blender --background --factory-startup --python shaspri_benchmark.py -- --uv-shift-loops 200000 --cases none
+#only run the checks of saved values, exiting with 1 when one fails:
+#    blender --background --factory-startup --python shaspri_benchmark.py -- --check --cases none
+#
+#each case starts from the base scene and grows one of the sizes below, the other sizes keep their base value
+
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import shaspri_batch
+
+
+#sizes of the base scene and the values each size is grown to
+shaspriBenchmarkBase = {"loops": 20000, "objects": 1, "layers": 1, "keys": 4, "resolution": 512, "batched": False}
+shaspriBenchmarkSweeps = {
+    "quick": {
+        "loops": [4000, 20000, 100000],
+        "objects": [1, 8, 32],
+        "layers": [1, 4],
+        "keys": [4, 32],
+        "resolution": [256, 1024]
+        },
+    "full": {
+        "loops": [4000, 20000, 100000, 200000, 400000],
+        "objects": [1, 10, 50, 100, 300],
+        "layers": [1, 2, 4, 8],
+        "keys": [4, 16, 64, 128, 256],
+        "resolution": [256, 512, 1024, 2048, 4096]
+        }
+    }
+
+#benchmark cases for a sweep, the key cases are run with both driven and batched weights
+def shaspriBenchmarkCases(sweepName):
+    benchmarkCases = []
+    for sweepSize, sweepValues in shaspriBenchmarkSweeps[sweepName].items():
+        for sweepValue in sweepValues:
+            for batchedWeights in ([False, True] if sweepSize == "keys" else [False]):
+                caseParams = dict(shaspriBenchmarkBase)
+                caseParams[sweepSize] = sweepValue
+                caseParams["batched"] = batchedWeights
+                caseName = sweepSize + "=" + str(sweepValue) + ("/batched" if batchedWeights else "")
+                benchmarkCases.append({"name": caseName, "sweep": sweepSize, "params": caseParams})
+    return benchmarkCases
+
+#remove everything made by the previous case
+def shaspriBenchmarkClearScene(shaspriAddon):
+    if(bpy.context.object != None and bpy.context.object.mode != 'OBJECT'):
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for dataCollection in (bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.node_groups, bpy.data.images, bpy.data.actions):
+        for dataBlock in list(dataCollection):
+            dataCollection.remove(dataBlock)
+    bpy.context.scene.SHASPRIPaintingObjects.clear()
+    shaspriAddon.shaspriBatchedSolvers.clear()
+
+#grid mesh with about the requested number of face loops, uv unwrapped to the whole grid
+def shaspriBenchmarkMesh(loopCount, meshName):
+    gridSize = max(1, math.ceil(math.sqrt(loopCount/4)))
+    gridVertices = [(x/gridSize, y/gridSize, 0.0) for y in range(gridSize + 1) for x in range(gridSize + 1)]
+    gridFaces = [(y*(gridSize + 1) + x, y*(gridSize + 1) + x + 1, (y + 1)*(gridSize + 1) + x + 1, (y + 1)*(gridSize + 1) + x) for y in range(gridSize) for x in range(gridSize)]
+    benchmarkMesh = bpy.data.meshes.new(meshName)
+    benchmarkMesh.from_pydata(gridVertices, [], gridFaces)
+    benchmarkUV = benchmarkMesh.uv_layers.new(name="UVMap")
+    benchmarkUV.data.foreach_set("uv", [coordinate for meshLoop in benchmarkMesh.loops for coordinate in gridVertices[meshLoop.vertex_index][:2]])
+    benchmarkMesh.update()
+    return benchmarkMesh
+
+#time a call, finishing background image saves so their cost is included
+def shaspriBenchmarkTime(shaspriAddon, benchmarkCall):
+    startTime = time.perf_counter()
+    benchmarkCall()
+    while(shaspriAddon.shaspriPollImageSaves() != None):
+        time.sleep(0.01)
+    return time.perf_counter() - startTime
+
+#build the scene of one case and time every operator and frame playback on it
+def shaspriBenchmarkCase(shaspriAddon, caseParams, spritesheetsFolder, playbackFrames):
+    shaspriBenchmarkClearScene(shaspriAddon)
+    scene = bpy.context.scene
+    scene.SHASPRISpritesheetsFolder = spritesheetsFolder
+    scene.SHASPRIXResolution = caseParams["resolution"]
+    scene.SHASPRIYResolution = caseParams["resolution"]
+    scene.SHASPRIBatchedKeyWeights = caseParams["batched"]
+    paintingObjects = []
+    for objectNumber in range(caseParams["objects"]):
+        paintingObject = bpy.data.objects.new("shaspribench_" + str(objectNumber), shaspriBenchmarkMesh(caseParams["loops"], "shaspribench_" + str(objectNumber)))
+        scene.collection.objects.link(paintingObject)
+        paintingObjects.append(paintingObject)
+    bpy.context.view_layer.update()
+    caseTimings = {}
+    #add every layer to all objects at once, like selecting them all in the ui
+    def selectPaintingObjects():
+        for candidateObject in scene.objects:
+            candidateObject.select_set(candidateObject in paintingObjects)
+        bpy.context.view_layer.objects.active = paintingObjects[0]
+    caseTimings["addmaskedspritelayer"] = 0.0
+    for layerNumber in range(caseParams["layers"]):
+        selectPaintingObjects()
+        scene.SHASPRISpritesheetName = "BenchSheet" + str(layerNumber)
+        caseTimings["addmaskedspritelayer"] += shaspriBenchmarkTime(shaspriAddon, bpy.ops.shaspri.addmaskedspritelayer)
+    #create keys on the first sheet with the offset empties stepped over a grid of cells
+    scene.SHASPRISpritesheetName = "BenchSheet0"
+    keyColumns = max(1, math.ceil(math.sqrt(caseParams["keys"])))
+    caseTimings["createshapekeyforoffset"] = 0.0
+    for keyNumber in range(caseParams["keys"]):
+        for paintingObject in paintingObjects:
+            paintingObject.SHASPRISheets["BenchSheet0"].offsetObject.location = (keyNumber % keyColumns, keyNumber//keyColumns, 0)
+        selectPaintingObjects()
+        caseTimings["createshapekeyforoffset"] += shaspriBenchmarkTime(shaspriAddon, bpy.ops.shaspri.createshapekeyforoffset)
+    #animate the offset empties over the key cells and time frame changes
+    for paintingObject in paintingObjects:
+        offsetObject = paintingObject.SHASPRISheets["BenchSheet0"].offsetObject
+        for frameNumber in range(1, playbackFrames + 1, 10):
+            cellNumber = (frameNumber//10) % caseParams["keys"]
+            offsetObject.location = (cellNumber % keyColumns, cellNumber//keyColumns, 0)
+            offsetObject.keyframe_insert("location", frame=frameNumber)
+    scene.frame_set(1)
+    playbackStart = time.perf_counter()
+    for frameNumber in range(1, playbackFrames + 1):
+        scene.frame_set(frameNumber)
+    caseTimings["playbackPerFrame"] = (time.perf_counter() - playbackStart)/playbackFrames
+    #edit operators work on the active object, move its offset between two edits to time the in place uv update
+    selectPaintingObjects()
+    paintingObjects[0].SHASPRISheets["BenchSheet0"].offsetObject.location = (0.5, 0.5, 0)
+    bpy.context.view_layer.update()
+    caseTimings["offseteditsheet"] = shaspriBenchmarkTime(shaspriAddon, bpy.ops.shaspri.offseteditsheet)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    paintingObjects[0].SHASPRISheets["BenchSheet0"].offsetObject.location = (1.5, 0.5, 0)
+    caseTimings["offseteditsheetMoved"] = shaspriBenchmarkTime(shaspriAddon, bpy.ops.shaspri.offseteditsheet)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    caseTimings["reactivatesheet"] = shaspriBenchmarkTime(shaspriAddon, bpy.ops.shaspri.reactivatesheet)
+    caseTimings["editsheetmask"] = shaspriBenchmarkTime(shaspriAddon, bpy.ops.shaspri.editsheetmask)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return caseTimings
+
+#time the per loop python shift the temporary edit uv was made with against the bulk shift of the addon on the same uv layer
+def shaspriBenchmarkUVShift(shaspriAddon, loopCount, repeatCount):
+    shaspriBenchmarkClearScene(shaspriAddon)
+    benchmarkMesh = shaspriBenchmarkMesh(loopCount, "shaspribench_uvshift")
+    uvOffset = (0.25, 0.5)
+    shiftTimings = {"loops": len(benchmarkMesh.loops), "perLoop": None, "bulk": None, "bulkMoved": None}
+    for repeatNumber in range(repeatCount):
+        #the old way, a new layer copied from the active uv and shifted one loop at a time
+        if("shaspri_tempuv" in benchmarkMesh.uv_layers):
+            benchmarkMesh.uv_layers.remove(benchmarkMesh.uv_layers["shaspri_tempuv"])
+        startTime = time.perf_counter()
+        temporaryUV = benchmarkMesh.uv_layers.new(name="shaspri_tempuv")
+        for temporaryUVPosition in temporaryUV.data:
+            temporaryUVPosition.uv[0] = temporaryUVPosition.uv[0] + uvOffset[0]
+            temporaryUVPosition.uv[1] = temporaryUVPosition.uv[1] + uvOffset[1]
+        perLoopSeconds = time.perf_counter() - startTime
+        #the addon filling a new layer in bulk, then shifting the existing layer by a moved offset
+        benchmarkMesh.uv_layers.remove(benchmarkMesh.uv_layers["shaspri_tempuv"])
+        for propertyName in ("shaspri_tempuv_offset", "shaspri_tempuv_scale", "shaspri_tempuv_source"):
+            if(propertyName in benchmarkMesh):
+                del benchmarkMesh[propertyName]
+        startTime = time.perf_counter()
+        shaspriAddon.shaspriOffsetTemporaryUV(benchmarkMesh, "UVMap", uvOffset)
+        bulkSeconds = time.perf_counter() - startTime
+        startTime = time.perf_counter()
+        shaspriAddon.shaspriOffsetTemporaryUV(benchmarkMesh, "UVMap", (uvOffset[0] + 1.0, uvOffset[1]))
+        bulkMovedSeconds = time.perf_counter() - startTime
+        for timingName, timingSeconds in (("perLoop", perLoopSeconds), ("bulk", bulkSeconds), ("bulkMoved", bulkMovedSeconds)):
+            if(shiftTimings[timingName] == None or timingSeconds < shiftTimings[timingName]):
+                shiftTimings[timingName] = timingSeconds
+    print("uv shift of " + str(shiftTimings["loops"]) + " loops: per loop " + format(shiftTimings["perLoop"]*1000, ".1f") + "ms, bulk " + format(shiftTimings["bulk"]*1000, ".1f") + "ms, bulk moved " + format(shiftTimings["bulkMoved"]*1000, ".1f") + "ms (x" + format(shiftTimings["perLoop"]/max(shiftTimings["bulk"], 1e-9), ".1f") + " faster)")
+    return shiftTimings
+
+#paint a 16 bit spritesheet image, save it and read it back, returning the largest difference of its linear pixel values
+def shaspriCheckImageRoundTrip(shaspriAddon, spritesheetsFolder):
+    import numpy
+    scene = bpy.context.scene
+    scene.SHASPRIImageBitDepth = '16'
+    scene.SHASPRILazyImages = False
+    scene.SHASPRISaveFormat = 'PNG'
+    image = shaspriAddon.shaspriNewBlankImage(scene, "shaspricheck_roundtrip", 64, 64, (0.5,0.5,0.5,1.0), spritesheetsFolder)
+    paintedPixels = numpy.random.default_rng(0).random(64*64*4, dtype=numpy.float32)
+    #opaque pixels, so the values do not depend on how blender premultiplies float images
+    paintedPixels[3::4] = 1.0
+    image.pixels.foreach_set(paintedPixels)
+    image.update()
+    shaspriAddon.shaspriSaveImage(scene, image)
+    while(shaspriAddon.shaspriPollImageSaves() != None):
+        time.sleep(0.01)
+    image.reload()
+    savedPixels = numpy.empty(64*64*4, dtype=numpy.float32)
+    image.pixels.foreach_get(savedPixels)
+    bpy.data.images.remove(image)
+    scene.SHASPRIImageBitDepth = '8'
+    return float(numpy.abs(savedPixels - paintedPixels).max())
+
+#painting object with a small grid mesh, selected and active so the operators work on it
+def shaspriCheckPaintingObject(objectName, loopCount=400):
+    scene = bpy.context.scene
+    paintingObject = bpy.data.objects.new(objectName, shaspriBenchmarkMesh(loopCount, objectName))
+    scene.collection.objects.link(paintingObject)
+    for candidateObject in scene.objects:
+        candidateObject.select_set(candidateObject == paintingObject)
+    bpy.context.view_layer.objects.active = paintingObject
+    return paintingObject
+
+#export an object with a flattened layer below a driven layer, returning how many bytes the frame file is off from one record per frame
+def shaspriCheckExportFlattened(shaspriAddon, spritesheetsFolder):
+    scene = bpy.context.scene
+    scene.SHASPRISpritesheetsFolder = spritesheetsFolder
+    scene.SHASPRIXResolution = 64
+    scene.SHASPRIYResolution = 64
+    paintingObject = shaspriCheckPaintingObject("shaspricheck_export")
+    scene.SHASPRISpritesheetName = "CheckFlat"
+    bpy.ops.shaspri.addmaskedspritelayer()
+    bpy.ops.shaspri.flattenlayers()
+    scene.SHASPRISpritesheetName = "CheckDriven"
+    bpy.ops.shaspri.addmaskedspritelayer()
+    bpy.ops.shaspri.createshapekeyforoffset()
+    exportFolder = os.path.join(spritesheetsFolder, "export")
+    shaspriAddon.shaspriExportSpritesheets(scene, [paintingObject], exportFolder, 1, 3)
+    with open(os.path.join(exportFolder, "shaspri_shaspricheck_export.json")) as headerFile:
+        exportHeader = json.load(headerFile)
+    if(exportHeader["flattenedImage"] == None or len(exportHeader["sheets"]) != 1):
+        return float("inf")
+    recordBytes = 4*(exportHeader["frameRecord"]["uvOffsets"] + exportHeader["frameRecord"]["weights"])
+    return abs(os.path.getsize(os.path.join(exportFolder, exportHeader["frameFile"])) - 3*recordBytes)
+
+#repack a 256 pixel sheet with a mapping scale of 8, so every cell is 32 pixels, showing one painted cell at each key location
+#returns the number of keys not showing their painted color after repacking, or infinity when the sheet was not repacked
+def shaspriCheckRepack(shaspriAddon, spritesheetsFolder, keyLocations, snappedOffsets):
+    import numpy
+    scene = bpy.context.scene
+    scene.SHASPRISpritesheetsFolder = spritesheetsFolder
+    scene.SHASPRILazyImages = False
+    scene.SHASPRIXResolution = 256
+    scene.SHASPRIYResolution = 256
+    scene.SHASPRISheetMappingScale = 8
+    scene.SHASPRISnapSpritesheet = snappedOffsets
+    paintingObject = shaspriCheckPaintingObject("shaspricheck_repack")
+    scene.SHASPRISpritesheetName = "CheckRepack"
+    bpy.ops.shaspri.addmaskedspritelayer()
+    registeredSheet = paintingObject.SHASPRISheets["CheckRepack"]
+    for keyLocation in keyLocations:
+        registeredSheet.offsetObject.location = (keyLocation[0], keyLocation[1], 0)
+        bpy.context.view_layer.update()
+        bpy.ops.shaspri.createshapekeyforoffset()
+    #the mask shows the first cell of the mesh uv, each key shows the cell at the floor of its location
+    maskImage = registeredSheet.maskImage
+    maskPixels = numpy.zeros((maskImage.size[1], maskImage.size[0], 4), dtype=numpy.float32)
+    maskPixels[:maskImage.size[1]//8, :maskImage.size[0]//8] = 1.0
+    maskImage.pixels.foreach_set(maskPixels.ravel())
+    sheetPixels = numpy.zeros((256, 256, 4), dtype=numpy.float32)
+    keyColors = {}
+    for keyNumber, keyTarget in enumerate(registeredSheet.keyTargets):
+        cellLocation = numpy.floor(numpy.abs(keyTarget.targetObject.location[:2]) if snappedOffsets else keyTarget.targetObject.location[:2]).astype(int)
+        keyColors[keyTarget.name] = ((keyNumber + 1)/len(keyLocations), 0.5, 0.25, 1.0)
+        sheetPixels[cellLocation[1]*32:cellLocation[1]*32 + 32, cellLocation[0]*32:cellLocation[0]*32 + 32] = keyColors[keyTarget.name]
+    registeredSheet.sheetImage.pixels.foreach_set(sheetPixels.ravel())
+    savedBytes, repackWarnings = shaspriAddon.shaspriRepackSheet(scene, paintingObject, registeredSheet)
+    scene.SHASPRISnapSpritesheet = False
+    scene.SHASPRISheetMappingScale = 20
+    if(savedBytes <= 0):
+        print("  " + "; ".join(repackWarnings))
+        return float("inf")
+    #sample the repacked sheet in the middle of the masked uv area at each key target
+    atlasSize = registeredSheet.sheetImage.size[0]
+    atlasPixels = numpy.empty(atlasSize*atlasSize*4, dtype=numpy.float32)
+    registeredSheet.sheetImage.pixels.foreach_get(atlasPixels)
+    atlasPixels = atlasPixels.reshape(atlasSize, atlasSize, 4)
+    uvScale = numpy.array(paintingObject.SHASPRINodeGroup.nodes[registeredSheet.mappingNodeName].inputs[3].default_value[:2])
+    wrongKeys = 0
+    for keyTarget in registeredSheet.keyTargets:
+        uvOffset = numpy.array(shaspriAddon.shaspriCellUVOffset(scene, paintingObject, registeredSheet, keyTarget.targetObject.location)[:2])
+        pixelPosition = numpy.floor(numpy.mod(uvScale/16 + uvOffset, 1.0)*atlasSize).astype(int)
+        if(numpy.abs(atlasPixels[pixelPosition[1], pixelPosition[0]] - keyColors[keyTarget.name]).max() > 0.01):
+            wrongKeys += 1
+    return wrongKeys
+
+#repack keys on single cells of a small sheet whose cells are whole pixels
+def shaspriCheckRepackAligned(shaspriAddon, spritesheetsFolder):
+    return shaspriCheckRepack(shaspriAddon, spritesheetsFolder, [(0.5,0.5), (3.5,0.5), (5.5,5.5), (7.5,2.5)], False)
+
+#repack keys with snapped offsets whose targets are on the negative side of the offset empty base
+def shaspriCheckRepackNegative(shaspriAddon, spritesheetsFolder):
+    return shaspriCheckRepack(shaspriAddon, spritesheetsFolder, [(-0.5,-0.5), (-3.5,0.5), (5.5,-5.5), (-7.5,-2.5)], True)
+
+#deduplicate an 8 bit image with a 16 bit image of the same 8 bit values and two 16 bit images differing below 8 bits
+#returns the number of images wrongly merged
+def shaspriCheckDeduplicateBitDepth(shaspriAddon, spritesheetsFolder):
+    import numpy
+    checkPixels = numpy.tile(numpy.array([0.2, 0.4, 0.6, 1.0], dtype=numpy.float32), 16*16)
+    checkPixels[0:3] = numpy.linspace(0.1, 0.9, 3)
+    checkImages = []
+    for imageName, floatBuffer, pixelNudge in (("shaspri_check_8", False, 0.0), ("shaspri_check_16a", True, 0.0), ("shaspri_check_16b", True, 0.0005)):
+        checkImage = bpy.data.images.new(imageName, 16, 16, alpha=True, float_buffer=floatBuffer)
+        if(floatBuffer == True):
+            checkImage['shaspri_bitdepth'] = 16
+        nudgedPixels = checkPixels.copy()
+        nudgedPixels[0] += pixelNudge
+        checkImage.pixels.foreach_set(nudgedPixels)
+        checkImages.append(checkImage)
+    removedCount, savedBytes = shaspriAddon.shaspriDeduplicateImages(checkImages, includeUniform=True)
+    return removedCount
+
+#checks of values the addon has to keep, as name, function and largest allowed result
+shaspriBenchmarkChecks = [
+    ("16 bit image save and reload", shaspriCheckImageRoundTrip, 0.001),
+    ("export with a flattened layer", shaspriCheckExportFlattened, 0),
+    ("repack a small cell aligned sheet", shaspriCheckRepackAligned, 0),
+    ("repack snapped keys at negative locations", shaspriCheckRepackNegative, 0),
+    ("deduplicate images of different bit depths", shaspriCheckDeduplicateBitDepth, 0)
+    ]
+
+#run every check, returning the number of failed checks
+def shaspriBenchmarkRunChecks(shaspriAddon, spritesheetsFolder, benchmarkResults):
+    failedCount = 0
+    benchmarkResults["checks"] = []
+    for checkName, checkFunction, checkLimit in shaspriBenchmarkChecks:
+        shaspriBenchmarkClearScene(shaspriAddon)
+        checkResult = {"name": checkName, "limit": checkLimit}
+        try:
+            checkResult["value"] = checkFunction(shaspriAddon, spritesheetsFolder)
+            checkResult["passed"] = checkResult["value"] <= checkLimit
+        except Exception as checkError:
+            checkResult["error"] = repr(checkError)
+            checkResult["passed"] = False
+        if(checkResult["passed"] == False):
+            failedCount += 1
+        benchmarkResults["checks"].append(checkResult)
+        print("check " + checkName + ": " + ("passed" if checkResult["passed"] else "FAILED") + (", " + checkResult["error"] if "error" in checkResult else ", " + format(checkResult["value"], ".6f") + " (limit " + str(checkLimit) + ")"))
+    return failedCount
+
+#benchmark entry point inside blender
+def shaspriBenchmarkMain(commandArguments):
+    argumentParser = argparse.ArgumentParser(prog="shaspri_benchmark.py", description="Time the Shape Spritesheet Painter operators on synthetic scenes in background Blender.")
+    argumentParser.add_argument("--output", default="shaspri_benchmark.json", help="JSON file to write the results to")
+    argumentParser.add_argument("--sweep", choices=sorted(shaspriBenchmarkSweeps.keys()), default="quick", help="Set of scene sizes to run")
+    argumentParser.add_argument("--cases", help="Only run cases whose name starts with one of these comma separated prefixes, like loops,keys")
+    argumentParser.add_argument("--repeat", type=int, default=1, help="Run each case this many times and keep the fastest timings")
+    argumentParser.add_argument("--frames", type=int, default=50, help="Number of frames to play back for the playback timing")
+    argumentParser.add_argument("--background-save", action="store_true", help="Save new images on worker threads")
+    argumentParser.add_argument("--compare", help="Baseline JSON file to compare the new results with")
+    argumentParser.add_argument("--tolerance", type=float, default=1.2, help="Slowdown ratio reported as a regression when comparing")
+    argumentParser.add_argument("--scaling-tolerance", type=float, default=2.0, help="Growth of the time per object between the smallest and largest object counts reported as worse than linear, exiting with 1")
+    argumentParser.add_argument("--uv-shift-loops", type=int, default=0, help="Also time the old per loop temporary uv shift against the bulk shift on a uv layer of this many loops, like 200000")
+    argumentParser.add_argument("--check", action="store_true", help="Also check that saved images keep their values, exiting with 1 when a check fails")
+    parsedArguments = argumentParser.parse_args(commandArguments)
+    shaspriAddon = shaspri_batch.shaspriLoadAddon()
+    bpy.context.scene.SHASPRIBackgroundSave = parsedArguments.background_save
+    benchmarkCases = shaspriBenchmarkCases(parsedArguments.sweep)
+    if(parsedArguments.cases != None):
+        casePrefixes = tuple(parsedArguments.cases.split(","))
+        benchmarkCases = [benchmarkCase for benchmarkCase in benchmarkCases if benchmarkCase["name"].startswith(casePrefixes)]
+    benchmarkResults = {
+        "blender": bpy.app.version_string,
+        "addon": ".".join(str(versionNumber) for versionNumber in shaspriAddon.bl_info["version"]),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sweep": parsedArguments.sweep,
+        "repeat": parsedArguments.repeat,
+        "frames": parsedArguments.frames,
+        "backgroundSave": parsedArguments.background_save,
+        "cases": []
+        }
+    with tempfile.TemporaryDirectory(prefix="shaspri_benchmark_") as spritesheetsFolder:
+        for benchmarkCase in benchmarkCases:
+            caseResult = dict(benchmarkCase)
+            try:
+                for repeatNumber in range(parsedArguments.repeat):
+                    caseTimings = shaspriBenchmarkCase(shaspriAddon, benchmarkCase["params"], spritesheetsFolder, parsedArguments.frames)
+                    previousTimings = caseResult.get("timings", caseTimings)
+                    caseResult["timings"] = {timingName: min(caseTimings[timingName], previousTimings[timingName]) for timingName in caseTimings}
+                #time per object, layer or key shows whether setup cost grows linearly with the count
+                if(benchmarkCase["sweep"] in ("objects", "layers", "keys")):
+                    sweepCount = benchmarkCase["params"][benchmarkCase["sweep"]]
+                    caseResult["perUnit"] = {timingName: timingSeconds/sweepCount for timingName, timingSeconds in caseResult["timings"].items()}
+            except Exception as caseError:
+                caseResult["error"] = repr(caseError)
+            benchmarkResults["cases"].append(caseResult)
+            if("error" in caseResult):
+                print(caseResult["name"] + ": failed, " + caseResult["error"])
+            else:
+                print(caseResult["name"] + ": " + ", ".join(timingName + " " + format(timingSeconds*1000, ".1f") + "ms" for timingName, timingSeconds in caseResult["timings"].items()))
+        if(parsedArguments.uv_shift_loops > 0):
+            benchmarkResults["uvShift"] = shaspriBenchmarkUVShift(shaspriAddon, parsedArguments.uv_shift_loops, parsedArguments.repeat)
+        failedChecks = shaspriBenchmarkRunChecks(shaspriAddon, spritesheetsFolder, benchmarkResults) if parsedArguments.check else 0
+    shaspriBenchmarkClearScene(shaspriAddon)
+    failedChecks += shaspriBenchmarkScaling(benchmarkResults, parsedArguments.scaling_tolerance)
+    with open(parsedArguments.output, "w") as resultsFile:
+        json.dump(benchmarkResults, resultsFile, indent=2)
+    print("Wrote " + str(len(benchmarkResults["cases"])) + " benchmark cases to " + parsedArguments.output)
+    if(parsedArguments.compare != None):
+        with open(parsedArguments.compare) as baselineFile:
+            return max(shaspriBenchmarkCompare(json.load(baselineFile), benchmarkResults, parsedArguments.tolerance), 1 if failedChecks > 0 else 0)
+    return 1 if failedChecks > 0 else 0
+
+#compare the time per object of the largest and smallest object counts, returning the number of timings growing clearly faster than linear
+#timings under a millisecond at the smallest count are skipped, their ratios are mostly noise
+def shaspriBenchmarkScaling(benchmarkResults, scalingTolerance):
+    objectCases = sorted([benchmarkCase for benchmarkCase in benchmarkResults["cases"] if benchmarkCase["sweep"] == "objects" and "perUnit" in benchmarkCase], key=lambda benchmarkCase: benchmarkCase["params"]["objects"])
+    benchmarkResults["scaling"] = []
+    if(len(objectCases) < 2):
+        return 0
+    smallestCase = objectCases[0]
+    largestCase = objectCases[-1]
+    superlinearCount = 0
+    for timingName, largestSeconds in largestCase["perUnit"].items():
+        smallestSeconds = smallestCase["perUnit"].get(timingName)
+        if(smallestSeconds == None or smallestCase["timings"][timingName] < 0.001):
+            continue
+        scalingRatio = largestSeconds/smallestSeconds
+        scalingNote = ""
+        if(scalingRatio > scalingTolerance):
+            scalingNote = "  SUPERLINEAR"
+            superlinearCount += 1
+        benchmarkResults["scaling"].append({"timing": timingName, "smallest": smallestCase["params"]["objects"], "largest": largestCase["params"]["objects"], "ratio": scalingRatio})
+        print("objects " + timingName + " per object: " + format(smallestSeconds*1000, ".2f") + "ms at " + str(smallestCase["params"]["objects"]) + " -> " + format(largestSeconds*1000, ".2f") + "ms at " + str(largestCase["params"]["objects"]) + " (x" + format(scalingRatio, ".2f") + ")" + scalingNote)
+    print(str(superlinearCount) + " timings per object growing more than x" + str(scalingTolerance))
+    return superlinearCount
+
+#print the timing ratios of the cases found in both results, returning 1 when a case is slower than the tolerance allows
+def shaspriBenchmarkCompare(baselineResults, benchmarkResults, slowdownTolerance):
+    baselineCases = {baselineCase["name"]: baselineCase for baselineCase in baselineResults["cases"] if "timings" in baselineCase}
+    regressionCount = 0
+    print("Comparing addon " + benchmarkResults["addon"] + " on Blender " + benchmarkResults["blender"] + " with addon " + baselineResults["addon"] + " on Blender " + baselineResults["blender"])
+    for benchmarkCase in benchmarkResults["cases"]:
+        baselineCase = baselineCases.get(benchmarkCase["name"])
+        if(baselineCase == None or "timings" not in benchmarkCase):
+            continue
+        for timingName, timingSeconds in benchmarkCase["timings"].items():
+            baselineSeconds = baselineCase["timings"].get(timingName)
+            if(baselineSeconds == None or baselineSeconds <= 0):
+                continue
+            timingRatio = timingSeconds/baselineSeconds
+            regressionNote = ""
+            if(timingRatio > slowdownTolerance):
+                regressionNote = "  REGRESSION"
+                regressionCount += 1
+            print(benchmarkCase["name"] + " " + timingName + ": " + format(baselineSeconds*1000, ".1f") + "ms -> " + format(timingSeconds*1000, ".1f") + "ms (x" + format(timingRatio, ".2f") + ")" + regressionNote)
+    print(str(regressionCount) + " timings slower than x" + str(slowdownTolerance))
+    return 0 if regressionCount == 0 else 1
+
+if __name__ == '__main__':
+    if(bpy != None):
+        commandArguments = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+        sys.exit(shaspriBenchmarkMain(commandArguments))
+    else:
+        argumentParser = argparse.ArgumentParser(prog="shaspri_benchmark.py", description="Compare two Shape Spritesheet Painter benchmark result files.")
+        argumentParser.add_argument("--compare", nargs=2, required=True, metavar=("BASELINE", "RESULTS"), help="Baseline and new JSON result files")
+        argumentParser.add_argument("--tolerance", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+        parsedArguments = argumentParser.parse_args()
+        with open(parsedArguments.compare[0]) as baselineFile, open(parsedArguments.compare[1]) as resultsFile:
+            sys.exit(shaspriBenchmarkCompare(json.load(baselineFile), json.load(resultsFile), parsedArguments.tolerance))